@@ -0,0 +1,259 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Compact encoding of CNS delta messages exchanged between the CRD service
+and the CRD consumers.
+
+An encoded message is a dict {'wire': FORMAT, 'codec': ..., 'zlib': ...,
+'data': ...}, where data is the base64 of the message packed with msgpack
+or serialized to JSON, then optionally zlib compressed. With msgpack, the
+known field names are replaced by their index in KEYS and canonical UUID
+strings by their 16 bytes. An uncompressed JSON message is left to the RPC
+layer as it is, since its base64 would only be larger.
+
+Each side announces the formats it decodes as '<FORMAT>+<codec>', msgpack
+only when it is installed, and the sender encodes with a codec the other
+side announced. A bare FORMAT, as announced by older consumers, stands for
+JSON, which every side decodes.
+"""
+import base64
+import binascii
+import datetime
+import json
+import re
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMAT = 'cns1'
+
+# Interned field names of FORMAT. Only append to this list, a new list is
+# a new FORMAT.
+KEYS = [
+    'method', 'payload', 'version', 'tiers', 'page', 'delta', 'operation',
+    'version_id', 'id', 'name', 'tenant_id', 'user_id', 'status',
+    'admin_state_up', 'logged_at', 'created_at', 'network_id', 'subnet_id',
+    'port_id', 'instance_id', 'compute_id', 'nwport_id', 'network_type',
+    'physical_network', 'segmentation_id', 'router_external',
+    'vxlan_service_port', 'ip_version', 'cidr', 'gateway_ip',
+    'dns_nameservers', 'allocation_pools', 'host_routes', 'mac_address',
+    'device_id', 'device_owner', 'ip_address', 'security_groups',
+    'hostname', 'data_ip', 'ovs_port', 'datapath_id', 'datapath_name',
+    'switch', 'domain', 'subject_name', 'display_name', 'state',
+    'state_description', 'launched_at', 'host', 'type', 'reservation_id',
+    'zone', 'bridge', 'vxlan_vni', 'vxlan_udpport', 'vlan_id', 'flow_type',
+    'local_data_ip',
+]
+KEY_INDEX = dict((key, index) for index, key in enumerate(KEYS))
+
+# msgpack extension type of UUIDs
+EXT_UUID = 1
+UUID_RE = re.compile('^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-'
+                     '[0-9a-f]{12}$')
+
+# Format of datetime values, as sent by the RPC layer
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# Method of the messages standing for a delta version which is not sent
+# to every consumer, see skip_marker.
+SKIP_METHOD = 'skip_version'
+
+
+def codecs():
+    """
+    Codecs this side can encode and decode, preferred first.
+    """
+    if msgpack is not None:
+        return ['msgpack', 'json']
+    return ['json']
+
+
+def formats():
+    """
+    Formats this side can decode, announced to the other side.
+    """
+    return ['%s+%s' % (FORMAT, codec) for codec in codecs()]
+
+
+def negotiate(peer_formats):
+    """
+    Codec to encode with for a peer which announced the given formats,
+    None when it announced none this side can encode.
+    """
+    peer_codecs = set()
+    for peer_format in peer_formats or []:
+        if peer_format == FORMAT:
+            peer_codecs.add('json')
+        elif peer_format.startswith(FORMAT + '+'):
+            peer_codecs.add(peer_format[len(FORMAT) + 1:])
+    for codec in codecs():
+        if codec in peer_codecs:
+            return codec
+    return None
+
+
+def skip_marker(topic=None, ranges=None):
+    """
+    Message sent in place of a delta to the consumers which do not get it,
+    so that they do not wait for its version: topic is the one the delta
+    is sent on, None when it is sent to no consumer. A marker with ranges,
+    [first, last] version pairs, stands for all the versions they cover
+    instead of its own, see skip_markers.
+    """
+    payload = {'topic': topic}
+    if ranges:
+        payload['ranges'] = ranges
+    return {'method': SKIP_METHOD, 'payload': payload}
+
+
+def skip_markers(topic_versions):
+    """
+    {version: marker} of the given {topic: versions}, one marker per topic
+    keyed by its first version and standing for all its versions as
+    ranges of consecutive ones.
+    """
+    markers = {}
+    for topic, versions in topic_versions.iteritems():
+        versions = sorted(int(version) for version in versions)
+        if not versions:
+            continue
+        ranges = [[versions[0], versions[0]]]
+        for version in versions[1:]:
+            if version == ranges[-1][1] + 1:
+                ranges[-1][1] = version
+            else:
+                ranges.append([version, version])
+        markers[versions[0]] = skip_marker(topic, ranges)
+    return markers
+
+
+def skipped_versions(version, marker):
+    """
+    Versions the skip marker of the given version stands for.
+    """
+    ranges = marker['payload'].get('ranges')
+    if not ranges:
+        return [version]
+    versions = []
+    for first, last in ranges:
+        versions.extend(range(int(first), int(last) + 1))
+    return versions
+
+
+def is_skip_marker(message):
+    return message.get('method') == SKIP_METHOD
+
+
+def is_encoded(message):
+    return isinstance(message, dict) and message.get('wire') == FORMAT
+
+
+def encode(message, codec, compress=False):
+    """
+    Encode a message with the given codec, one negotiate returned.
+    """
+    if codec == 'json' and not compress:
+        return {'wire': FORMAT, 'codec': codec, 'zlib': False,
+                'data': message}
+    if codec == 'msgpack' and msgpack is not None:
+        data = msgpack.packb(_pack(message), use_bin_type=True)
+    elif codec == 'json':
+        data = json.dumps(message, default=_json_default)
+    else:
+        raise ValueError("Unable to encode %s messages with %s" %
+                         (FORMAT, codec))
+    if compress:
+        data = zlib.compress(data)
+    return {'wire': FORMAT, 'codec': codec, 'zlib': compress,
+            'data': base64.b64encode(data)}
+
+
+def decode(message):
+    """
+    Return a message as it was before encode. Messages which are not
+    encoded are returned as they are.
+    """
+    if not is_encoded(message):
+        return message
+    if message['codec'] == 'json' and not message['zlib']:
+        return message['data']
+    data = base64.b64decode(message['data'])
+    if message['zlib']:
+        data = zlib.decompress(data)
+    if message['codec'] == 'json':
+        return json.loads(data)
+    if msgpack is None:
+        raise ValueError("msgpack is needed to decode %s messages" % FORMAT)
+    try:
+        packed = msgpack.unpackb(data, ext_hook=_ext_hook, raw=False)
+    except TypeError:
+        packed = msgpack.unpackb(data, ext_hook=_ext_hook, encoding='utf-8')
+    return _unpack(packed)
+
+
+def _pack(value):
+    if isinstance(value, dict):
+        return dict((_pack_key(key), _pack(item))
+                    for key, item in value.iteritems())
+    if isinstance(value, (list, tuple)):
+        return [_pack(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return value.strftime(TIME_FORMAT)
+    if isinstance(value, basestring) and len(value) == 36 and \
+            UUID_RE.match(value):
+        return msgpack.ExtType(EXT_UUID,
+                               binascii.unhexlify(value.replace('-', '')))
+    return value
+
+
+def _pack_key(key):
+    # Interned keys are negative, so that they do not collide with the
+    # version numbers used as keys.
+    index = KEY_INDEX.get(key)
+    if index is None:
+        return key
+    return -index - 1
+
+
+def _unpack(value):
+    if isinstance(value, dict):
+        return dict((_unpack_key(key), _unpack(item))
+                    for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [_unpack(item) for item in value]
+    return value
+
+
+def _unpack_key(key):
+    if isinstance(key, (int, long)) and key < 0:
+        return KEYS[-key - 1]
+    return key
+
+
+def _ext_hook(code, data):
+    if code == EXT_UUID:
+        value = binascii.hexlify(data)
+        return '%s-%s-%s-%s-%s' % (value[:8], value[8:12], value[12:16],
+                                   value[16:20], value[20:])
+    return msgpack.ExtType(code, data)
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(TIME_FORMAT)
+    raise TypeError("%r is not JSON serializable" % value)
@@ -0,0 +1,98 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import Queue
+import threading
+import time
+
+from nscs.ocas_utils.openstack.common.gettextutils import _
+from nscs.ocas_utils.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Share of a tier applied between two progress reports
+PROGRESS_STEP = 0.1
+
+
+class TierApplier(object):
+    """
+    Apply snapshot tiers one after the other, the messages of a tier by a
+    bounded pool of worker threads. apply_message is called with each
+    message and returns the number of messages which failed, which may be
+    more than one for a message grouping several. apply returns the number
+    of messages which failed.
+    """
+    def __init__(self, apply_message, concurrency):
+        self.apply_message = apply_message
+        self.concurrency = max(concurrency, 1)
+
+    def apply(self, tiers):
+        start = time.time()
+        total = 0
+        failed = 0
+        for index, tier in enumerate(tiers):
+            failed += self.apply_tier(index, tier)
+            total += len(tier)
+        LOG.info(_("Applied %s snapshot messages in %.3f seconds"),
+                 str(total), time.time() - start)
+        return failed
+
+    def apply_tier(self, index, tier):
+        if not tier:
+            return 0
+        start = time.time()
+        queue = Queue.Queue()
+        for message in tier:
+            queue.put(message)
+        progress = _Progress(index, len(tier))
+        workers = []
+        for i in range(min(self.concurrency, len(tier))):
+            worker = threading.Thread(target=self._work,
+                                      args=(queue, progress))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+        LOG.info(_("Tier %s: %s messages done, %s failed in %.3f seconds"),
+                 str(index), str(progress.done), str(progress.failed),
+                 time.time() - start)
+        return progress.failed
+
+    def _work(self, queue, progress):
+        while True:
+            try:
+                message = queue.get_nowait()
+            except Queue.Empty:
+                return
+            progress.add(self.apply_message(message))
+
+
+class _Progress(object):
+    """Done and failed messages of a tier, reported every PROGRESS_STEP."""
+    def __init__(self, index, total):
+        self.index = index
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.step = max(int(total * PROGRESS_STEP), 1)
+        self.lock = threading.Lock()
+
+    def add(self, failed):
+        with self.lock:
+            self.done += 1
+            self.failed += failed
+            if self.done % self.step == 0 and self.done < self.total:
+                LOG.info(_("Tier %s: %s of %s messages applied"),
+                         str(self.index), str(self.done), str(self.total))
@@ -0,0 +1,164 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import sqlite3
+import threading
+import time
+
+from nscs.ocas_utils.openstack.common.gettextutils import _
+from nscs.ocas_utils.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class VersionCheckpoint(object):
+    """
+    Highest delta version applied by a consumer, kept in a local SQLite
+    file so that a restarted consumer asks the CRD service for the tail
+    after it instead of a snapshot.
+
+    Once a delta fails, the checkpoint no longer moves past it until the
+    consumer restarts, so that the failed delta is part of the tail. The
+    file is written at most every interval seconds and at the latest
+    interval seconds after a delta is applied, a crash replays the deltas
+    applied since the last write. Deltas queued for an apply lane keep the
+    saved version below them until they are applied or failed.
+    """
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.conn = None
+        self.hostname = None
+        self.version = 0
+        self.failed_version = None
+        self.pending = set()
+        self.saved_version = 0
+        self.saved_at = 0
+        self.timer = None
+
+    def load(self, hostname):
+        """
+        Open the checkpoint file and return the version saved for the
+        given consumer, 0 when there is none or the file is unusable.
+        """
+        with self.lock:
+            self.hostname = hostname
+            if not self.path:
+                return 0
+            try:
+                self.conn = sqlite3.connect(self.path,
+                                            check_same_thread=False)
+                self.conn.execute("CREATE TABLE IF NOT EXISTS cns_checkpoint "
+                                  "(hostname TEXT PRIMARY KEY, "
+                                  "version INTEGER NOT NULL, "
+                                  "updated_at REAL NOT NULL)")
+                self.conn.commit()
+                row = self.conn.execute("SELECT version FROM cns_checkpoint "
+                                        "WHERE hostname = ?",
+                                        (hostname,)).fetchone()
+            except sqlite3.Error:
+                LOG.exception(_("Unable to open checkpoint file %s, running "
+                                "without checkpoint"), self.path)
+                self.conn = None
+                return 0
+            self.version = self.saved_version = row and row[0] or 0
+            self.failed_version = None
+            return self.version
+
+    def queued(self, version):
+        with self.lock:
+            self.pending.add(version)
+
+    def applied(self, version):
+        with self.lock:
+            self.pending.discard(version)
+            if self.failed_version is not None and \
+                    version >= self.failed_version:
+                return
+            if version > self.version:
+                self.version = version
+            if time.time() - self.saved_at >= self.interval:
+                self._save()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def failed(self, version):
+        with self.lock:
+            self.pending.discard(version)
+            if self.failed_version is None or version < self.failed_version:
+                LOG.warning(_("Checkpoint held below failed version %s"),
+                            str(version))
+                self.failed_version = version
+
+    def hold(self):
+        """
+        Move the checkpoint back to 0 and keep it there while a snapshot
+        is applied, so that a consumer stopped before the snapshot is
+        fully applied gets a snapshot again.
+        """
+        with self.lock:
+            self.version = 0
+            self.failed_version = 0
+            self._save()
+
+    def reset(self, version):
+        """
+        Move the checkpoint to the version of a fully applied snapshot.
+        """
+        with self.lock:
+            self.version = version
+            self.failed_version = None
+            self._save()
+
+    def flush(self):
+        with self.lock:
+            self._save()
+
+    def get_version(self):
+        """
+        Version a restarted consumer would resume from: every delta up to
+        it is applied.
+        """
+        with self.lock:
+            return self._get_version()
+
+    def _get_version(self):
+        version = self.version
+        if self.failed_version is not None:
+            version = min(version, self.failed_version - 1)
+        if self.pending:
+            version = min(version, min(self.pending) - 1)
+        return max(version, 0)
+
+    def _save(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.saved_at = time.time()
+        version = self._get_version()
+        if self.conn is None or version == self.saved_version:
+            return
+        try:
+            self.conn.execute("INSERT OR REPLACE INTO cns_checkpoint "
+                              "(hostname, version, updated_at) "
+                              "VALUES (?, ?, ?)",
+                              (self.hostname, version, self.saved_at))
+            self.conn.commit()
+            self.saved_version = version
+        except sqlite3.Error:
+            LOG.exception(_("Unable to save checkpoint version %s"),
+                          str(version))
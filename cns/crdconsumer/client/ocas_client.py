@@ -13,11 +13,153 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import httplib
+import json
 import logging
+import socket
+import threading
+import time
+import urllib
+import urlparse
+
 from nscs.crd_consumer.client import ocas_client
+from oslo.config import cfg
+
+from cns.crdconsumer import exceptions
+from cns.crdconsumer import lanes
 
 _logger = logging.getLogger(__name__)
 
+# Keep-alive connections to the OCAS kept per host and shared by all the
+# clients of the process (0 opens a new connection for each request, as
+# the base OCAS client does, unset keeps one per thread applying
+# messages, see pool_size), and seconds a request may take.
+cns_ocas_opts = [
+    cfg.IntOpt('ocas_pool_size'),
+    cfg.IntOpt('ocas_timeout', default=30),
+]
+
+cfg.CONF.register_opts(cns_ocas_opts, "CNSCONSUMER")
+
+# Methods sent again on a new connection when a reused one turns out to
+# be closed: the request may have reached the OCAS before it failed.
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')
+
+
+def pool_size():
+    """
+    Keep-alive connections kept per OCAS host: ocas_pool_size, or when it
+    is unset one for each worker of the apply lanes and of the snapshot
+    tiers, so that no worker waits for a connection.
+    """
+    size = cfg.CONF.CNSCONSUMER.ocas_pool_size
+    if size is None:
+        size = cfg.CONF.CNSCONSUMER.apply_concurrency
+        for workers, queue_size in \
+                lanes.parse(cfg.CONF.CNSCONSUMER.apply_lanes).itervalues():
+            size += workers
+    return size
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP connections to one OCAS host. At most size connections
+    are open at a time, a thread needing one more waits for a connection
+    to be released.
+    """
+    def __init__(self, scheme, netloc, size, timeout):
+        if scheme == 'https':
+            self.connection_class = httplib.HTTPSConnection
+        else:
+            self.connection_class = httplib.HTTPConnection
+        self.netloc = netloc
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
+
+    def get(self):
+        """
+        Return (connection, reused), reused telling whether the connection
+        was already used by a former request.
+        """
+        self.slots.acquire()
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return self.connection_class(self.netloc, timeout=self.timeout), False
+
+    def put(self, conn):
+        with self.lock:
+            self.idle.append(conn)
+        self.slots.release()
+
+    def discard(self, conn):
+        conn.close()
+        self.slots.release()
+
+
+class EndpointStats(object):
+    """
+    Request count, error count and latencies in milliseconds per OCAS
+    endpoint, such as 'POST /cns/ports' or 'PUT /cns/ports/*'.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, latency, failed):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            stats['count'] += 1
+            if failed:
+                stats['errors'] += 1
+            stats['total_ms'] += latency
+            stats['max_ms'] = max(stats['max_ms'], latency)
+
+    def to_dict(self):
+        with self.lock:
+            stats = {}
+            for endpoint, values in self.endpoints.iteritems():
+                stats[endpoint] = dict(values,
+                                       mean_ms=values['total_ms'] /
+                                       values['count'])
+            return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_stats = EndpointStats()
+
+
+def get_pool(scheme, netloc):
+    with _pools_lock:
+        pool = _pools.get((scheme, netloc))
+        if pool is None:
+            pool = _pools[(scheme, netloc)] = ConnectionPool(
+                scheme, netloc, pool_size(),
+                cfg.CONF.CNSCONSUMER.ocas_timeout)
+        return pool
+
+
+def get_stats():
+    """
+    Latency stats of the OCAS endpoints called by this process.
+    """
+    return _stats.to_dict()
+
+
+def _endpoint(method, path):
+    # /cns/<collection>/<id>/<collection>/<id>... with the ids masked
+    parts = path.strip('/').split('/')
+    for index in range(2, len(parts), 2):
+        parts[index] = '*'
+    return '%s /%s' % (method, '/'.join(parts))
+
+
 class Client(object):
     """
     CNS related OCAS Client Functions in CRD Consumer 
@@ -65,18 +207,132 @@ class Client(object):
         #Network Side Ports URLs
         self.nwports_path = "%s/cns/%s" % (url, nw_ports)
         self.nwport_path = "%s/cns/%s" % (url, nw_ports) + "/%s"
+
+    def get(self, url, params=None):
+        return self.request('GET', url, params=params)
+
+    def post(self, url, body=None):
+        return self.request('POST', url, body=body)
+
+    def put(self, url, body=None):
+        return self.request('PUT', url, body=body)
+
+    def delete(self, url):
+        return self.request('DELETE', url)
+
+    def request(self, method, url, body=None, params=None):
+        """
+        Send a request on a pooled keep-alive connection, or through the
+        base OCAS client when pooling is off. The token of the base client
+        is sent with it; like the base client, it authenticates first when
+        it has no endpoint yet, and once again when the OCAS answers 401.
+        """
+        if pool_size() <= 0:
+            if method == 'GET':
+                return self.ocasclient.get(url, params=params)
+            if method == 'DELETE':
+                return self.ocasclient.delete(url)
+            return getattr(self.ocasclient, method.lower())(url, body=body)
+        parsed = urlparse.urlsplit(url)
+        path = parsed.path
+        if parsed.query:
+            path += '?' + parsed.query
+        if params:
+            path += '?' + urllib.urlencode(params, doseq=True)
+        headers = {'Accept': 'application/json',
+                   'Connection': 'keep-alive'}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        httpclient = self.ocasclient.httpclient
+        if not httpclient.endpoint_url:
+            httpclient.authenticate()
+        status, data = self._timed_send(parsed, method, path, body, headers)
+        if status == 401:
+            _logger.info("OCAS token rejected, authenticating again")
+            httpclient.authenticate()
+            status, data = self._timed_send(parsed, method, path, body,
+                                            headers)
+        if status == 401:
+            raise exceptions.Unauthorized(status_code=status)
+        if status >= 400:
+            raise exceptions.UCMClientException(status_code=status,
+                                                message=data)
+        if data:
+            return json.loads(data)
+
+    def _timed_send(self, parsed, method, path, body, headers):
+        """
+        Send a request with the current token of the base client and
+        record its latency under its endpoint.
+        """
+        token = self.ocasclient.httpclient.auth_token
+        if token:
+            headers['X-Auth-Token'] = token
+        start = time.time()
+        failed = True
+        try:
+            status, data = self._send(get_pool(parsed.scheme, parsed.netloc),
+                                      method, path, body, headers)
+            failed = status >= 400
+        finally:
+            _stats.record(_endpoint(method, parsed.path),
+                          (time.time() - start) * 1000, failed)
+        return status, data
+
+    def _send(self, pool, method, path, body, headers):
+        conn, reused = pool.get()
+        try:
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+            except socket.timeout:
+                raise
+            except (httplib.BadStatusLine, socket.error):
+                if not reused or method not in IDEMPOTENT_METHODS:
+                    raise
+                # The OCAS closed the idle connection, retry on a new one
+                conn.close()
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+            data = response.read()
+        except (httplib.HTTPException, socket.error) as e:
+            pool.discard(conn)
+            raise exceptions.ConnectionFailed(reason=str(e))
+        except Exception:
+            pool.discard(conn)
+            raise
+        if response.will_close:
+            pool.discard(conn)
+        else:
+            pool.put(conn)
+        return response.status, data
+
+    def get_stats(self):
+        """
+        Latency stats of the OCAS endpoints called by this process.
+        """
+        return get_stats()
     
     def create_datapath(self, body=None):
         """
         Creates a new datapath
         """
-        return self.ocasclient.post(self.datapaths, body=body)
+        return self.post(self.datapaths, body=body)
+        
+    def create_datapath_bulk(self, bodies):
+        """
+        Creates several new datapaths in one request. Each body is the
+        one create_datapath takes
+        """
+        body = {'datapaths': [body['datapath'] for body in bodies]}
+        return self.post(self.datapaths + '/bulk', body=body)
         
     def show_datapath(self, dp, **_params):
         """
         Fetches information of a Datapath
         """
-        return self.ocasclient.get(self.datapath % (dp), params=_params)
+        return self.get(self.datapath % (dp), params=_params)
         
     def list_datapaths(self, **_params):
         """
@@ -88,25 +344,25 @@ class Client(object):
         """
         Deletes the specified Datapath
         """
-        return self.ocasclient.delete(self.datapath % (dp))
+        return self.delete(self.datapath % (dp))
         
     def update_datapath(self, dp, body=None):
         """
         Updates the specified Datapath
         """
-        return self.ocasclient.put(self.datapath % (dp), body=body)
+        return self.put(self.datapath % (dp), body=body)
         
     def create_domain(self, body=None):
         """
         Creates a new domain
         """
-        return self.ocasclient.post(self.domains, body=body)
+        return self.post(self.domains, body=body)
         
     def show_domain(self, domain, **_params):
         """
         Fetches information of a Domain
         """
-        return self.ocasclient.get(self.domain % (domain), params=_params)
+        return self.get(self.domain % (domain), params=_params)
         
     def list_domains(self, **_params):
         """
@@ -118,13 +374,13 @@ class Client(object):
         """
         Deletes the specified Domain
         """
-        return self.ocasclient.delete(self.domain % (domain))
+        return self.delete(self.domain % (domain))
         
     def create_switch(self, body=None):
         """
         Creates a new switch
         """
-        return self.ocasclient.post(self.switchs, body=body)
+        return self.post(self.switchs, body=body)
         
     def list_switchs(self, **_params):
         """
@@ -137,31 +393,55 @@ class Client(object):
         """
         Fetches information of a Switch
         """
-        return self.ocasclient.get(self.switch % (switch), params=_params)
+        return self.get(self.switch % (switch), params=_params)
         
     def delete_switch(self, switch):
         """
         Deletes the specified switch
         """
-        return self.ocasclient.delete(self.switch % (switch))
+        return self.delete(self.switch % (switch))
         
     def create_virtualnetwork(self, body=None):
         """
         Creates a new network
         """
-        return self.ocasclient.post(self.virtual_networks_path, body=body)
+        return self.post(self.virtual_networks_path, body=body)
+        
+    def create_virtualnetwork_bulk(self, bodies):
+        """
+        Creates several new networks in one request. Each body is the
+        one create_virtualnetwork takes
+        """
+        body = {'virtualnetworks': [body['virtualnetwork'] for body in bodies]}
+        return self.post(self.virtual_networks_path + '/bulk', body=body)
+        
+    def update_virtualnetwork_bulk(self, bodies):
+        """
+        Updates several Virtual Networks in one request. Each body is the
+        one update_virtualnetwork takes, with the id of the network
+        """
+        body = {'virtualnetworks': [body['virtualnetwork'] for body in bodies]}
+        return self.put(self.virtual_networks_path + '/bulk', body=body)
+        
+    def delete_virtualnetwork_bulk(self, networks):
+        """
+        Deletes several Virtual Networks in one request, returns the ids
+        of the deleted ones
+        """
+        return self.post(self.virtual_networks_path + '/bulk_delete',
+                         body=networks)
         
     def delete_virtualnetwork(self, network):
         """
         Deletes the specified Virtual Network
         """
-        return self.ocasclient.delete(self.delete_virtual_network_path % (network))
+        return self.delete(self.delete_virtual_network_path % (network))
         
     def update_virtualnetwork(self, network, body=None):
         """
         Updates the specified Virtual Network
         """
-        return self.ocasclient.put(self.delete_virtual_network_path % (network), body=body)
+        return self.put(self.delete_virtual_network_path % (network), body=body)
         
     def list_virtualnetworks(self, **_params):
         """
@@ -173,7 +453,7 @@ class Client(object):
         """
         Fetches information of a Virtual network
         """
-        return self.ocasclient.get(self.delete_virtual_network_path % (network), params=_params)
+        return self.get(self.delete_virtual_network_path % (network), params=_params)
     
     def create_subnet(self, network, body=None):
         """
@@ -198,13 +478,13 @@ class Client(object):
         if dns_str and dns_str != 'None':
             dns_servers = dns_str.split(',')
         body['subnet']['dns_servers'] = dns_servers
-        return self.ocasclient.post(self.subnets_path % (network), body=body)
+        return self.post(self.subnets_path % (network), body=body)
         
     def delete_subnet(self, network, subnet):
         """
         Deletes the specified Subnet
         """
-        return self.ocasclient.delete(self.subnet_path % (network, subnet))
+        return self.delete(self.subnet_path % (network, subnet))
         
     def update_subnet(self, network, subnet, body=None):
         """
@@ -233,107 +513,161 @@ class Client(object):
             if dns_str is not None:
                 dns_servers = dns_str.split(',')
             body['subnet']['dns_servers'] = dns_servers
-        return self.ocasclient.put(self.subnet_path % (network, subnet), body=body)
+        return self.put(self.subnet_path % (network, subnet), body=body)
         
     def list_subnets(self, network, **_params):
         """
         Fetches a list of all subnets of a network
         """
-        return self.ocasclient.get(self.subnets_path % (network), params=_params)
+        return self.get(self.subnets_path % (network), params=_params)
         
     def show_subnet(self, network, subnet, **_params):
         """
         Fetches information of a Subnet
         """
-        return self.ocasclient.get(self.subnet_path % (network, subnet), params=_params)
+        return self.get(self.subnet_path % (network, subnet), params=_params)
         
     def create_port(self, body=None):
         """
         Creates a new Port
         """
-        return self.ocasclient.post(self.ports_path, body=body)
+        return self.post(self.ports_path, body=body)
+        
+    def create_port_bulk(self, bodies):
+        """
+        Creates several new ports in one request. Each body is the
+        one create_port takes
+        """
+        body = {'ports': [body['port'] for body in bodies]}
+        return self.post(self.ports_path + '/bulk', body=body)
+        
+    def update_port_bulk(self, bodies):
+        """
+        Updates several Ports in one request. Each body is the one
+        update_port takes, with the id of the port
+        """
+        body = {'ports': [body['port'] for body in bodies]}
+        return self.put(self.ports_path + '/bulk', body=body)
+        
+    def delete_port_bulk(self, ports):
+        """
+        Deletes several Ports in one request, returns the ids of the
+        deleted ones
+        """
+        return self.post(self.ports_path + '/bulk_delete', body=ports)
         
     def delete_port(self, port):
         """
         Deletes the specified Port
         """
-        return self.ocasclient.delete(self.port_path % (port))
+        return self.delete(self.port_path % (port))
         
     def update_port(self, port, body=None):
         """
         Updates the specified Port
         """
-        return self.ocasclient.put(self.port_path % (port), body=body)
+        return self.put(self.port_path % (port), body=body)
         
     def list_ports(self, **_params):
         """
         Fetches a list of all ports
         """
-        return self.ocasclient.get(self.ports_path, params=_params)
+        return self.get(self.ports_path, params=_params)
         
     def show_port(self, port, **_params):
         """
         Fetches information of a Port
         """
-        return self.ocasclient.get(self.port_path % (port), params=_params)
+        return self.get(self.port_path % (port), params=_params)
         
     def create_virtualmachine(self, body=None):
         """
         Creates a new instance
         """
-        return self.ocasclient.post(self.instances_path, body=body)
+        return self.post(self.instances_path, body=body)
+        
+    def create_virtualmachine_bulk(self, bodies):
+        """
+        Creates several new instances in one request. Each body is the
+        one create_virtualmachine takes
+        """
+        body = {'virtualmachines': [body['virtualmachine'] for body in bodies]}
+        return self.post(self.instances_path + '/bulk', body=body)
+        
+    def update_virtualmachine_bulk(self, bodies):
+        """
+        Updates several instances in one request. Each body is the one
+        update_virtualmachine takes, with the id of the instance
+        """
+        body = {'virtualmachines': [body['virtualmachine'] for body in bodies]}
+        return self.put(self.instances_path + '/bulk', body=body)
+        
+    def delete_virtualmachine_bulk(self, instances):
+        """
+        Deletes several instances in one request, returns the ids of the
+        deleted ones
+        """
+        return self.post(self.instances_path + '/bulk_delete', body=instances)
         
     def delete_virtualmachine(self, instance):
         """
         Deletes the specified instance
         """
-        return self.ocasclient.delete(self.instance_path % (instance))
+        return self.delete(self.instance_path % (instance))
         
     def update_virtualmachine(self, instance, body=None):
         """
         Updates the specified instance
         """
-        return self.ocasclient.put(self.instance_path % (instance), body=body)
+        return self.put(self.instance_path % (instance), body=body)
         
     def list_virtualmachines(self, **_params):
         """
         Fetches a list of all instances
         """
-        return self.ocasclient.get(self.instances_path, params=_params)
+        return self.get(self.instances_path, params=_params)
         
     def show_virtualmachine(self, instance, **_params):
         """
         Fetches information of a Instance
         """
-        return self.ocasclient.get(self.instance_path % (instance), params=_params)
+        return self.get(self.instance_path % (instance), params=_params)
         
     def create_nwport(self, body=None):
         """
         Creates a new network
         """
-        return self.ocasclient.post(self.nwports_path, body=body)
+        return self.post(self.nwports_path, body=body)
+        
+    def create_nwport_bulk(self, bodies):
+        """
+        Creates several new network side ports in one request. Each body is the
+        one create_nwport takes
+        """
+        body = {'nwports': [body['nwport'] for body in bodies]}
+        return self.post(self.nwports_path + '/bulk', body=body)
         
     def delete_nwport(self, network):
         """
         Deletes the specified Virtual Network
         """
-        return self.ocasclient.delete(self.nwport_path % (network))
+        return self.delete(self.nwport_path % (network))
         
     def update_nwport(self, network, body=None):
         """
         Updates the specified Virtual Network
         """
-        return self.ocasclient.put(self.nwport_path % (network), body=body)
+        return self.put(self.nwport_path % (network), body=body)
         
     def list_nwports(self, **_params):
         """
         Fetches a list of all nw ports
         """
-        return self.ocasclient.get(self.nwports_path, params=_params)
+        return self.get(self.nwports_path, params=_params)
         
     def show_nwport(self, network, **_params):
         """
         Fetches information of a Virtual network
         """
-        return self.ocasclient.get(self.nwport_path % (network), params=_params)
+        return self.get(self.nwport_path % (network), params=_params)
     
@@ -0,0 +1,158 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import threading
+import time
+
+from nscs.ocas_utils.openstack.common.gettextutils import _
+from nscs.ocas_utils.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Returned by the create methods which parked their message
+PARKED = 'parked'
+
+
+class DeferredQueue(object):
+    """
+    Messages parked until their parents are applied. A parent is a
+    (kind, id) pair such as ('network', network_id). A message is released
+    as soon as one of the parents it waits for is applied, and dropped
+    once it has waited for timeout seconds, by a timer set for the
+    earliest deadline, so that it is dropped even when no other message
+    comes.
+
+    exists(parent, payload) tells whether nscsas has a parent this
+    consumer did not see applied, such as one applied before a restart;
+    a message is only parked for parents nscsas does not have.
+    expired(entry) is called for each dropped message.
+    """
+    def __init__(self, timeout, exists, expired):
+        self.timeout = timeout
+        self.exists = exists
+        self.expired = expired
+        self.lock = threading.Lock()
+        self.known = set()
+        self.waiting = {}
+        self.count = 0
+        self.timer = None
+        self.stats = {'parked': 0, 'released': 0, 'expired': 0}
+
+    def park(self, parents, method, payload):
+        """
+        Park a message which failed to apply, when some of its parents
+        are not applied yet. Returns False, and parks nothing, when all
+        of them are.
+        """
+        expired = self.expire()
+        with self.lock:
+            unknown = [parent for parent in parents
+                       if parent[1] and parent not in self.known]
+        missing = []
+        for parent in unknown:
+            if self.exists(parent, payload):
+                with self.lock:
+                    self.known.add(parent)
+            else:
+                missing.append(parent)
+        with self.lock:
+            # A parent applied while nscsas was asked releases nothing
+            missing = [parent for parent in missing
+                       if parent not in self.known]
+            if not missing:
+                self._report_expired(expired)
+                return False
+            entry = {'method': method, 'payload': payload, 'done': False,
+                     'deadline': time.time() + self.timeout}
+            for parent in missing:
+                self.waiting.setdefault(parent, []).append(entry)
+            self.count += 1
+            self.stats['parked'] += 1
+            self._schedule()
+        LOG.debug(_("Parked %s waiting for %s"), method, str(missing))
+        self._report_expired(expired)
+        return True
+
+    def applied(self, parent):
+        """
+        Record an applied parent and return the messages waiting for it.
+        """
+        expired = self.expire()
+        released = []
+        with self.lock:
+            self.known.add(parent)
+            for entry in self.waiting.pop(parent, []):
+                if not entry['done']:
+                    entry['done'] = True
+                    self.count -= 1
+                    self.stats['released'] += 1
+                    released.append(entry)
+        self._report_expired(expired)
+        return released
+
+    def removed(self, parent):
+        with self.lock:
+            self.known.discard(parent)
+
+    def expire(self):
+        """
+        Drop the messages which waited for longer than the timeout.
+        """
+        now = time.time()
+        expired = []
+        with self.lock:
+            for parent, entries in self.waiting.items():
+                for entry in entries:
+                    if not entry['done'] and entry['deadline'] <= now:
+                        entry['done'] = True
+                        self.count -= 1
+                        self.stats['expired'] += 1
+                        expired.append(entry)
+                entries[:] = [entry for entry in entries if not entry['done']]
+                if not entries:
+                    del self.waiting[parent]
+        return expired
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, waiting=self.count)
+
+    def _schedule(self):
+        """
+        Set the timer for the earliest deadline of the parked messages.
+        Called with the lock held.
+        """
+        if self.timer is not None or not self.count:
+            return
+        deadline = min(entry['deadline']
+                       for entries in self.waiting.itervalues()
+                       for entry in entries if not entry['done'])
+        self.timer = threading.Timer(max(deadline - time.time(), 0),
+                                     self._timer_expired)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _timer_expired(self):
+        with self.lock:
+            self.timer = None
+        self._report_expired(self.expire())
+        with self.lock:
+            self._schedule()
+
+    def _report_expired(self, expired):
+        for entry in expired:
+            LOG.error(_("Dropped %s after waiting %s seconds for its "
+                        "parents: %s"), entry['method'], str(self.timeout),
+                      str(entry['payload']))
+            self.expired(entry)
@@ -54,6 +54,9 @@ class Unauthorized(UCMClientException):
 class ConnectionFailed(UCMClientException):
     message = _("Connection to ucm wsgi failed: %(reason)s")
 
+class InitExpired(UCMException):
+    message = _("Page %(page)s of paged init %(init_id)s is gone")
+
 class Error(Exception):
     def __init__(self, message=None):
         super(Error, self).__init__(message)
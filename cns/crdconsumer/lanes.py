@@ -0,0 +1,168 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import Queue
+import threading
+import time
+
+from nscs.ocas_utils.openstack.common.gettextutils import _
+from nscs.ocas_utils.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Lane of the messages whose resource kind has no lane of its own
+DEFAULT_LANE = 'default'
+
+# Resource kinds whose messages a delete of the given kind waits for, as
+# nscsas refuses to delete an object its children still refer to.
+CHILD_KINDS = {
+    'network': ('subnet', 'port'),
+    'subnet': ('port',),
+    'instance': ('port',),
+}
+
+
+def parse(specs):
+    """
+    {lane: (workers, queue_size)} of '<lane>:<workers>:<queue size>'
+    specs. A default lane of one worker is added when there is none.
+    """
+    lanes = {}
+    for spec in specs:
+        try:
+            name, workers, queue_size = spec.split(':')
+            lanes[name] = (max(int(workers), 1), max(int(queue_size), 0))
+        except ValueError:
+            LOG.error(_("Ignoring invalid apply lane %s"), spec)
+    lanes.setdefault(DEFAULT_LANE, (1, 0))
+    return lanes
+
+
+class ApplyLanes(object):
+    """
+    Apply messages in one lane per resource kind, so that a burst of
+    port deltas does not hold back the creates and updates of other
+    kinds. Each lane has its own worker threads, each fed by a queue of
+    at most queue_size messages (0 for no limit). resource_key returns the (kind, id) of the
+    resource a message changes; the messages of a resource always go to
+    the same worker and are applied in the order they were added. Adding
+    to a full queue blocks until its worker catches up.
+
+    Messages are added in version order. Adding the delete of a resource
+    whose kind has CHILD_KINDS blocks until the lanes of those kinds have
+    applied every message added before it, so that children are deleted
+    before their parent.
+    """
+    def __init__(self, apply_message, resource_key, lanes):
+        self.resource_key = resource_key
+        self.lanes = dict((name, _Lane(name, apply_message, workers,
+                                       queue_size))
+                          for name, (workers, queue_size) in lanes.iteritems())
+
+    def add(self, message):
+        key = self.resource_key(message)
+        if key is None:
+            self.lanes[DEFAULT_LANE].add(None, message)
+            return
+        if message['method'].startswith('delete_'):
+            children = set(self._lane(kind)
+                           for kind in CHILD_KINDS.get(key[0], ()))
+            marks = [(lane, lane.mark()) for lane in children]
+            for lane, mark in marks:
+                lane.drain(mark)
+        self._lane(key[0]).add(key[1], message)
+
+    def _lane(self, kind):
+        return self.lanes.get(kind, self.lanes[DEFAULT_LANE])
+
+    def get_stats(self):
+        """
+        Workers, queued messages, applied and failed counts, and the mean
+        and max milliseconds from add to applied of each lane.
+        """
+        return dict((name, lane.get_stats())
+                    for name, lane in self.lanes.iteritems())
+
+
+class _Lane(object):
+    def __init__(self, name, apply_message, workers, queue_size):
+        self.name = name
+        self.apply_message = apply_message
+        self.queue_size = queue_size
+        self.queues = [Queue.Queue(queue_size) for i in range(workers)]
+        self.lock = threading.Lock()
+        self.done = threading.Condition(self.lock)
+        # Messages added to and applied from each queue
+        self.added_count = [0] * workers
+        self.done_count = [0] * workers
+        self.stats = {'applied': 0, 'failed': 0, 'total_ms': 0.0,
+                      'max_ms': 0.0}
+        for index in range(workers):
+            worker = threading.Thread(target=self._work, args=(index,))
+            worker.daemon = True
+            worker.start()
+
+    def add(self, resource_id, message):
+        if resource_id is None:
+            index = 0
+        else:
+            index = hash(resource_id) % len(self.queues)
+        with self.lock:
+            self.added_count[index] += 1
+        self.queues[index].put((time.time(), message))
+
+    def mark(self):
+        """
+        Messages added to each queue so far, for drain.
+        """
+        with self.lock:
+            return list(self.added_count)
+
+    def drain(self, mark):
+        """
+        Wait until the messages added before mark are applied. The queues
+        are first in first out, so each is drained once it applied as many
+        messages as were added to it before mark.
+        """
+        with self.lock:
+            while [index for index in range(len(mark))
+                   if self.done_count[index] < mark[index]]:
+                self.done.wait()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, workers=len(self.queues),
+                         queue_size=self.queue_size,
+                         depth=sum([queue.qsize() for queue in self.queues]))
+        done = stats['applied'] + stats['failed']
+        stats['mean_ms'] = done and stats['total_ms'] / done or 0.0
+        return stats
+
+    def _work(self, index):
+        queue = self.queues[index]
+        while True:
+            added, message = queue.get()
+            try:
+                applied = self.apply_message(message)
+            except Exception:
+                LOG.exception(_("Applying %s in lane %s failed"),
+                              message.get('method'), self.name)
+                applied = False
+            latency = (time.time() - added) * 1000
+            with self.lock:
+                self.stats[applied and 'applied' or 'failed'] += 1
+                self.stats['total_ms'] += latency
+                self.stats['max_ms'] = max(self.stats['max_ms'], latency)
+                self.done_count[index] += 1
+                self.done.notify_all()
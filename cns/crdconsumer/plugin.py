@@ -12,18 +12,138 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import math
+import threading
 import time
 
+from oslo.config import cfg
+
 from nscs.ocas_utils.openstack.common.gettextutils import _
 from nscs.ocas_utils.openstack.common import log as logging
 #from nscs.crd_consumer.client.common import rm_exceptions as exceptions
+from cns.common import wire
+from cns.crdconsumer import applier
+from cns.crdconsumer import checkpoint
+from cns.crdconsumer import deferred
 from cns.crdconsumer import exceptions
+from cns.crdconsumer import lanes
+from cns.crdconsumer import reconcile
+from cns.crdconsumer import reorder
+from cns.crdconsumer import versions
 from cns.crdconsumer.client import ocas_client
 from nscs.ocas_utils.openstack.common import context
+from nscs.ocas_utils.openstack.common import rpc
+from nscs.ocas_utils.openstack.common.rpc import dispatcher
 from nscs.ocas_utils.openstack.common.rpc import proxy
 
 LOG = logging.getLogger(__name__)
 
+# Number of init delta messages fetched per RPC call (0 fetches the whole
+# init delta in one reply) and seconds a consumer waits for the CRD service
+# to report it ready.
+# Number of snapshot messages of a tier applied concurrently.
+# Seconds a message waits for its parents to be applied before it is
+# dropped.
+# Number of snapshot creates, or reconcile updates and deletes, sent to
+# nscsas in one bulk request (0 sends them one by one).
+# SQLite file keeping the last applied delta version (empty for none) and
+# seconds between two writes of it.
+# Seconds fanouts wait for a missing version before it is fetched from the
+# CRD service, and number of fanouts held that fetches it right away.
+# Number of resources whose last applied version is kept to drop stale and
+# duplicate deltas (0 keeps none).
+# Diff snapshots against the objects nscsas already has and only send the
+# changes, instead of creating every object again.
+# Apply lanes of the fanout deltas, as '<lane>:<workers>:<queue size>'. A
+# lane is named after the resource kind of RESOURCE_KEYS it applies, the
+# deltas of other kinds go to the 'default' lane.
+# Interval in seconds between two acknowledgements of the checkpoint version
+# to the CRD service (0 disables them).
+cns_consumer_opts = [
+    cfg.IntOpt('init_page_size', default=0),
+    cfg.IntOpt('register_timeout', default=60),
+    cfg.IntOpt('apply_concurrency', default=1),
+    cfg.IntOpt('deferred_timeout', default=60),
+    cfg.IntOpt('bulk_size', default=100),
+    cfg.StrOpt('checkpoint_file',
+               default='/var/lib/cns/consumer_checkpoint.sqlite'),
+    cfg.IntOpt('checkpoint_interval', default=1),
+    cfg.FloatOpt('reorder_window', default=2.0),
+    cfg.IntOpt('reorder_max_pending', default=10000),
+    cfg.IntOpt('version_map_size', default=200000),
+    cfg.BoolOpt('reconcile', default=False),
+    cfg.ListOpt('apply_lanes',
+                default=['network:1:1000', 'subnet:1:1000', 'port:4:1000',
+                         'instance:4:1000', 'compute:1:1000',
+                         'nwport:2:1000', 'default:1:1000']),
+    cfg.IntOpt('ack_interval', default=60),
+]
+
+cfg.CONF.register_opts(cns_consumer_opts, "CNSCONSUMER")
+
+CONSUMER_TOPIC = 'crd-consumer'
+
+# Attempts at a paged init whose pages the CRD service no longer has
+INIT_ATTEMPTS = 3
+
+# Snapshot methods created, and reconcile methods updated, in bulk: message
+# type of build_ucm_wsgi_msg, bulk method of the nscsas client, and the
+# parent kind and payload field of the created objects.
+BULK_METHODS = {
+    'create_virtual_network': ('create_network', 'create_virtualnetwork_bulk',
+                               'network', 'network_id'),
+    'create_instance': ('create_instance', 'create_virtualmachine_bulk',
+                        'instance', 'instance_id'),
+    'create_port': ('create_port', 'create_port_bulk', None, None),
+    'create_nwport': ('create_nwport', 'create_nwport_bulk', None, None),
+    'update_virtual_network': ('update_network', 'update_virtualnetwork_bulk',
+                               None, None),
+    'update_instance': ('update_instance', 'update_virtualmachine_bulk',
+                        None, None),
+    'update_port': ('update_port', 'update_port_bulk', None, None),
+}
+
+# Reconcile methods deleted in bulk: bulk method of the nscsas client, which
+# takes the ids to delete and returns the ids deleted.
+BULK_DELETES = {
+    'delete_virtual_network': 'delete_virtualnetwork_bulk',
+    'delete_instance': 'delete_virtualmachine_bulk',
+    'delete_port': 'delete_port_bulk',
+}
+
+# Resource kind and payload id field of the objects each method changes.
+RESOURCE_KEYS = {
+    'create_datapath': ('compute', 'compute_id'),
+    'create_virtual_network': ('network', 'network_id'),
+    'update_virtual_network': ('network', 'network_id'),
+    'delete_virtual_network': ('network', 'network_id'),
+    'create_subnet': ('subnet', 'subnet_id'),
+    'update_subnet': ('subnet', 'subnet_id'),
+    'delete_subnet': ('subnet', 'subnet_id'),
+    'create_port': ('port', 'port_id'),
+    'update_port': ('port', 'port_id'),
+    'delete_port': ('port', 'port_id'),
+    'create_instance': ('instance', 'instance_id'),
+    'update_instance': ('instance', 'instance_id'),
+    'delete_instance': ('instance', 'instance_id'),
+    'create_nwport': ('nwport', 'nwport_id'),
+}
+
+
+class RouteListener(object):
+    """
+    Apply the deltas the CRD service routes to the cluster or cell of
+    this consumer.
+    """
+    RPC_API_VERSION = '1.0'
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+
+    def call_consumer(self, context, **kwargs):
+        self.plugin.call_consumer(context, **kwargs)
+
+
 class CNSConsumerPlugin(proxy.RpcProxy):
     """
     Implementation of the Crd Consumer Core Network Service Plugin.
@@ -32,24 +152,611 @@ class CNSConsumerPlugin(proxy.RpcProxy):
     
     def __init__(self):
         super(CNSConsumerPlugin,self).__init__(topic="crd-service-queue",default_version=self.RPC_API_VERSION)
-        self.uc = ocasclient()
+        self.local = threading.local()
         self.listener_topic = 'crd-listener'
         # RPC network init
         self.consumer_context = context.RequestContext('crd', 'crd',
                                                        is_admin=False)
+        self.route_conn = None
+        self.startup_time = None
+        # nscsas switch and domain ids by name
+        self.switch_ids = {}
+        self.domain_ids = {}
+        self.cache_lock = threading.Lock()
+        # Locks serializing the lookup and create of an uncached switch or
+        # domain, by (kind, name)
+        self.name_locks = {}
+        self.deferred = deferred.DeferredQueue(
+            cfg.CONF.CNSCONSUMER.deferred_timeout, self.parent_exists,
+            self.parked_expired)
+        self.checkpoint = checkpoint.VersionCheckpoint(
+            cfg.CONF.CNSCONSUMER.checkpoint_file,
+            cfg.CONF.CNSCONSUMER.checkpoint_interval)
+        self.route_topics = []
+        self.versions = versions.VersionMap(
+            cfg.CONF.CNSCONSUMER.version_map_size)
+        self.lanes = lanes.ApplyLanes(
+            self.apply_message, self.resource_key,
+            lanes.parse(cfg.CONF.CNSCONSUMER.apply_lanes))
+        self.reorder = reorder.ReorderBuffer(
+            self.queue_message, self.get_deltas,
+            cfg.CONF.CNSCONSUMER.reorder_window,
+            cfg.CONF.CNSCONSUMER.reorder_max_pending)
+        self.reconcile_stats = {}
+        self.acker = None
         
+    @property
+    def uc(self):
+        """
+        nscsas client of the calling thread, as tiers are applied by
+        several threads.
+        """
+        client = getattr(self.local, 'uc', None)
+        if client is None:
+            client = self.local.uc = ocasclient()
+        return client
+
     def get_plugin_type(self):
         return "CNS"
     
     def init_consumer(self, consumer=None):
+        start = time.time()
+        page_size = cfg.CONF.CNSCONSUMER.init_page_size
+        if consumer is not None:
+            consumer = dict(consumer)
+            consumer['payload'] = dict(consumer['payload'],
+                                       wire_formats=wire.formats())
+            if page_size > 0:
+                consumer['payload']['page_size'] = page_size
         delta_msg = {}
-        delta_msg = self.call(self.consumer_context,self.make_msg('cns_init_consumer',consumer=consumer),self.listener_topic)
-        time.sleep(2)
-        delta_msg = self.call(self.consumer_context,self.make_msg('cns_init_consumer',consumer=consumer),self.listener_topic)
+        registration = self.register_consumer(consumer)
+        if registration is None:
+            return delta_msg
+        if consumer is not None:
+            self.resume_from_checkpoint(consumer['payload'])
+        self.load_resource_cache()
+        delta_msg = self.sync_consumer(consumer)
 
+        if consumer is not None:
+            self.subscribe_routes(registration)
+        if page_size > 0 and 'pages' in delta_msg:
+            for attempt in range(1, INIT_ATTEMPTS + 1):
+                try:
+                    self.apply_delta(self.init_pages(consumer, delta_msg))
+                    break
+                except exceptions.InitExpired as e:
+                    if attempt == INIT_ATTEMPTS:
+                        raise
+                    LOG.warning(_("%s, starting the init again"), str(e))
+                    delta_msg = self.sync_consumer(consumer)
+            version = delta_msg['version']
+        elif 'tiers' in delta_msg:
+            self.checkpoint.hold()
+            reconciler = self.start_reconcile()
+            failed = self.apply_tiers(self.reconcile_tiers(reconciler,
+                                                           delta_msg['tiers']))
+            failed += self.finish_reconcile(reconciler)
+            if not failed:
+                self.checkpoint.reset(delta_msg['version'])
+            version = delta_msg['version']
+        else:
+            self.apply_delta(delta_msg)
+            version = max([int(key) for key in delta_msg] +
+                          [consumer and consumer['payload'].get('version') or 0])
+        # Fanouts received during the init are applied from here on
+        self.reorder.start(version)
+        if consumer is not None:
+            self.start_acks(consumer['payload']['hostname'])
+        delta_msg = {}
+        self.startup_time = time.time() - start
+        LOG.info(_("CNS consumer started in %.3f seconds"), self.startup_time)
+        LOG.info(_("OCAS endpoint latencies: %s"), str(self.get_ocas_stats()))
         return delta_msg
+
+    def sync_consumer(self, consumer):
+        """
+        Init delta of this consumer, or the header of a paged init.
+        """
+        delta_msg = self.call(self.consumer_context,
+                              self.make_msg('cns_sync_consumer',
+                                            consumer=consumer),
+                              self.listener_topic)
+        return wire.decode(delta_msg)
+
+    def start_acks(self, hostname):
+        """
+        Acknowledge the checkpoint version to the CRD service every
+        ack_interval seconds, so that it keeps the deltas a restart of
+        this consumer would need and compacts the older ones.
+        """
+        interval = cfg.CONF.CNSCONSUMER.ack_interval
+        if interval <= 0 or self.acker is not None:
+            return
+        self.acker = threading.Thread(target=self._ack_versions,
+                                      args=(hostname, interval))
+        self.acker.daemon = True
+        self.acker.start()
+
+    def _ack_versions(self, hostname, interval):
+        while True:
+            time.sleep(interval)
+            version = self.checkpoint.get_version()
+            if version <= 0:
+                continue
+            try:
+                self.cast(self.consumer_context,
+                          self.make_msg('cns_ack_version', hostname=hostname,
+                                        version=version),
+                          self.listener_topic)
+            except Exception:
+                LOG.exception(_("Acknowledging version %s failed"),
+                              str(version))
+
+    def resume_from_checkpoint(self, payload):
+        """
+        Ask for the tail after the checkpointed version instead of a
+        snapshot, unless the CRD service is behind the checkpoint, as after
+        its database was reset.
+        """
+        if payload.get('version'):
+            return
+        version = self.checkpoint.load(payload['hostname'])
+        if version <= 0:
+            return
+        if version > self.get_service_version():
+            LOG.warning(_("Checkpoint version %s is ahead of the CRD service, "
+                          "requesting a snapshot"), str(version))
+            return
+        LOG.info(_("Resuming from checkpoint version %s"), str(version))
+        payload['version'] = version
+
+    def load_resource_cache(self):
+        """
+        Fill the switch and domain name caches from nscsas in one list
+        call each.
+        """
+        try:
+            switches = self.uc.list_switchs()['switchs']
+            domains = self.uc.list_domains()['domains']
+        except Exception:
+            LOG.exception(_("Loading switches and domains failed"))
+            return
+        with self.cache_lock:
+            self.switch_ids = dict((switch['name'], switch['id'])
+                                   for switch in switches)
+            self.domain_ids = dict((domain['name'], domain['id'])
+                                   for domain in domains)
+        LOG.info(_("Cached %s switches and %s domains"),
+                 str(len(self.switch_ids)), str(len(self.domain_ids)))
+
+    def parent_applied(self, parent):
+        """
+        Apply the messages parked until the given parent was applied.
+        """
+        for entry in self.deferred.applied(parent):
+            LOG.debug(_("Releasing %s parked for %s"), entry['method'],
+                      str(parent))
+            self.apply_message({'method': entry['method'],
+                                'payload': entry['payload']}, released=True)
+
+    def parent_exists(self, parent, payload):
+        """
+        Whether nscsas has the given parent of a message. Only a not found
+        reply counts as missing, so that other failures are not parked.
+        """
+        kind, key = parent
+        try:
+            if kind == 'network':
+                self.uc.show_virtualnetwork(key)
+            elif kind == 'subnet':
+                self.uc.show_subnet(payload.get('network_id'), key)
+            elif kind == 'instance':
+                self.uc.show_virtualmachine(key)
+        except exceptions.UCMClientException as e:
+            return e.status_code != 404
+        except Exception:
+            LOG.exception(_("Checking %s %s failed"), kind, key)
+        return True
+
+    def parked_expired(self, entry):
+        """
+        Hold the checkpoint below the version of a dropped message, so
+        that the restarted consumer gets it again.
+        """
+        version = entry['payload'].get('version_id')
+        if version is not None:
+            self.checkpoint.failed(int(version))
+
+    def get_ocas_stats(self):
+        """
+        Request count, errors and latencies of each OCAS endpoint.
+        """
+        return ocas_client.get_stats()
+
+    def get_deferred_stats(self):
+        """
+        Parked, released and expired message counts, and the number of
+        messages waiting.
+        """
+        return self.deferred.get_stats()
+
+    def register_consumer(self, consumer):
+        """
+        Register this consumer with the CRD service and wait until the
+        service reports it ready to sync. Polling only happens while the
+        service has no cluster for the consumer yet. Returns the reply of
+        the service, with the cluster id and cell this consumer was
+        registered in, or None when it did not get ready.
+        """
+        deadline = time.time() + cfg.CONF.CNSCONSUMER.register_timeout
+        delay = 0.1
+        while True:
+            reply = self.call(self.consumer_context,
+                              self.make_msg('cns_register_consumer',
+                                            consumer=consumer),
+                              self.listener_topic)
+            if reply.get('ready'):
+                return reply
+            if time.time() + delay > deadline:
+                LOG.error(_("CRD service did not report the consumer ready"))
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+
+    def subscribe_routes(self, payload):
+        """
+        Listen on crd-consumer.<cluster id> and crd-consumer.<cell>, which
+        carry the deltas of the compute nodes of this consumer when the
+        CRD service routes deltas, next to the crd-consumer broadcast. The
+        cluster id and cell are the ones of the registration reply, which
+        the routes are computed from.
+        """
+        if self.route_conn is not None:
+            return
+        topics = ['%s.%s' % (CONSUMER_TOPIC, payload[key])
+                  for key in ('cluster_id', 'cell') if payload.get(key)]
+        if not topics:
+            return
+        self.route_topics = topics
+        self.reorder.topics = topics
+        self.route_conn = rpc.create_connection(new=True)
+        route_dispatcher = dispatcher.RpcDispatcher([RouteListener(self)])
+        for topic in topics:
+            self.route_conn.create_consumer(topic, route_dispatcher,
+                                            fanout=True)
+        self.route_conn.consume_in_thread()
+
+    def init_pages(self, consumer, header):
+        """
+        Fetch a paged init page by page. Snapshot pages are applied as
+        soon as they arrive. Every tail page but the last is applied as
+        soon as it arrives, the last one is returned like the single init
+        reply. Raises InitExpired when the CRD service no longer has the
+        pages, for the init to be started again.
+        """
+        hostname = consumer['payload']['hostname']
+        delta_msg = {}
+        failed = 0
+        reconciler = None
+        if header['start_version'] == 0:
+            self.checkpoint.hold()
+            reconciler = self.start_reconcile()
+        for page in range(header['pages']):
+            self.apply_delta(delta_msg)
+            reply = self.call(self.consumer_context,
+                              self.make_msg('cns_init_page',
+                                            hostname=hostname,
+                                            init_id=header['init_id'],
+                                            page=page,
+                                            wire_formats=wire.formats()),
+                              self.listener_topic)
+            reply = wire.decode(reply)
+            if reply.get('expired'):
+                raise exceptions.InitExpired(init_id=header['init_id'],
+                                             page=page)
+            if 'tiers' in reply:
+                failed += self.apply_tiers(self.reconcile_tiers(reconciler,
+                                                                reply['tiers']))
+            else:
+                delta_msg = reply['delta']
+        failed += self.finish_reconcile(reconciler)
+        if header['start_version'] == 0 and not failed:
+            self.checkpoint.reset(header['version'])
+        return delta_msg
+
+    def call_consumer(self, context, **kwargs):
+        """
+        Hand a fanout of {version: message} deltas to the apply lanes in
+        version order.
+        """
+        self.reorder.add(wire.decode(kwargs['payload']))
+
+    def queue_message(self, message):
+        """
+        Hand a fanout delta to the apply lane of the resource it changes.
+        """
+        version = message['payload'].get('version_id')
+        if version is not None:
+            self.checkpoint.queued(int(version))
+        self.lanes.add(message)
+
+    def get_lane_stats(self):
+        """
+        Queue depth, applied and failed counts and latencies of each apply
+        lane.
+        """
+        return self.lanes.get_stats()
+
+    def get_deltas(self, start_version, end_version):
+        """
+        Fetch the deltas after start_version up to end_version that this
+        consumer missed. A compacted range holds the checkpoint, so that
+        the next restart gets a snapshot.
+        """
+        reply = self.call(self.consumer_context,
+                          self.make_msg('cns_get_deltas',
+                                        start_version=start_version,
+                                        end_version=end_version,
+                                        topics=self.route_topics,
+                                        wire_formats=wire.formats()),
+                          self.listener_topic)
+        reply = wire.decode(reply)
+        if reply.get('compacted'):
+            self.checkpoint.failed(start_version + 1)
+            return None
+        return reply['delta']
+
+    def get_reorder_stats(self):
+        """
+        Applied, held, duplicate and fetched fanout counts, gaps, and the
+        number of fanouts waiting for a missing version.
+        """
+        return self.reorder.get_stats()
+
+    def apply_delta(self, delta_msg):
+        """
+        Apply delta messages in version order.
+        """
+        for version in sorted(delta_msg, key=int):
+            self.apply_message(delta_msg[version])
+
+    def apply_tiers(self, tiers):
+        """
+        Apply snapshot tiers in order and return the number of messages
+        which failed. The messages of a tier only depend on the tiers
+        before it, so each tier is applied concurrently.
+        """
+        if cfg.CONF.CNSCONSUMER.bulk_size > 0:
+            tiers = [self.bulk_tier(tier) for tier in tiers]
+        tier_applier = applier.TierApplier(
+            self.apply_tier_message, cfg.CONF.CNSCONSUMER.apply_concurrency)
+        return tier_applier.apply(tiers)
+
+    def apply_tier_message(self, message):
+        """
+        Apply a message of a snapshot tier and return the number of
+        messages which failed, all those a bulk message groups included.
+        """
+        if message['method'] == 'apply_bulk':
+            return self.apply_bulk(message['payload'])
+        return int(not self.apply_message(message))
+
+    def start_reconcile(self):
+        """
+        Reconciler loaded with the nscsas objects, None when reconcile is
+        off or listing them failed, every snapshot object is then created.
+        """
+        if not cfg.CONF.CNSCONSUMER.reconcile:
+            return None
+        reconciler = reconcile.Reconciler(self.build_ucm_wsgi_msg)
+        if not reconciler.load(self.uc):
+            return None
+        return reconciler
+
+    def reconcile_tiers(self, reconciler, tiers):
+        """
+        Snapshot tiers reduced to the creates and updates nscsas needs. The
+        versions of the unchanged objects are recorded as applied.
+        """
+        if reconciler is None:
+            return tiers
+        tiers, unchanged = reconciler.diff(tiers)
+        for message in unchanged:
+            key = self.resource_key(message)
+            version = message['payload'].get('version_id')
+            if key is not None and version is not None:
+                self.versions.applied(key, int(version))
+        return tiers
+
+    def finish_reconcile(self, reconciler):
+        """
+        Delete the nscsas objects the snapshot no longer has, report the
+        diff and return the number of deletes which failed.
+        """
+        if reconciler is None:
+            return 0
+        failed = self.apply_tiers(reconciler.deletes())
+        stats = reconciler.get_stats()
+        # Creates of the unchanged objects are not sent, each would have
+        # cost about the mean OCAS request latency of this process.
+        bulk_size = cfg.CONF.CNSCONSUMER.bulk_size
+        requests = 0
+        for method, count in stats['unchanged_by_method'].iteritems():
+            if bulk_size > 0 and method in BULK_METHODS:
+                count = int(math.ceil(float(count) / bulk_size))
+            requests += count
+        endpoints = ocas_client.get_stats().values()
+        latency = 0.0
+        if endpoints:
+            latency = sum([endpoint['total_ms'] for endpoint in endpoints]) / \
+                sum([endpoint['count'] for endpoint in endpoints]) / 1000
+        stats['requests_saved'] = requests
+        stats['seconds_saved'] = requests * latency - stats['list_seconds']
+        self.reconcile_stats = stats
+        LOG.info(_("Reconciled snapshot: %s created, %s updated, %s deleted, "
+                   "%s unchanged, about %.3f seconds saved"),
+                 str(stats['created']), str(stats['updated']),
+                 str(stats['deleted']), str(stats['unchanged']),
+                 stats['seconds_saved'])
+        return failed
+
+    def get_reconcile_stats(self):
+        """
+        Created, updated, deleted and unchanged object counts of the last
+        reconciled snapshot, and the requests and seconds it saved.
+        """
+        return self.reconcile_stats
+
+    def bulk_tier(self, tier):
+        """
+        Group the creates, updates and deletes of a tier into apply_bulk
+        messages of bulk_size messages each.
+        """
+        size = cfg.CONF.CNSCONSUMER.bulk_size
+        grouped = {}
+        messages = []
+        for message in tier:
+            if message['method'] in BULK_METHODS or \
+                    message['method'] in BULK_DELETES:
+                grouped.setdefault(message['method'], []).append(message)
+            else:
+                messages.append(message)
+        for method, changes in grouped.iteritems():
+            for i in range(0, len(changes), size):
+                messages.append({'method': 'apply_bulk',
+                                 'payload': {'method': method,
+                                             'messages': changes[i:i + size]}})
+        return messages
+
+    def apply_bulk(self, payload):
+        """
+        Create, update or delete the objects of several messages in one
+        nscsas request. When it fails, the messages are applied one by one,
+        and so are the messages whose object nscsas left out of its reply.
+        Returns the number of messages which failed.
+        """
+        method = payload['method']
+        messages = payload['messages']
+        try:
+            done = self.send_bulk(method, messages)
+        except Exception:
+            LOG.warning(_("Bulk %s of %s messages failed, applying them one "
+                          "by one"), method, str(len(messages)))
+            done = set()
+        key_field = reconcile.KEYS[RESOURCE_KEYS[method][0]][0]
+        applied = []
+        missed = []
+        for message in messages:
+            if message['payload'].get(key_field) in done:
+                applied.append(message)
+            else:
+                missed.append(message)
+        if applied and missed:
+            LOG.warning(_("nscsas applied %s of %s objects of bulk %s, "
+                          "applying the others one by one"),
+                        str(len(applied)), str(len(messages)), method)
+        parent = None
+        if method in BULK_METHODS:
+            parent, field = BULK_METHODS[method][2:]
+        for message in applied:
+            key = self.resource_key(message)
+            version = message['payload'].get('version_id')
+            if version is not None:
+                if key is not None:
+                    self.versions.applied(key, int(version))
+                self.checkpoint.applied(int(version))
+            if method in BULK_DELETES:
+                self.deferred.removed(key)
+            elif parent is not None:
+                self.parent_applied((parent, message['payload'].get(field)))
+        failed = 0
+        for message in missed:
+            if not self.apply_message(message):
+                failed += 1
+        return failed
+
+    def send_bulk(self, method, messages):
+        """
+        Send the messages of a bulk in one nscsas request and return the
+        payload ids of the objects nscsas applied.
+        """
+        key_field, nscsas_field = reconcile.KEYS[RESOURCE_KEYS[method][0]]
+        if method in BULK_DELETES:
+            ids = [message['payload'].get(key_field) for message in messages]
+            return set(getattr(self.uc, BULK_DELETES[method])(ids))
+        message_type, bulk_method = BULK_METHODS[method][:2]
+        bodies = []
+        for message in messages:
+            body = self.build_ucm_wsgi_msg(message['payload'], message_type)
+            # Update bodies carry no id, nscsas matches them by it
+            body.values()[0].setdefault(nscsas_field,
+                                        message['payload'].get(key_field))
+            bodies.append(body)
+        reply = getattr(self.uc, bulk_method)(bodies)
+        return set(obj[nscsas_field] for obj in reply.values()[0])
+
+    def resource_key(self, message):
+        """
+        (kind, id) of the resource a message changes, None when unknown.
+        """
+        kind = RESOURCE_KEYS.get(message['method'])
+        if kind is None or not message['payload'].get(kind[1]):
+            return None
+        return kind[0], message['payload'][kind[1]]
+
+    def apply_message(self, message, released=False):
+        """
+        Apply a message unless the resource it changes is already at its
+        version or above. Messages released from the deferred queue were
+        checked when parked and are always applied. A parked message
+        keeps the checkpoint below its version until it is released.
+        """
+        version = message['payload'].get('version_id')
+        key = self.resource_key(message)
+        if version is not None:
+            version = int(version)
+            if key is not None and not released and \
+                    self.versions.is_stale(key, version):
+                LOG.debug(_("Skipping stale %s of version %s"),
+                          message['method'], str(version))
+                self.checkpoint.applied(version)
+                return True
+        try:
+            result = getattr(self, message['method'])(
+                self.consumer_context, payload=message['payload'])
+        except Exception:
+            LOG.exception(_("Applying %s of version %s failed"),
+                          message['method'], str(version))
+            if version is not None:
+                self.checkpoint.failed(version)
+            return False
+        if result == deferred.PARKED:
+            if version is not None:
+                self.checkpoint.queued(version)
+            return True
+        if version is not None:
+            if key is not None:
+                self.versions.applied(key, version)
+            self.checkpoint.applied(version)
+        return True
+
+    def get_version_stats(self):
+        """
+        Number of resources tracked, stale deltas skipped and resources
+        evicted from the version map.
+        """
+        return self.versions.get_stats()
         
     
+    def get_service_version(self):
+        """
+        Latest runtime version known to the CRD service.
+        """
+        reply = self.call(self.consumer_context,
+                          self.make_msg('cns_current_version'),
+                          self.listener_topic)
+        return reply['version']
+
     def build_ucm_wsgi_msg(self, payload, message_type=None):
         msg = {}
         if message_type == 'create_network':
@@ -247,25 +954,68 @@ class CNSConsumerPlugin(proxy.RpcProxy):
         payload = kwargs['payload']
         body = self.build_ucm_wsgi_msg(payload, 'create_datapath')
         #LOG.info(_("Create Datapath - %s"), str(body))
-        self.uc.create_datapath(body=body)
+        try:
+            self.uc.create_datapath(body=body)
+        except exceptions.UCMClientException as e:
+            # nscsas reports a switch or domain it does not have as not
+            # found: the cached one may have been removed from nscsas,
+            # resolve them again once.
+            if e.status_code != 404:
+                raise
+            LOG.info(_("Switch or domain of Datapath not found, resolving "
+                       "them again"))
+            with self.cache_lock:
+                self.switch_ids.pop(('os_' + payload.get('switch'))[:16], None)
+                self.domain_ids.pop('TSC_' + payload.get('domain'), None)
+            body = self.build_ucm_wsgi_msg(payload, 'create_datapath')
+            self.uc.create_datapath(body=body)
         
+    def get_name_lock(self, kind, name):
+        """
+        Lock of a switch or domain name, held while it is looked up and
+        created, so that appliers missing the same name in the cache do not
+        create it twice.
+        """
+        with self.cache_lock:
+            return self.name_locks.setdefault((kind, name), threading.Lock())
+
     def create_domain(self, context, **kwargs):
         payload = kwargs['payload']
-        try:
-            domain_details = self.get_domain(payload['domain'].get('name'))
-        except :
-            #LOG.info(_("Create Domain - %s"), str(payload))
-            domain_details = self.uc.create_domain(body=payload)
+        name = payload['domain'].get('name')
+        domain_id = self.domain_ids.get(name)
+        if domain_id is not None:
+            return {'domain': {'id': domain_id, 'name': name}}
+        with self.get_name_lock('domain', name):
+            domain_id = self.domain_ids.get(name)
+            if domain_id is not None:
+                return {'domain': {'id': domain_id, 'name': name}}
+            try:
+                domain_details = self.get_domain(name)
+            except :
+                #LOG.info(_("Create Domain - %s"), str(payload))
+                domain_details = self.uc.create_domain(body=payload)
+            with self.cache_lock:
+                self.domain_ids[name] = domain_details['domain']['id']
             
         return domain_details
         
     def create_switch(self, context, **kwargs):
         payload = kwargs['payload']
-        try:
-            switch_details = self.get_switch(payload['switch'].get('name'))
-        except :
-            #LOG.info(_("Create Switch - %s"), str(payload))
-            switch_details = self.uc.create_switch(body=payload)
+        name = payload['switch'].get('name')
+        switch_id = self.switch_ids.get(name)
+        if switch_id is not None:
+            return {'switch': {'id': switch_id, 'name': name}}
+        with self.get_name_lock('switch', name):
+            switch_id = self.switch_ids.get(name)
+            if switch_id is not None:
+                return {'switch': {'id': switch_id, 'name': name}}
+            try:
+                switch_details = self.get_switch(name)
+            except :
+                #LOG.info(_("Create Switch - %s"), str(payload))
+                switch_details = self.uc.create_switch(body=payload)
+            with self.cache_lock:
+                self.switch_ids[name] = switch_details['switch']['id']
             
         return switch_details
         
@@ -283,12 +1033,14 @@ class CNSConsumerPlugin(proxy.RpcProxy):
         body = self.build_ucm_wsgi_msg(payload, 'create_network')
         #LOG.info(_("Create Network Body - %s"), str(body))
         self.uc.create_virtualnetwork(body=body)
+        self.parent_applied(('network', payload.get('network_id')))
         
     def delete_virtual_network(self, context, **kwargs):
         payload = kwargs['payload']
         nwname = payload.get('network_id')
         #LOG.info(_("Delete Network Name- %s"), str(nwname))
         self.uc.delete_virtualnetwork(nwname)
+        self.deferred.removed(('network', nwname))
         
     def update_virtual_network(self, context, **kwargs):
         payload = kwargs['payload']
@@ -311,7 +1063,14 @@ class CNSConsumerPlugin(proxy.RpcProxy):
         nwname = payload.get('network_id')
         body = self.build_ucm_wsgi_msg(payload, 'create_subnet')
         #LOG.info(_("Create Subnet - %s"), str(body))
-        self.uc.create_subnet(nwname, body=body)
+        try:
+            self.uc.create_subnet(nwname, body=body)
+        except Exception:
+            if self.deferred.park([('network', nwname)], 'create_subnet',
+                                  payload):
+                return deferred.PARKED
+            raise
+        self.parent_applied(('subnet', payload.get('subnet_id')))
         
     def delete_subnet(self, context, **kwargs):
         payload = kwargs['payload']
@@ -319,6 +1078,7 @@ class CNSConsumerPlugin(proxy.RpcProxy):
         subnetname = payload.get('subnet_id')
         #LOG.info(_("Delete Subnet Name - %s"), str(subnetname))
         self.uc.delete_subnet(nwname, subnetname)
+        self.deferred.removed(('subnet', subnetname))
     
     def update_subnet(self, context, **kwargs):
         payload = kwargs['payload']
@@ -343,14 +1103,16 @@ class CNSConsumerPlugin(proxy.RpcProxy):
         payload = kwargs['payload']
         body = self.build_ucm_wsgi_msg(payload, 'create_port')
         #LOG.info(_("Create Port Body - %s"), str(body))
-        retry = 5
-        while retry:
-            try:
-                self.uc.create_port(body=body)
-                break
-            except Exception:
-                retry -= 1
-                time.sleep(2)
+        try:
+            self.uc.create_port(body=body)
+        except Exception:
+            # Park the port until its network, subnet or VM is applied
+            parents = [('network', payload.get('network_id')),
+                       ('subnet', payload.get('subnet_id')),
+                       ('instance', payload.get('device_id'))]
+            if not self.deferred.park(parents, 'create_port', payload):
+                raise
+            return deferred.PARKED
         
     def delete_port(self, context, **kwargs):
         payload = kwargs['payload']
@@ -379,12 +1141,14 @@ class CNSConsumerPlugin(proxy.RpcProxy):
         body = self.build_ucm_wsgi_msg(payload, 'create_instance')
         #LOG.info(_("Create Instance Body - %s"), str(body))
         self.uc.create_virtualmachine(body=body)
+        self.parent_applied(('instance', payload.get('instance_id')))
         
     def delete_instance(self, context, **kwargs):
         payload = kwargs['payload']
         vmname = payload.get('instance_id')
         #LOG.info(_("Delete Instance Name- %s"), str(vmname))
         self.uc.delete_virtualmachine(vmname)
+        self.deferred.removed(('instance', vmname))
         
     def update_instance(self, context, **kwargs):
         payload = kwargs['payload']
@@ -0,0 +1,174 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import time
+
+from nscs.ocas_utils.openstack.common.gettextutils import _
+from nscs.ocas_utils.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Snapshot creates reconciled against nscsas: resource kind, message type
+# of build_ucm_wsgi_msg (None to only check the object exists), update
+# method applied when the object differs and delete method applied when the
+# snapshot no longer has it (None to leave the object as is).
+RESOURCES = {
+    'create_virtual_network': ('network', 'create_network',
+                               'update_virtual_network',
+                               'delete_virtual_network'),
+    'create_subnet': ('subnet', 'create_subnet', 'update_subnet',
+                      'delete_subnet'),
+    'create_port': ('port', 'create_port', 'update_port', 'delete_port'),
+    'create_instance': ('instance', 'create_instance', 'update_instance',
+                        'delete_instance'),
+    'create_datapath': ('datapath', None, None, None),
+    'create_nwport': ('nwport', None, None, None),
+}
+
+# Payload field and nscsas field identifying the objects of each kind.
+# Network side ports get their nscsas id on create and are matched by name.
+KEYS = {
+    'network': ('network_id', 'id'),
+    'subnet': ('subnet_id', 'id'),
+    'port': ('port_id', 'id'),
+    'instance': ('instance_id', 'id'),
+    'datapath': ('datapath_id', 'id'),
+    'nwport': ('name', 'name'),
+}
+
+# Kinds whose stale objects are deleted, children first.
+DELETE_ORDER = ('port', 'instance', 'subnet', 'network')
+
+# Create body fields nscsas stores in another form, which are not compared.
+IGNORED_FIELDS = ('pools', 'dns_servers', 'host_routes', 'created_at',
+                  'bridge')
+
+
+class Reconciler(object):
+    """
+    Diff snapshot tiers against the objects nscsas already has, so that a
+    restarted consumer only sends the creates, updates and deletes needed
+    instead of creating every object again. build_body is the plugin
+    build_ucm_wsgi_msg.
+    """
+    def __init__(self, build_body):
+        self.build_body = build_body
+        self.current = {}
+        self.seen = set()
+        self.unchanged = {}
+        self.stats = {'listed': 0, 'created': 0, 'updated': 0, 'deleted': 0,
+                      'unchanged': 0, 'list_seconds': 0.0}
+
+    def load(self, client):
+        """
+        List the nscsas objects with the given client. Returns False when
+        listing failed, the snapshot is then applied as is.
+        """
+        start = time.time()
+        try:
+            current = {
+                'network': client.list_virtualnetworks()['virtualnetworks'],
+                'port': client.list_ports()['ports'],
+                'instance': client.list_virtualmachines()['virtualmachines'],
+                'datapath': client.list_datapaths()['datapaths'],
+                'nwport': client.list_nwports()['nwports'],
+                'subnet': [],
+            }
+            for network in current['network']:
+                for subnet in client.list_subnets(network['id'])['subnets']:
+                    current['subnet'].append(dict(subnet,
+                                                  nw_id=network['id']))
+        except Exception:
+            LOG.exception(_("Listing the nscsas objects failed, creating "
+                            "every snapshot object"))
+            return False
+        for kind, objects in current.iteritems():
+            field = KEYS[kind][1]
+            self.current[kind] = dict((obj[field], obj) for obj in objects)
+            self.stats['listed'] += len(objects)
+        self.stats['list_seconds'] = time.time() - start
+        LOG.info(_("Listed %s nscsas objects in %.3f seconds"),
+                 str(self.stats['listed']), self.stats['list_seconds'])
+        return True
+
+    def diff(self, tiers):
+        """
+        Return the tiers with the creates of unchanged objects removed and
+        the creates of changed ones turned into updates, and the messages
+        removed.
+        """
+        reduced = []
+        unchanged = []
+        for tier in tiers:
+            messages = []
+            for message in tier:
+                if message['method'] not in RESOURCES:
+                    messages.append(message)
+                    continue
+                kind, message_type, update, delete = \
+                    RESOURCES[message['method']]
+                key = message['payload'].get(KEYS[kind][0])
+                self.seen.add((kind, key))
+                obj = self.current.get(kind, {}).get(key)
+                if obj is None:
+                    self.stats['created'] += 1
+                    messages.append(message)
+                elif update is not None and self._differs(
+                        self.build_body(message['payload'], message_type),
+                        obj):
+                    self.stats['updated'] += 1
+                    messages.append(dict(message, method=update))
+                else:
+                    self.stats['unchanged'] += 1
+                    self.unchanged[message['method']] = \
+                        self.unchanged.get(message['method'], 0) + 1
+                    unchanged.append(message)
+            reduced.append(messages)
+        return reduced, unchanged
+
+    def deletes(self):
+        """
+        Tiers of the delete messages of the nscsas objects none of the
+        diffed tiers had.
+        """
+        deletes = dict((resource[0], resource[3])
+                       for resource in RESOURCES.itervalues())
+        tiers = []
+        for kind in DELETE_ORDER:
+            tier = []
+            for key, obj in self.current.get(kind, {}).iteritems():
+                if (kind, key) in self.seen:
+                    continue
+                payload = {KEYS[kind][0]: key}
+                if kind == 'subnet':
+                    payload['network_id'] = obj['nw_id']
+                tier.append({'method': deletes[kind], 'payload': payload})
+            self.stats['deleted'] += len(tier)
+            tiers.append(tier)
+        return tiers
+
+    def get_stats(self):
+        return dict(self.stats, unchanged_by_method=dict(self.unchanged))
+
+    def _differs(self, body, obj):
+        body = body.values()[0]
+        for field, value in body.iteritems():
+            if field in IGNORED_FIELDS or value is None or \
+                    obj.get(field) is None:
+                continue
+            if isinstance(obj[field], bool):
+                value = bool(value)
+            if unicode(value) != unicode(obj[field]):
+                return True
+        return False
@@ -0,0 +1,202 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+import threading
+import time
+
+from cns.common import wire
+from nscs.ocas_utils.openstack.common.gettextutils import _
+from nscs.ocas_utils.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Number of fetched ranges remembered to recognize late deltas
+FILLS_KEPT = 32
+
+
+class ReorderBuffer(object):
+    """
+    Apply {version: message} fanouts strictly in version order.
+
+    Deltas arriving after a missing version are held for up to window
+    seconds, or until max_pending deltas are held, waiting for it. The
+    missing range is then fetched with fetch(start_version, end_version),
+    which returns the deltas after start_version up to end_version, or
+    None when the CRD service no longer has them.
+
+    Versions this consumer does not get come as skip markers naming the
+    topic their delta is sent on, a marker standing for a single version
+    or for ranges of them: the consumer moves past them unless the topic
+    is one of the topics it listens on, in which case it waits for the
+    delta. A delta arriving after its version was passed over without
+    it, as part of a lost or fetched range, is applied late rather than
+    dropped.
+
+    Deltas are held until start is called with the version the consumer
+    init brought this consumer to.
+    """
+    def __init__(self, apply_message, fetch, window, max_pending):
+        self.apply_message = apply_message
+        self.fetch = fetch
+        self.window = window
+        self.max_pending = max_pending
+        self.lock = threading.RLock()
+        self.version = None
+        self.pending = {}
+        self.gap_since = None
+        self.timer = None
+        self.topics = []
+        self.fills = collections.deque(maxlen=FILLS_KEPT)
+        self.stats = {'applied': 0, 'held': 0, 'duplicates': 0, 'gaps': 0,
+                      'fetched': 0, 'lost': 0, 'skipped': 0, 'late': 0}
+
+    def start(self, version):
+        """
+        Apply the held deltas after the given version, which is the last
+        one applied by the consumer init.
+        """
+        with self.lock:
+            self.version = version
+            for held in [held for held in self.pending if held <= version]:
+                del self.pending[held]
+            self._drain()
+
+    def add(self, deltas):
+        with self.lock:
+            for version, message in deltas.iteritems():
+                version = int(version)
+                if not wire.is_skip_marker(message):
+                    self._add(version, message)
+                    continue
+                topic = message['payload'].get('topic')
+                if topic in self.topics:
+                    # The delta itself comes on a route topic
+                    continue
+                marker = wire.skip_marker(topic)
+                for skipped in wire.skipped_versions(version, message):
+                    self._add(skipped, marker)
+            if self.version is None:
+                if len(self.pending) > self.max_pending:
+                    LOG.warning(_("%s deltas held before the consumer init, "
+                                  "applying them"), str(len(self.pending)))
+                    self.start(min(self.pending) - 1)
+                return
+            self._drain()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, pending=len(self.pending),
+                        version=self.version)
+
+    def _add(self, version, message):
+        if self.version is not None and version <= self.version:
+            self._add_late(version, message)
+            return
+        if version in self.pending:
+            self.stats['duplicates'] += 1
+            return
+        if self.version is None or version > self.version + 1:
+            self.stats['held'] += 1
+        self.pending[version] = message
+
+    def _drain(self):
+        while self.pending:
+            message = self.pending.pop(self.version + 1, None)
+            if message is not None:
+                if wire.is_skip_marker(message):
+                    self.stats['skipped'] += 1
+                else:
+                    self.apply_message(message)
+                    self.stats['applied'] += 1
+                self.version += 1
+                continue
+            if self.gap_since is None:
+                self.gap_since = time.time()
+                self.stats['gaps'] += 1
+            waited = time.time() - self.gap_since
+            if waited < self.window and len(self.pending) < self.max_pending:
+                self._schedule(self.window - waited)
+                return
+            if not self._fill(min(self.pending) - 1):
+                return
+        self.gap_since = None
+
+    def _fill(self, end_version):
+        """
+        Fetch and apply the deltas missing up to end_version. Returns
+        False when the fetch failed and is retried after another window.
+        """
+        start_version = self.version
+        LOG.info(_("Fetching missed versions %s to %s"),
+                 str(start_version + 1), str(end_version))
+        try:
+            deltas = self.fetch(start_version, end_version)
+        except Exception:
+            LOG.exception(_("Fetching versions %s to %s failed"),
+                          str(start_version + 1), str(end_version))
+            self.gap_since = time.time()
+            self._schedule(self.window)
+            return False
+        if deltas is None:
+            LOG.error(_("Versions %s to %s are compacted in the CRD service "
+                        "and are lost for this consumer"),
+                      str(start_version + 1), str(end_version))
+            self.stats['lost'] += end_version - start_version
+            deltas = {}
+        fetched = set()
+        for version in sorted(deltas, key=int):
+            if start_version < int(version) <= end_version:
+                self.apply_message(deltas[version])
+                self.stats['fetched'] += 1
+                fetched.add(int(version))
+        # The versions of the range the CRD service did not return are
+        # passed over; should their delta still arrive it is applied late.
+        self.fills.append((start_version, end_version, fetched))
+        self.version = end_version
+        self.gap_since = None
+        return True
+
+    def _add_late(self, version, message):
+        """
+        Handle a delta for a version this consumer already moved past:
+        apply it when the version was passed over without its delta,
+        drop it as a duplicate otherwise.
+        """
+        if not wire.is_skip_marker(message):
+            for start_version, end_version, fetched in self.fills:
+                if start_version < version <= end_version and \
+                        version not in fetched:
+                    LOG.warning(_("Applying version %s, which arrived "
+                                  "after its range was passed over"),
+                                str(version))
+                    fetched.add(version)
+                    self.apply_message(message)
+                    self.stats['late'] += 1
+                    return
+        LOG.debug(_("Dropping duplicate version %s"), str(version))
+        self.stats['duplicates'] += 1
+
+    def _schedule(self, delay):
+        if self.timer is not None:
+            return
+        self.timer = threading.Timer(delay, self._expired)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _expired(self):
+        with self.lock:
+            self.timer = None
+            if self.version is not None:
+                self._drain()
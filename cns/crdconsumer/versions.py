@@ -0,0 +1,63 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+import threading
+
+
+class VersionMap(object):
+    """
+    Last applied delta version of each resource, keyed by a (kind, id)
+    pair such as ('port', port_id). At most size resources are kept, the
+    least recently used ones are evicted first. An evicted resource is
+    simply applied again, as before the map existed.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.versions = collections.OrderedDict()
+        self.stats = {'skipped': 0, 'evicted': 0}
+
+    def is_stale(self, key, version):
+        """
+        Whether a delta of the given version is at or below the version
+        last applied to the resource.
+        """
+        with self.lock:
+            applied = self.versions.get(key)
+            if applied is None:
+                return False
+            # Keep the entry the most recently used one
+            del self.versions[key]
+            self.versions[key] = applied
+            if version <= applied:
+                self.stats['skipped'] += 1
+                return True
+            return False
+
+    def applied(self, key, version):
+        if self.size <= 0:
+            return
+        with self.lock:
+            applied = self.versions.pop(key, None)
+            if applied is not None and applied > version:
+                version = applied
+            self.versions[key] = version
+            while len(self.versions) > self.size:
+                self.versions.popitem(last=False)
+                self.stats['evicted'] += 1
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, resources=len(self.versions))
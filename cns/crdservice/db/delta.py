@@ -15,6 +15,8 @@
 from nscs.crdservice.db import db_base_plugin_v2
 import sqlalchemy as sa
 from sqlalchemy import orm
+from sqlalchemy.dialects import mysql
+from sqlalchemy.engine import reflection
 from sqlalchemy.orm import exc, relationship, backref
 import netaddr
 from nscs.crdservice.db import sqlalchemyutils
@@ -28,6 +30,7 @@ from nscs.crdservice.openstack.common import timeutils
 from nscs.crdservice.db import api as db
 from oslo.config import cfg
 import datetime
+import time
 import uuid
 
 
@@ -35,6 +38,32 @@ import uuid
 
 LOG = logging.getLogger(__name__)
 
+# Record every delta in cns_delta_outbox for the outbox publisher instead
+# of sending it from the API call.
+# Seconds after which a runtime version reservation whose deltas were not
+# committed no longer holds back the current version.
+cns_version_opts = [
+    cfg.BoolOpt('fanout_outbox', default=False),
+    cfg.IntOpt('version_reservation_timeout', default=60),
+]
+
+cfg.CONF.register_opts(cns_version_opts, "CNSDELTA")
+
+# Attempts at reserving a block of runtime versions
+VERSION_RESERVE_ATTEMPTS = 3
+
+
+class _SessionContext(object):
+    """A context on a DB session of its own."""
+    def __init__(self, context):
+        self._context = context
+        self.session = orm.Session(bind=context.session.bind,
+                                   autocommit=True, expire_on_commit=False)
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+
 class HasTenant(object):
     """Tenant mixin, add to subclasses that have a tenant."""
 
@@ -151,10 +180,567 @@ class cns_nwport_delta(model_base.BASEV2, HasId):
     operation = sa.Column(sa.String(255), nullable=False)
     logged_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False) 
+
+
+# Delta lookups filter on the resource id and order by version, tails scan
+# by version and retention by logged_at. Index keys stay short enough for
+# MySQL utf8 columns (767 bytes).
+DELTA_INDEXES = []
+for _model, _key in ((cns_compute_delta, 'compute_id'),
+                     (cns_network_delta, 'network_id'),
+                     (cns_subnet_delta, 'subnet_id'),
+                     (cns_port_delta, 'port_id'),
+                     (cns_instance_delta, 'instance_id'),
+                     (cns_nwport_delta, 'nwport_id')):
+    _table = _model.__tablename__
+    DELTA_INDEXES.extend([
+        sa.Index('ix_%s_%s_version_id' % (_table, _key),
+                 getattr(_model, _key), _model.version_id),
+        sa.Index('ix_%s_version_id' % _table, _model.version_id),
+        sa.Index('ix_%s_logged_at' % _table, _model.logged_at)])
+
+
+def create_delta_indexes(engine):
+    """
+    Migrate an existing schema by creating the delta table indexes it
+    lacks. register_models only creates missing tables, so indexes added
+    to tables that already exist are created here. An index which cannot
+    be created is logged and skipped, the service runs without it.
+    """
+    try:
+        inspector = reflection.Inspector.from_engine(engine)
+        tables = inspector.get_table_names()
+    except Exception:
+        LOG.exception(_("Unable to inspect the schema, delta table indexes "
+                        "are not checked"))
+        return
+    existing = {}
+    for index in DELTA_INDEXES:
+        table = index.table.name
+        if table not in tables:
+            continue
+        try:
+            if table not in existing:
+                existing[table] = [i['name']
+                                   for i in inspector.get_indexes(table)]
+            if index.name not in existing[table]:
+                LOG.info(_("Creating index %s on %s"), index.name, table)
+                index.create(bind=engine)
+        except Exception:
+            LOG.exception(_("Unable to create index %s on %s"), index.name,
+                          table)
+
+
+class cns_consumer_version(model_base.BASEV2):
+    """Latest runtime version acknowledged by each CRD consumer."""
+    consumer = sa.Column(sa.String(255), primary_key=True)
+    version_id = sa.Column(sa.Integer, nullable=False)
+    updated_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
+
+
+class cns_delta_compaction(model_base.BASEV2, HasId):
+    """One run of the delta table compactor."""
+    watermark = sa.Column(sa.Integer, nullable=False)
+    reclaimed = sa.Column(sa.Integer, nullable=False)
+    duration = sa.Column(sa.Float, nullable=False)
+    compacted_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
+
+
+
+class cns_delta_outbox(model_base.BASEV2):
+    """Delta recorded but not yet sent to the CRD consumers."""
+    version_id = sa.Column(sa.Integer, primary_key=True, autoincrement=False)
+    resource = sa.Column(sa.String(16), nullable=False)
+    created_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
+    claimed_at = sa.Column(sa.DateTime)
+
+
+class cns_init_page(model_base.BASEV2, HasId):
+    """Compressed page of a paged consumer init, as sent to the consumer."""
+    init_id = sa.Column(sa.String(36), nullable=False, index=True)
+    page = sa.Column(sa.Integer, nullable=False)
+    data = sa.Column(sa.LargeBinary().with_variant(mysql.LONGBLOB(), 'mysql'),
+                     nullable=False)
+    created_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
+
+
+class cns_version_lock(model_base.BASEV2):
+    """Single row locked while runtime versions are reserved."""
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=False)
+
+
+class cns_version_reservation(model_base.BASEV2):
+    """Block of runtime versions whose deltas are not committed yet."""
+    first_version = sa.Column(sa.Integer, primary_key=True, autoincrement=False)
+    last_version = sa.Column(sa.Integer, nullable=False)
+    reserved_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
+
+
+class cns_snapshot(model_base.BASEV2, HasId):
+    """Compressed CNS state materialized at a runtime version."""
+    version_id = sa.Column(sa.Integer, nullable=False, index=True)
+    entries = sa.Column(sa.Integer, nullable=False)
+    size = sa.Column(sa.Integer, nullable=False)
+    data = sa.Column(sa.LargeBinary().with_variant(mysql.LONGBLOB(), 'mysql'),
+                     nullable=False)
+    created_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
+
    
 class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
-    
-    
+
+    def get_current_version(self, context):
+        """
+        Return the latest runtime version up to which every delta is
+        committed: the highest crd_versions key, held below the first
+        version of any reservation whose deltas are not committed yet.
+        runtime_version is the primary key of crd_versions, so MAX() is
+        answered from the index.
+        """
+        versions = model_base.BASEV2.metadata.tables['crd_versions']
+        query = context.session.query(sa.func.max(versions.c.runtime_version))
+        current = query.scalar() or 0
+        live = datetime.datetime.now() - datetime.timedelta(
+            seconds=cfg.CONF.CNSDELTA.version_reservation_timeout)
+        pending = context.session.query(
+            sa.func.min(cns_version_reservation.first_version)).\
+            filter(cns_version_reservation.reserved_at >= live).scalar()
+        if pending is not None:
+            current = min(current, pending - 1)
+        return current
+
+    def allocate_versions(self, context, tenants):
+        """
+        Reserve one runtime version per tenant in the list, as a single
+        contiguous block, and release the reservation in the transaction
+        of the caller, which records the deltas using the versions.
+
+        The block is reserved in a short transaction of its own, which
+        locks the cns_version_lock row, takes the first version from
+        create_version, inserts the rest of the block with one executemany
+        from a copy of its row and records the block as reserved. Writers
+        only wait on one another for that transaction, not for their
+        deltas, so deltas can commit out of version order. Consumers apply
+        late deltas through their reorder buffer, and get_current_version
+        stays below the reservations which are not released yet.
+        """
+        for attempt in range(1, VERSION_RESERVE_ATTEMPTS + 1):
+            try:
+                first = self._reserve_versions(context, tenants)
+                break
+            except Exception:
+                if attempt == VERSION_RESERVE_ATTEMPTS:
+                    raise
+                LOG.warning(_("Reserving %s runtime versions failed, "
+                              "retrying"), str(len(tenants)))
+        with context.session.begin(subtransactions=True):
+            context.session.query(cns_version_reservation).\
+                filter(cns_version_reservation.first_version == first).\
+                delete(synchronize_session=False)
+        return range(first, first + len(tenants))
+
+    def _reserve_versions(self, context, tenants):
+        """
+        Insert and commit the crd_versions rows of a block of versions
+        together with its reservation, on a session apart from the one of
+        the given context. Returns the first version.
+        """
+        versions = model_base.BASEV2.metadata.tables['crd_versions']
+        now = datetime.datetime.now()
+        expired = now - datetime.timedelta(
+            seconds=cfg.CONF.CNSDELTA.version_reservation_timeout)
+        context = _SessionContext(context)
+        session = context.session
+        with session.begin():
+            lock = session.query(cns_version_lock).\
+                filter(cns_version_lock.id == 1).\
+                with_lockmode('update').first()
+            if lock is None:
+                session.add(cns_version_lock(id=1))
+                session.flush()
+            first = self.create_version(context, tenants[0])
+            if len(tenants) > 1:
+                template = dict(session.execute(
+                    versions.select().where(
+                        versions.c.runtime_version == first)).first())
+                rows = []
+                for offset, tenant in enumerate(tenants[1:], 1):
+                    row = dict(template, runtime_version=first + offset)
+                    if 'tenant_id' in versions.c:
+                        row['tenant_id'] = tenant
+                    for column in versions.primary_key:
+                        if column.name != 'runtime_version':
+                            row[column.name] = str(uuid.uuid4())
+                    rows.append(row)
+                session.execute(versions.insert(), rows)
+                self._advance_version_sequence(session,
+                                               first + len(tenants) - 1)
+            # Reservations of writes which were rolled back
+            session.query(cns_version_reservation).\
+                filter(cns_version_reservation.reserved_at < expired).\
+                delete(synchronize_session=False)
+            session.add(cns_version_reservation(
+                first_version=first, last_version=first + len(tenants) - 1,
+                reserved_at=now))
+        return first
+
+    def _advance_version_sequence(self, session, version):
+        """
+        Move the sequence generating crd_versions keys past a version
+        inserted with an explicit key, so that create_version does not
+        hand it out again. Only PostgreSQL needs this: MySQL and SQLite
+        move their autoincrement past explicit keys themselves. The
+        sequence is never moved back.
+        """
+        if session.bind.dialect.name != 'postgresql':
+            return
+        session.execute(sa.text(
+            "SELECT setval(serial.name::regclass, "
+            "GREATEST(:version, nextval(serial.name::regclass))) "
+            "FROM (SELECT pg_get_serial_sequence('crd_versions', "
+            "'runtime_version') AS name) AS serial "
+            "WHERE serial.name IS NOT NULL"), {'version': version})
+
+    def create_deltas_bulk(self, context, deltas):
+        """
+        Record a list of (resource, delta) pairs of any delta table in one
+        transaction, with one version block and one executemany per delta
+        table. Each delta is a dict as passed to the matching
+        create_<resource>_delta. Returns the recorded deltas, as the
+        create_<resource>_delta methods do, in list order.
+        """
+        if not deltas:
+            return []
+        models = dict((resource, (model, make_dict))
+                      for resource, model, key, make_dict in self._delta_tables())
+        tenants = []
+        for resource, record in deltas:
+            if resource in ('compute', 'nwport'):
+                tenants.append('Nova')
+            else:
+                tenants.append(record['tenant_id'])
+        now = datetime.datetime.now()
+        with context.session.begin(subtransactions=True):
+            version_ids = self.allocate_versions(context, tenants)
+            rows = {}
+            records = []
+            for (resource, record), version_id in zip(deltas, version_ids):
+                table = models[resource][0].__table__
+                row = dict((column.name, record.get(column.name))
+                           for column in table.columns)
+                if resource == 'nwport':
+                    row['nwport_id'] = record['id']
+                elif resource in ('network', 'subnet', 'port'):
+                    row['user_id'] = context.user_id
+                row.update({'id': str(uuid.uuid4()),
+                            'logged_at': now,
+                            'version_id': version_id})
+                rows.setdefault(resource, []).append(row)
+                records.append(models[resource][1](row))
+            for resource, table_rows in rows.iteritems():
+                context.session.execute(models[resource][0].__table__.insert(),
+                                        table_rows)
+            self.add_outbox(context, zip([resource for resource, record
+                                          in deltas], version_ids))
+        return records
+
+    def add_outbox(self, context, entries):
+        """
+        Record (resource, version) pairs in the outbox, in the transaction
+        of their deltas, when the outbox publisher sends the deltas.
+        """
+        if not cfg.CONF.CNSDELTA.fanout_outbox:
+            return
+        now = datetime.datetime.now()
+        context.session.execute(cns_delta_outbox.__table__.insert(),
+                                [{'version_id': version_id,
+                                  'resource': resource,
+                                  'created_at': now}
+                                 for resource, version_id in entries])
+
+    def claim_outbox(self, context, limit, expired):
+        """
+        Claim and return the oldest outbox versions which are not claimed,
+        or whose claim is older than the given time. The rows are only
+        locked by the short transaction making the claim, which commits
+        before the versions are sent; the publishers of other workers
+        claim the versions after them in the meantime.
+        """
+        with context.session.begin(subtransactions=True):
+            query = context.session.query(cns_delta_outbox.version_id).\
+                filter(sa.or_(cns_delta_outbox.claimed_at == None,
+                              cns_delta_outbox.claimed_at < expired)).\
+                order_by(cns_delta_outbox.version_id).limit(limit).\
+                with_lockmode('update')
+            versions = [version_id for version_id, in query]
+            if versions:
+                context.session.query(cns_delta_outbox).\
+                    filter(cns_delta_outbox.version_id.in_(versions)).\
+                    update({'claimed_at': datetime.datetime.now()},
+                           synchronize_session=False)
+        return versions
+
+    def release_outbox(self, context, versions):
+        """
+        Release the claim on outbox versions which could not be sent.
+        """
+        with context.session.begin(subtransactions=True):
+            context.session.query(cns_delta_outbox).\
+                filter(cns_delta_outbox.version_id.in_(versions)).\
+                update({'claimed_at': None}, synchronize_session=False)
+
+    def delete_outbox(self, context, versions):
+        with context.session.begin(subtransactions=True):
+            context.session.query(cns_delta_outbox).\
+                filter(cns_delta_outbox.version_id.in_(versions)).\
+                delete(synchronize_session=False)
+
+    def get_snapshot_rows(self, context, model, model_key,
+                          delta_model, delta_key):
+        """
+        Return (row, version_id) pairs for every row of a resource table,
+        where version_id is the latest 'create' delta of that resource.
+        The latest versions are resolved with a single grouped MAX()
+        sub-query joined to the resource table, so the whole table is
+        fetched in one statement.
+        """
+        delta_column = getattr(delta_model, delta_key)
+        latest = context.session.query(
+            delta_column.label('resource_id'),
+            sa.func.max(delta_model.version_id).label('version_id')).\
+            filter(delta_model.operation == 'create').\
+            group_by(delta_column).subquery()
+        query = context.session.query(model, latest.c.version_id).\
+            outerjoin(latest,
+                      getattr(model, model_key) == latest.c.resource_id)
+        return query.all()
+
+    def _delta_tables(self):
+        """
+        (resource, delta model, resource key, dict builder) for every CNS
+        delta table.
+        """
+        return [('network', cns_network_delta, 'network_id',
+                 self._make_network_delta_dict),
+                ('subnet', cns_subnet_delta, 'subnet_id',
+                 self._make_subnet_delta_dict),
+                ('compute', cns_compute_delta, 'compute_id',
+                 self._make_compute_delta_dict),
+                ('nwport', cns_nwport_delta, 'nwport_id',
+                 self._make_nwport_delta_dict),
+                ('instance', cns_instance_delta, 'instance_id',
+                 self._make_instance_delta_dict),
+                ('port', cns_port_delta, 'port_id',
+                 self._make_port_delta_dict)]
+
+    def get_deltas_since(self, context, version, end_version=None):
+        """
+        Return the deltas of all CNS delta tables whose version is greater
+        than the given version (and not above end_version, when given) as
+        (resource, delta) pairs merged in version order.
+        """
+        deltas = []
+        for resource, model, key, make_dict in self._delta_tables():
+            query = context.session.query(model).\
+                filter(model.version_id > version)
+            if end_version is not None:
+                query = query.filter(model.version_id <= end_version)
+            deltas.extend((resource, make_dict(row)) for row in query)
+        deltas.sort(key=lambda d: d[1]['version_id'])
+        return deltas
+
+    def get_deltas_at(self, context, versions):
+        """
+        Return the deltas of the given versions as (resource, delta) pairs
+        in version order.
+        """
+        deltas = []
+        for resource, model, key, make_dict in self._delta_tables():
+            query = context.session.query(model).\
+                filter(model.version_id.in_(versions))
+            deltas.extend((resource, make_dict(row)) for row in query)
+        deltas.sort(key=lambda d: d[1]['version_id'])
+        return deltas
+
+    def record_consumer_version(self, context, consumer, version):
+        """
+        Store the runtime version a consumer has acknowledged.
+        """
+        with context.session.begin(subtransactions=True):
+            query = context.session.query(cns_consumer_version)
+            record = query.filter(cns_consumer_version.consumer == consumer).first()
+            if record is None:
+                record = cns_consumer_version(consumer=consumer)
+                context.session.add(record)
+            record.version_id = version
+            record.updated_at = datetime.datetime.now()
+
+    def delete_consumer_versions(self, context, before):
+        """
+        Forget the consumers which acknowledged no version since the given
+        time and return how many were forgotten.
+        """
+        with context.session.begin(subtransactions=True):
+            query = context.session.query(cns_consumer_version)
+            return query.filter(cns_consumer_version.updated_at < before).\
+                delete(synchronize_session=False)
+
+    def get_acked_version(self, context):
+        """
+        Return the lowest version acknowledged by any consumer, or None
+        when no consumer is known.
+        """
+        query = context.session.query(sa.func.min(cns_consumer_version.version_id))
+        return query.scalar()
+
+    def get_compacted_version(self, context):
+        """
+        Return the highest watermark the delta tables were compacted to.
+        Tails starting below it are incomplete.
+        """
+        query = context.session.query(sa.func.max(cns_delta_compaction.watermark))
+        return query.scalar() or 0
+
+    def get_version_logged_before(self, context, logged_at):
+        """
+        Return the highest delta version logged before the given time.
+        """
+        version = 0
+        for resource, model, key, make_dict in self._delta_tables():
+            query = context.session.query(sa.func.max(model.version_id)).\
+                filter(model.logged_at < logged_at)
+            version = max(version, query.scalar() or 0)
+        return version
+
+    def compact_deltas(self, context, watermark, start):
+        """
+        Collapse the delta chain of every resource up to the watermark
+        into its net effect. A chain ending in a delete is removed along
+        with its tombstone, any other chain is reduced to its latest row,
+        which is kept as a create when the chain started with one.
+
+        Each table is compacted with three set-based statements, so no
+        row is read into memory. All tables are compacted and the run
+        recorded with the watermark, timed from the given start time, in
+        one transaction: tails are never served from a table compacted
+        past the recorded watermark. Returns the number of rows reclaimed.
+        """
+        reclaimed = 0
+        with context.session.begin(subtransactions=True):
+            for resource, model, key, make_dict in self._delta_tables():
+                reclaimed += self._compact_table(context, model,
+                                                 getattr(model, key),
+                                                 watermark)
+            compaction = cns_delta_compaction(id=str(uuid.uuid4()),
+                                              watermark=watermark,
+                                              reclaimed=reclaimed,
+                                              duration=time.time() - start,
+                                              compacted_at=datetime.datetime.now())
+            context.session.add(compaction)
+        return reclaimed
+
+    def _compact_table(self, context, model, key_column, watermark):
+        """
+        Compact one delta table up to the watermark and return the number
+        of rows deleted. The latest version of each chain is read from a
+        derived table, which MySQL materializes before it changes the
+        table it is read from.
+        """
+        chains = context.session.query(
+            sa.func.max(model.version_id).label('version_id')).\
+            filter(model.version_id <= watermark).\
+            group_by(key_column)
+        created = chains.having(sa.func.sum(
+            sa.case([(model.operation == 'create', 1)], else_=0)) > 0)
+        latest = chains.subquery()
+        created = created.subquery()
+        context.session.query(model).\
+            filter(model.version_id.in_(sa.select([created.c.version_id]))).\
+            filter(~model.operation.in_(['create', 'delete'])).\
+            update({'operation': 'create'}, synchronize_session=False)
+        superseded = context.session.query(model).\
+            filter(model.version_id <= watermark).\
+            filter(~model.version_id.in_(sa.select([latest.c.version_id]))).\
+            delete(synchronize_session=False)
+        # What is left up to the watermark is the latest row of each
+        # chain, the chains ending in a delete go with their tombstone.
+        tombstones = context.session.query(model).\
+            filter(model.version_id <= watermark).\
+            filter(model.operation == 'delete').\
+            delete(synchronize_session=False)
+        return superseded + tombstones
+
+    def create_snapshot(self, context, version, entries, data):
+        with context.session.begin(subtransactions=True):
+            snapshot = cns_snapshot(id=str(uuid.uuid4()),
+                                    version_id=version,
+                                    entries=entries,
+                                    size=len(data),
+                                    data=data,
+                                    created_at=datetime.datetime.now())
+            context.session.add(snapshot)
+
+    def get_latest_snapshot(self, context, fields=None):
+        """
+        Return the most recent snapshot as a dict, or None. The compressed
+        state is only loaded when 'data' is part of the requested fields.
+        """
+        fields = fields or ['version_id', 'entries', 'size', 'created_at']
+        columns = [getattr(cns_snapshot, field) for field in fields]
+        row = context.session.query(*columns).\
+            order_by(cns_snapshot.version_id.desc()).first()
+        if row is None:
+            return None
+        return dict(zip(fields, row))
+
+    def delete_snapshots(self, context, keep):
+        """
+        Delete all but the given number of most recent snapshots.
+        """
+        query = context.session.query(cns_snapshot.id).\
+            order_by(cns_snapshot.version_id.desc())
+        stale = [row[0] for row in query.offset(keep)]
+        if stale:
+            with context.session.begin(subtransactions=True):
+                context.session.query(cns_snapshot).\
+                    filter(cns_snapshot.id.in_(stale)).\
+                    delete(synchronize_session=False)
+
+    def create_init_pages(self, context, init_id, pages):
+        """
+        Store the compressed pages of a paged init, in page order.
+        """
+        if not pages:
+            return
+        now = datetime.datetime.now()
+        with context.session.begin(subtransactions=True):
+            context.session.execute(cns_init_page.__table__.insert(),
+                                    [{'id': str(uuid.uuid4()),
+                                      'init_id': init_id,
+                                      'page': page,
+                                      'data': data,
+                                      'created_at': now}
+                                     for page, data in enumerate(pages)])
+
+    def get_init_page(self, context, init_id, page):
+        """
+        Return a compressed page of a paged init, or None when it is gone.
+        """
+        row = context.session.query(cns_init_page.data).\
+            filter(cns_init_page.init_id == init_id).\
+            filter(cns_init_page.page == page).first()
+        if row is None:
+            return None
+        return row[0]
+
+    def delete_init_pages(self, context, before):
+        """
+        Delete the pages of the paged inits started before the given time.
+        """
+        with context.session.begin(subtransactions=True):
+            context.session.query(cns_init_page).\
+                filter(cns_init_page.created_at < before).\
+                delete(synchronize_session=False)
+
     def _make_network_delta_dict(self, networkdelta, fields=None):
         res = {'tenant_id': networkdelta['tenant_id'],
                'id': networkdelta['id'],
@@ -185,7 +771,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
         tenant_id=networkdelta['tenant_id']
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_versions(context, [tenant_id])[0]
             network_delta = cns_network_delta(id=str(uuid.uuid4()),
                                         tenant_id=networkdelta['tenant_id'],
                                         name=networkdelta['name'],
@@ -201,6 +787,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                         logged_at=datetime.datetime.now(),
                                         version_id=version_id)
             context.session.add(network_delta)
+            self.add_outbox(context, [('network', version_id)])
             
         return self._make_network_delta_dict(network_delta)
     
@@ -233,7 +820,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
         tenant_id=subnetdelta['tenant_id']
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_versions(context, [tenant_id])[0]
             subnet_delta = cns_subnet_delta(id=str(uuid.uuid4()),
                                         tenant_id=subnetdelta['tenant_id'],
                                         name=subnetdelta['name'],
@@ -250,6 +837,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                         logged_at=datetime.datetime.now(),
                                         version_id=version_id)
             context.session.add(subnet_delta)
+            self.add_outbox(context, [('subnet', version_id)])
     
         return self._make_subnet_delta_dict(subnet_delta)
     
@@ -285,7 +873,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
         tenant_id=portdelta['tenant_id']
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_versions(context, [tenant_id])[0]
             port_delta = cns_port_delta(id=str(uuid.uuid4()),
                                         tenant_id=portdelta['tenant_id'],
                                         name=portdelta['name'],
@@ -304,6 +892,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                         logged_at=datetime.datetime.now(),
                                         version_id=version_id)
             context.session.add(port_delta)
+            self.add_outbox(context, [('port', version_id)])
         return self._make_port_delta_dict(port_delta)
     
     
@@ -336,7 +925,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         computedelta = compute['compute_delta']
         LOG.debug(_('create_compute_delta db %s'), str(computedelta))
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, 'Nova')
+            version_id = self.allocate_versions(context, ['Nova'])[0]
             compute_delta = cns_compute_delta(id=str(uuid.uuid4()),
                                         compute_id = computedelta['compute_id'],
                                         hostname = computedelta['hostname'],
@@ -354,6 +943,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                         logged_at=datetime.datetime.now(),
                                         version_id=version_id)
             context.session.add(compute_delta)
+            self.add_outbox(context, [('compute', version_id)])
             
         return self._make_compute_delta_dict(compute_delta)
         
@@ -388,7 +978,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
         tenant_id=instancedelta['tenant_id']
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_versions(context, [tenant_id])[0]
             instance_delta = cns_instance_delta(id=str(uuid.uuid4()),
                                         tenant_id = instancedelta['tenant_id'],
                                         display_name = instancedelta['display_name'],
@@ -406,6 +996,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                         logged_at = datetime.datetime.now(),
                                         version_id = version_id)
             context.session.add(instance_delta)
+            self.add_outbox(context, [('instance', version_id)])
             
         return self._make_instance_delta_dict(instance_delta)
         
@@ -441,7 +1032,7 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         nwportdelta = nwport['nwport_delta']
         LOG.debug(_('create_nwport_delta db %s'), str(nwportdelta))
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, 'Nova')
+            version_id = self.allocate_versions(context, ['Nova'])[0]
             nwport_delta = cns_nwport_delta(id=str(uuid.uuid4()),
                                         nwport_id = nwportdelta['id'],
                                         name = nwportdelta['name'],
@@ -460,5 +1051,6 @@ class CnsDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                         logged_at=datetime.datetime.now(),
                                         version_id=version_id)
             context.session.add(nwport_delta)
+            self.add_outbox(context, [('nwport', version_id)])
             
         return self._make_nwport_delta_dict(nwport_delta)
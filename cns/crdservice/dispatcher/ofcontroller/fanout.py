@@ -0,0 +1,321 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+from nscs.crdservice.openstack.common import log as logging
+from oslo.config import cfg
+
+from cns.common import wire
+from cns.crdservice.db import nova as nova_db
+
+import bisect
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+# Fanout coalescing: milliseconds a delta may wait for others before the
+# batch is sent (0 sends every delta on its own), number of deltas that
+# sends a batch right away and number of batches between two reports of
+# the batch histograms.
+# Delivery: 'broadcast' sends every delta on crd-consumer, 'cluster' and
+# 'cell' send the deltas of a compute node on crd-consumer.<cluster id>
+# or crd-consumer.<cell> of the controller of its datapath, and seconds
+# a compute node route is cached.
+# Wire format of the deltas sent on routed topics: 'json' for the RPC
+# layer format, or one of wire.formats(), such as 'cns1+json', once every
+# consumer announces it.
+cns_fanout_opts = [
+    cfg.IntOpt('coalesce_window_ms', default=0),
+    cfg.IntOpt('coalesce_max_entries', default=100),
+    cfg.IntOpt('report_batches', default=1000),
+    cfg.StrOpt('routing', default='broadcast'),
+    cfg.IntOpt('route_cache_ttl', default=60),
+    cfg.StrOpt('wire_format', default='json'),
+]
+
+cfg.CONF.register_opts(cns_fanout_opts, "CNSFANOUT")
+
+CONSUMER_TOPIC = "crd-consumer"
+
+# Consumer methods of deltas that belong to a single compute node, and the
+# payload field naming the node (or the instance, for ports).
+ROUTED_METHODS = {
+    'create_datapath': 'hostname',
+    'create_nwport': 'host',
+    'create_instance': 'host',
+    'update_instance': 'host',
+    'delete_instance': 'host',
+    'create_port': 'device_id',
+    'update_port': 'device_id',
+    'delete_port': 'device_id',
+}
+
+BATCH_SIZE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+FLUSH_LATENCY_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+class Histogram(object):
+    """
+    Counts of recorded values per bucket, a bucket being the values up to
+    its upper bound. Values above the last bound are counted in an
+    overflow bucket.
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def to_dict(self):
+        buckets = {}
+        for bound, count in zip(self.bounds, self.counts):
+            buckets['le_%s' % bound] = count
+        buckets['overflow'] = self.counts[-1]
+        return {'buckets': buckets, 'count': self.count,
+                'mean': self.count and float(self.total) / self.count}
+
+
+class FanoutBatcher(object):
+    """
+    Coalesce the {version: message} fanouts of a crdservice process into
+    versioned batches sent to the CRD consumers. A batch is sent
+    coalesce_window_ms after its first delta, or as soon as it holds
+    coalesce_max_entries deltas, whichever comes first.
+    """
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.context = None
+        self.method = None
+        self.started = None
+        self.timer = None
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.flush_latency = Histogram(FLUSH_LATENCY_BUCKETS)
+
+    def add(self, context, method, payload):
+        with self.lock:
+            if self.pending and method != self.method:
+                batch = self._take()
+            else:
+                batch = None
+            if not self.pending:
+                self.context = context
+                self.method = method
+                self.started = time.time()
+                self.timer = threading.Timer(
+                    cfg.CONF.CNSFANOUT.coalesce_window_ms / 1000.0,
+                    self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+            self.pending.update(payload)
+            if len(self.pending) >= cfg.CONF.CNSFANOUT.coalesce_max_entries:
+                full = self._take()
+            else:
+                full = None
+        for taken in (batch, full):
+            if taken is not None:
+                self._send(*taken)
+
+    def flush(self):
+        with self.lock:
+            taken = self._take()
+        if taken is not None:
+            self._send(*taken)
+
+    def stats(self):
+        with self.lock:
+            return {'batch_size': self.batch_size.to_dict(),
+                    'flush_latency_ms': self.flush_latency.to_dict()}
+
+    def _take(self):
+        if not self.pending:
+            return None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        taken = (self.context, self.method, self.pending)
+        self.pending = {}
+        self.batch_size.record(len(taken[2]))
+        self.flush_latency.record((time.time() - self.started) * 1000)
+        return taken
+
+    def _send(self, context, method, batch):
+        LOG.debug(_("Sending fanout batch of %s deltas"), str(len(batch)))
+        try:
+            cast(self.proxy, context, method, batch)
+        except Exception:
+            LOG.exception(_("Fanout of %s deltas failed"), str(len(batch)))
+        if self.batch_size.count % cfg.CONF.CNSFANOUT.report_batches == 0:
+            LOG.info(_("Fanout batches: %s"), str(self.stats()))
+
+
+class DeltaRouter(object):
+    """
+    Resolve the topic of {version: message} deltas from the compute node
+    they affect: compute node, datapath, switch, then the cluster or the
+    controller cell of the switch. Deltas of global objects, or whose
+    node is unknown, stay on the crd-consumer topic.
+    """
+    def __init__(self):
+        self.routes = {}
+        # Host of the instances of the port deltas, cached like the routes
+        self.hosts = {}
+        self.swept_at = time.time()
+
+    def split(self, context, payload):
+        """
+        Group the deltas of a payload by topic.
+        """
+        topics = {}
+        for version, message in payload.iteritems():
+            topic = self.get_topic(context, message)
+            topics.setdefault(topic, {})[version] = message
+        return topics
+
+    def get_topic(self, context, message):
+        field = ROUTED_METHODS.get(message['method'])
+        if field is None:
+            return CONSUMER_TOPIC
+        host = message['payload'].get(field)
+        if field == 'device_id':
+            host = self._get_instance_host(context, host)
+        elif message['payload'].get('instance_id'):
+            # Instance deltas bring the host their ports are routed by
+            self._cache_instance_host(message['payload']['instance_id'],
+                                      host)
+        route = self._get_route(context, host)
+        if not route:
+            return CONSUMER_TOPIC
+        return '%s.%s' % (CONSUMER_TOPIC, route)
+
+    def _get_instance_host(self, context, instance_id):
+        if not instance_id:
+            return None
+        cached = self.hosts.get(instance_id)
+        if cached is not None and cached[1] > time.time():
+            return cached[0]
+        instance = context.session.query(nova_db.cns_instance.host).\
+            filter_by(instance_id=instance_id).first()
+        host = instance and instance.host
+        self._cache_instance_host(instance_id, host)
+        return host
+
+    def _cache_instance_host(self, instance_id, host):
+        now = time.time()
+        ttl = cfg.CONF.CNSFANOUT.route_cache_ttl
+        self.hosts[instance_id] = (host, now + ttl)
+        if now - self.swept_at >= ttl:
+            # Drop the instances no delta asked for during a whole ttl
+            for cached_id, cached in self.hosts.items():
+                if cached[1] <= now:
+                    self.hosts.pop(cached_id, None)
+            self.swept_at = now
+
+    def _get_route(self, context, host):
+        if not host:
+            return None
+        cached = self.routes.get(host)
+        if cached is not None and cached[1] > time.time():
+            return cached[0]
+        query = context.session.query(nova_db.OpenflowSwitch.cluster_id,
+                                      nova_db.OpenflowController.cell).\
+            join(nova_db.cns_compute,
+                 nova_db.cns_compute.datapath_id ==
+                 nova_db.OpenflowSwitch.datapath_id).\
+            outerjoin(nova_db.OpenflowController,
+                      nova_db.OpenflowController.id ==
+                      nova_db.OpenflowSwitch.controller_id).\
+            filter(nova_db.cns_compute.hostname == host)
+        switch = query.first()
+        route = None
+        if switch is not None:
+            if cfg.CONF.CNSFANOUT.routing == 'cell':
+                route = switch.cell
+            else:
+                route = switch.cluster_id
+        self.routes[host] = (route,
+                             time.time() + cfg.CONF.CNSFANOUT.route_cache_ttl)
+        return route
+
+
+_batcher = None
+_router = None
+
+
+def coalescing():
+    return cfg.CONF.CNSFANOUT.coalesce_window_ms > 0
+
+
+def get_batcher(proxy):
+    """
+    Return the fanout batcher of this process, sending through the given
+    RPC proxy when it is created.
+    """
+    global _batcher
+    if _batcher is None:
+        _batcher = FanoutBatcher(proxy)
+    return _batcher
+
+
+def split(context, payload):
+    """
+    Group {version: message} deltas by the topic they are sent on.
+    """
+    global _router
+    if cfg.CONF.CNSFANOUT.routing == 'broadcast':
+        return {CONSUMER_TOPIC: payload}
+    if _router is None:
+        _router = DeltaRouter()
+    return _router.split(context, payload)
+
+
+def cast(proxy, context, method, payload):
+    """
+    Send {version: message} deltas to the CRD consumers through an RPC
+    proxy, on the topics of their cluster or cell when routing is on.
+    The versions sent on a cluster or cell topic are also sent on
+    crd-consumer as skip markers naming that topic, so that every consumer
+    learns of every version and only waits for the ones of its topics.
+    The markers of a cast are sent as one marker per topic holding ranges
+    of versions, so that crd-consumer does not carry a message per routed
+    delta.
+    """
+    topics = split(context, payload)
+    skipped = {}
+    for topic, deltas in topics.iteritems():
+        if topic != CONSUMER_TOPIC:
+            skipped[topic] = deltas.keys()
+    broadcast = {}
+    for version, message in topics.get(CONSUMER_TOPIC, {}).iteritems():
+        if wire.is_skip_marker(message) and \
+                'ranges' not in message['payload']:
+            skipped.setdefault(message['payload'].get('topic'),
+                               []).append(version)
+        else:
+            broadcast[version] = message
+    if skipped:
+        broadcast.update(wire.skip_markers(skipped))
+        topics[CONSUMER_TOPIC] = broadcast
+    codec = wire.negotiate([cfg.CONF.CNSFANOUT.wire_format])
+    for topic, deltas in topics.iteritems():
+        if topic != CONSUMER_TOPIC and codec is not None:
+            deltas = wire.encode(deltas, codec)
+        proxy.fanout_cast(context, proxy.make_msg(method, payload=deltas),
+                          topic, version=proxy.RPC_API_VERSION)
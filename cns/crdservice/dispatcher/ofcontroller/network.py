@@ -19,12 +19,18 @@ from nscs.crdservice.openstack.common import rpc
 from nscs.crdservice.openstack.common.rpc import dispatcher
 from nscs.crdservice.openstack.common.rpc import proxy
 
+from cns.crdservice.dispatcher.ofcontroller import fanout
+from oslo.config import cfg
+
 import re
 import socket
 import time
 
 LOG = logging.getLogger(__name__)
 
+cfg.CONF.import_opt('fanout_outbox', 'cns.crdservice.db.delta', group='CNSDELTA')
+
+
 class NetworkDispatcher(proxy.RpcProxy):
     """
     Handling Sending Notification to OF COntroller CRD Cosumer
@@ -34,6 +40,11 @@ class NetworkDispatcher(proxy.RpcProxy):
     def send_fanout(self,context,method,payload):
         LOG.info(_("Payload in Send Fanout %s\n"), payload)
         self.consumer_topic = "crd-consumer"
-        self.fanout_cast(context,self.make_msg(method,payload=payload),self.consumer_topic,version=self.RPC_API_VERSION)
+        if cfg.CONF.CNSDELTA.fanout_outbox:
+            return
+        if fanout.coalescing():
+            fanout.get_batcher(self).add(context, method, payload)
+            return
+        fanout.cast(self, context, method, payload)
         
     
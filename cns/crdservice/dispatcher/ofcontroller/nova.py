@@ -19,12 +19,17 @@ from nscs.crdservice.openstack.common import rpc
 from nscs.crdservice.openstack.common.rpc import dispatcher
 from nscs.crdservice.openstack.common.rpc import proxy
 
+from cns.crdservice.dispatcher.ofcontroller import fanout
+from oslo.config import cfg
+
 import re
 import socket
 import time
 
 LOG = logging.getLogger(__name__)
 
+cfg.CONF.import_opt('fanout_outbox', 'cns.crdservice.db.delta', group='CNSDELTA')
+
 
 class NovaDispatcher(object):
     """
@@ -32,5 +37,12 @@ class NovaDispatcher(object):
     """
     def send_fanout(self, context, method, payload):
         LOG.info(_("Payload in Send Fanout %s\n"), payload)
-        consumer_topic = "crd-consumer"
-        self.fanout_cast(context, self.make_msg(method, payload=payload), consumer_topic, version=self.RPC_API_VERSION)
\ No newline at end of file
+        if cfg.CONF.CNSDELTA.fanout_outbox:
+            return
+        if fanout.coalescing():
+            fanout.get_batcher(self).add(context, method, payload)
+            return
+        self.cast_fanout(context, method, payload)
+
+    def cast_fanout(self, context, method, payload):
+        fanout.cast(self, context, method, payload)
\ No newline at end of file
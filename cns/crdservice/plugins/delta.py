@@ -12,30 +12,133 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+from nscs.crdservice import context as crd_context
 from nscs.crdservice.openstack.common import log as logging
 from nscs.crdservice.openstack.common import context
+from nscs.crdservice.openstack.common import jsonutils
+from nscs.crdservice.openstack.common import loopingcall
+from oslo.config import cfg
 
+from cns.common import wire
 from cns.crdservice.db import delta
 from cns.crdservice.db import network
 from cns.crdservice.db import nova
 
 
 
+import datetime
+import itertools
 import re
 import socket
 import time
+import uuid
+import zlib
 
 LOG = logging.getLogger(__name__)
 
+# Delta log compaction: interval in seconds (0 disables the compactor) and
+# age in seconds below which delta records are kept as they are.
+# Consumers which acknowledged no version for consumer_ack_timeout seconds
+# no longer hold back the compaction.
+# Materialized snapshots: interval in seconds (0 disables them) and number
+# of snapshots kept.
+# Seconds the pages of a paged consumer init are kept.
+# Outbox publisher: interval in seconds between two drains of the outbox,
+# number of deltas sent per batch and seconds after which the claim of a
+# publisher on a batch it did not send expires.
+cns_delta_opts = [
+    cfg.IntOpt('compaction_interval', default=0),
+    cfg.IntOpt('delta_retention', default=86400),
+    cfg.IntOpt('consumer_ack_timeout', default=600),
+    cfg.IntOpt('snapshot_interval', default=0),
+    cfg.IntOpt('snapshot_keep', default=2),
+    cfg.IntOpt('init_page_timeout', default=600),
+    cfg.FloatOpt('outbox_interval', default=0.5),
+    cfg.IntOpt('outbox_batch_size', default=500),
+    cfg.IntOpt('outbox_claim_timeout', default=60),
+]
+
+cfg.CONF.register_opts(cns_delta_opts, "CNSDELTA")
+
+# Consumer method for each (resource, operation) recorded in the delta tables
+DELTA_METHODS = {
+    ('network', 'create'): 'create_virtual_network',
+    ('network', 'update'): 'update_virtual_network',
+    ('network', 'delete'): 'delete_virtual_network',
+    ('subnet', 'create'): 'create_subnet',
+    ('subnet', 'update'): 'update_subnet',
+    ('subnet', 'delete'): 'delete_subnet',
+    ('port', 'create'): 'create_port',
+    ('port', 'update'): 'update_port',
+    ('port', 'delete'): 'delete_port',
+    ('instance', 'create'): 'create_instance',
+    ('instance', 'update'): 'update_instance',
+    ('instance', 'delete'): 'delete_instance',
+    ('compute', 'create'): 'create_datapath',
+    ('nwport', 'create'): 'create_nwport',
+}
+
+# Deltas which are recorded but not applied by the consumers; their versions
+# are sent as skip markers and left out of the replayed tails.
+FANOUT_SKIPPED = [
+    ('network', 'update'),
+]
+
+# Snapshot replay tiers: the resources of a tier only depend on resources
+# of the tiers before it.
+SNAPSHOT_TIERS = [
+    ('compute',),
+    ('network',),
+    ('subnet',),
+    ('instance',),
+    ('port', 'nwport'),
+]
+
+# Resources whose updates or deletes are not recorded as deltas (compute
+# updates and deletes, nwport deletes): snapshots read them from their
+# tables instead of bringing them forward with deltas.
+TABLE_RESOURCES = ('compute', 'nwport')
+
 class CnsDelta(object):
     """
     Handling Create delta and Get Difference 
     """
+    _compactor = None
+    _snapshotter = None
+    _publisher = None
+
     def __init__(self):
-	self.deltadb = delta.CnsDeltaDb()
-	self.networkdb = network.CrdNetworkDb()
-	self.novadb = nova.NovaDb()
-	
+        self.deltadb = delta.CnsDeltaDb()
+        self.networkdb = network.CrdNetworkDb()
+        self.novadb = nova.NovaDb()
+        # Resources replayed to a new consumer:
+        # (resource, consumer method, model, model key, delta model,
+        #  delta key, dict builder)
+        self.snapshot_sources = [
+            ('compute', 'create_datapath', nova.cns_compute,
+             'compute_id', delta.cns_compute_delta, 'compute_id',
+             self.novadb._make_compute_dict),
+            ('network', 'create_virtual_network', network.CrdNetwork,
+             'network_id', delta.cns_network_delta, 'network_id',
+             self.networkdb._make_network_dict),
+            ('subnet', 'create_subnet', network.CrdSubnet,
+             'subnet_id', delta.cns_subnet_delta, 'subnet_id',
+             self.networkdb._make_subnet_dict),
+            ('instance', 'create_instance', nova.cns_instance,
+             'instance_id', delta.cns_instance_delta, 'instance_id',
+             self.novadb._make_instance_dict),
+            ('port', 'create_port', network.CrdPort,
+             'port_id', delta.cns_port_delta, 'port_id',
+             self.networkdb._make_port_dict),
+            ('nwport', 'create_nwport', nova.cns_nwport,
+             'id', delta.cns_nwport_delta, 'nwport_id',
+             self.novadb._make_nwport_dict),
+        ]
+        self.snapshot_keys = dict((source[0], source[5])
+                                  for source in self.snapshot_sources)
+        self.snapshot_methods = dict((source[0], source[1])
+                                     for source in self.snapshot_sources)
+
     def create_network_delta(self, context, network):
         network_delta = self.deltadb.create_network_delta(context, network)
         return network_delta
@@ -59,116 +162,395 @@ class CnsDelta(object):
     def create_nwport_delta(self, context, nwport):
         nwport_delta = self.deltadb.create_nwport_delta(context, nwport)
         return nwport_delta
+
+    def create_deltas_bulk(self, context, deltas):
+        return self.deltadb.create_deltas_bulk(context, deltas)
     
         
     def cns_init(self, ctx, version,hostname):
-        delta={}
+        version, current_version = self._get_init_versions(ctx, version,
+                                                           hostname)
+        delta = self._build_init(ctx, version, current_version)
+        LOG.debug(_("Delta to consumer from CNS = %s"),str(delta))
+        return delta
+
+    def cns_init_paged(self, ctx, version, hostname, page_size):
+        """
+        Start a paged init for a consumer. The init delta is pinned at the
+        current runtime version, built once and stored split into pages,
+        which cns_init_page returns whichever crdservice worker serves
+        them, so that no single reply carries the whole topology. The
+        pages are kept for init_page_timeout seconds.
+        """
+        version, current_version = self._get_init_versions(ctx, version,
+                                                           hostname)
+        items = self._init_items(self._build_init(ctx, version,
+                                                  current_version))
+        pages = [zlib.compress(jsonutils.dumps(
+                     self._init_page(version, page,
+                                     items[start:start + page_size])))
+                 for page, start in enumerate(xrange(0, len(items),
+                                                     page_size))]
+        init_id = str(uuid.uuid4())
+        self.deltadb.delete_init_pages(
+            ctx, datetime.datetime.now() - datetime.timedelta(
+                seconds=cfg.CONF.CNSDELTA.init_page_timeout))
+        self.deltadb.create_init_pages(ctx, init_id, pages)
+        LOG.debug(_("Paged init %s of %s from version %s to %s: %s pages"),
+                  init_id, hostname, str(version), str(current_version),
+                  str(len(pages)))
+        return {'init_id': init_id, 'start_version': version,
+                'version': current_version, 'pages': len(pages),
+                'page_size': page_size}
+
+    def cns_init_page(self, ctx, hostname, init_id, page):
+        """
+        Return one stored page of a paged init, or a reply marked expired
+        when the pages are gone, for the consumer to start its init again.
+        """
+        data = self.deltadb.get_init_page(ctx, init_id, page)
+        if data is None:
+            LOG.warning(_("Page %s of the paged init %s of %s is gone"),
+                        str(page), init_id, hostname)
+            return {'page': page, 'expired': True}
+        return jsonutils.loads(zlib.decompress(data))
+
+    def _init_page(self, start_version, page, items):
+        """
+        Reply of one page of a paged init, from its items: a delta of a
+        tail, the part of each tier of a snapshot.
+        """
+        if start_version > 0:
+            return {'page': page, 'delta': dict(items)}
+        tiers = [[message for tier, message in group] for tier, group in
+                 itertools.groupby(items, lambda item: item[0])]
+        return {'page': page, 'tiers': tiers}
+
+    def _init_items(self, delta):
+        """
+        Flatten an init delta to the list that is paged: (version, message)
+        pairs of a tail, (tier, message) pairs of a snapshot.
+        """
+        if 'tiers' in delta:
+            return [(tier, message)
+                    for tier, messages in enumerate(delta['tiers'])
+                    for message in messages]
+        return sorted(delta.items())
+
+    def _get_init_versions(self, ctx, version, hostname):
+        """
+        Return the version a consumer init starts from, 0 for a snapshot,
+        and the version it is pinned at.
+        """
+        if version > 0 and version < self.deltadb.get_compacted_version(ctx):
+            LOG.info(_("Version %s of %s is compacted, sending snapshot"),
+                     str(version), hostname)
+            version = 0
+        current_version = self.deltadb.get_current_version(ctx)
+        LOG.debug(_("Runtime Version = %s"),str(current_version))
         if version > 0:
-            pass
-                
+            self.deltadb.record_consumer_version(ctx, hostname, version)
         elif version == 0:
-            #Network Delta
-            fields = []
-            fields=['runtime_version']
-	    current_version = 0
-            ver = self.deltadb.get_versions(ctx, filters=None, fields=fields)
-	    if ver:
-		current_version = max(ver)['runtime_version']
-		LOG.debug(_("Runtime Version = %s"),str(current_version))
-            #current_version = 100
-            network_diff = self.networkdb.get_networks(ctx, filters=None, fields=None)
-            for network in network_diff :
-		fil={}
-		id = network['id']
-		fil['network_id']= [id]
-		fil['operation']= ['create']
-		NetDelta = self.deltadb.get_network_deltas(ctx,fil)
-		arr = sorted(NetDelta, key=lambda t: t['version_id'], reverse=True)
-		verid = arr[0]['version_id']
-		
-                network.update({'operation':'create','version_id':current_version})
-                network_message={}
-                network_message.update({'method':'create_virtual_network','payload':network})
-                delta[verid] = network_message
-                
-            #Subnet Delta
-            subnet_diff = self.networkdb.get_subnets(ctx, filters=None, fields=None)
-            for subnet in subnet_diff :
-		fil={}
-		id = subnet['id']
-		fil['subnet_id']= [id]
-		fil['operation']= ['create']
-		SubDelta = self.deltadb.get_subnet_deltas(ctx,fil)
-		arr = sorted(SubDelta, key=lambda t: t['version_id'], reverse=True)
-		verid = arr[0]['version_id']
-		subnet.update({'operation':'create','version_id':current_version})
-                subnet_message={}
-                subnet_message.update({'method':'create_subnet','payload':subnet})
-                delta[verid] = subnet_message
-                
-            #Compute Nodes Delta
-            compute_diff = self.novadb.get_computes(ctx, filters=None, fields=None)
-            for compute in compute_diff :
-		fil={}
-		id = compute['id']
-		fil['compute_id']= [id]
-		fil['operation']= ['create']
-		CompDelta = self.deltadb.get_compute_deltas(ctx,fil)
-		arr = sorted(CompDelta, key=lambda t: t['version_id'], reverse=True)
-		verid = arr[0]['version_id']
-                compute.update({'operation':'create','version_id':current_version})
-                compute_message={}
-                compute_message.update({'method':'create_datapath','payload':compute})
-                delta[verid] = compute_message
-                
-            #NWPORTS Delta
-            nwport_diff = self.novadb.get_nwports(ctx, filters=None, fields=None)
-            for nwport in nwport_diff :
-		fil={}
-		id = nwport['id']
-		fil['nwport_id']= [id]
-		fil['operation']= ['create']
-		CompDelta = self.deltadb.get_nwport_deltas(ctx,fil)
-		arr = sorted(CompDelta, key=lambda t: t['version_id'], reverse=True)
-		verid = arr[0]['version_id']
-                nwport.update({'operation':'create','version_id':current_version})
-                nwport_message={}
-                nwport_message.update({'method':'create_nwport','payload':nwport})
-                delta[verid] = nwport_message
-                
-	    
-	    #Instances Delta
-            instance_diff = self.novadb.get_instances(ctx, filters=None, fields=None)
-            for instance in instance_diff :
-		fil={}
-		id = instance['id']
-		fil['instance_id']= [id]
-		fil['operation']= ['create']
-		CompDelta = self.deltadb.get_instance_deltas(ctx,fil)
-		arr = sorted(CompDelta, key=lambda t: t['version_id'], reverse=True)
-		verid = arr[0]['version_id']
-                instance.update({'operation':'create','version_id':current_version})
-                instance_message={}
-                instance_message.update({'method':'create_instance','payload':instance})
-                delta[verid] = instance_message
-                
-            #Port Delta
-            port_diff = self.networkdb.get_ports(ctx, filters=None, fields=None)
-            for port in port_diff :
-		fil={}
-		id = port['id']
-		fil['port_id']= [id]
-		fil['operation']= ['create']
-		CompDelta = self.deltadb.get_port_deltas(ctx,fil)
-		arr = sorted(CompDelta, key=lambda t: t['version_id'], reverse=True)
-		verid = arr[0]['version_id']
-                port.update({'operation':'create','version_id':current_version})
-                port_message={}
-                port_message.update({'method':'create_port','payload':port})
-                delta[verid] = port_message
-                
-		
-	    
-            
-        LOG.debug(_("Delta to consumer from CNS = %s"),str(delta))
+            self.deltadb.record_consumer_version(ctx, hostname,
+                                                 current_version)
+        return version, current_version
+
+    def _build_init(self, ctx, version, current_version):
+        if version > 0:
+            return self.build_tail(ctx, version, current_version)
+        elif version == 0:
+            return {'version': current_version,
+                    'tiers': self.build_snapshot(ctx, current_version)}
+        return {}
+
+    def get_current_version(self, ctx):
+        return self.deltadb.get_current_version(ctx)
+
+    def ack_version(self, ctx, hostname, version):
+        self.deltadb.record_consumer_version(ctx, hostname, version)
+
+    def get_deltas(self, ctx, start_version, end_version):
+        """
+        Messages of the deltas after start_version up to end_version, for
+        a consumer which missed them, or None when some of them are
+        compacted.
+        """
+        if start_version < self.deltadb.get_compacted_version(ctx):
+            return None
+        return self.build_tail(ctx, start_version, end_version)
+
+    def build_tail(self, ctx, version, end_version=None):
+        """
+        Build the create/update/delete messages recorded after the given
+        version, so that a consumer which already holds the state up to
+        that version only replays what it missed.
+        """
+        delta = {}
+        for resource, record in self.deltadb.get_deltas_since(ctx, version,
+                                                              end_version):
+            key = (resource, record['operation'])
+            if key in FANOUT_SKIPPED or key not in DELTA_METHODS:
+                LOG.debug(_("No consumer method for %s %s delta"),
+                          record['operation'], resource)
+                continue
+            message = {}
+            message.update({'method': DELTA_METHODS[key], 'payload': record})
+            delta[record['version_id']] = message
         return delta
+
+    def build_snapshot(self, ctx, current_version):
+        """
+        Build the full CNS state as create messages for a new consumer,
+        from the latest materialized snapshot and the deltas after it
+        when one is usable, from the resource tables otherwise.
+
+        The messages are returned as a list of tiers following
+        SNAPSHOT_TIERS, each in creation order, so that a consumer can
+        apply a tier in any order once the tiers before it are applied.
+        """
+        return self._build_tiers(self._get_state(ctx, current_version),
+                                 current_version)
+
+    def _get_state(self, ctx, version):
+        state = self._get_snapshot_state(ctx, version)
+        if state is None:
+            state = self._load_state(ctx)
+        return state
+
+    def _build_tiers(self, state, current_version):
+        tiers = []
+        for resources in SNAPSHOT_TIERS:
+            tier = []
+            for resource in resources:
+                method = self.snapshot_methods[resource]
+                records = sorted(state.get(resource, {}).itervalues(),
+                                 key=lambda record: record[0])
+                for verid, payload in records:
+                    payload.update({'operation': 'create',
+                                    'version_id': current_version})
+                    message = {}
+                    message.update({'method': method, 'payload': payload})
+                    tier.append(message)
+            tiers.append(tier)
+        return tiers
+
+    def _load_state(self, ctx, resources=None):
+        """
+        Read the CNS state from the resource tables as
+        {resource: {resource id: [create version, payload]}}, for all
+        resources or the given ones. Each table is read together with the
+        latest create version of its rows, so this costs one statement per
+        table irrespective of the number of resources.
+        """
+        state = {}
+        for (resource, method, model, model_key, delta_model,
+             delta_key, make_dict) in self.snapshot_sources:
+            if resources is not None and resource not in resources:
+                continue
+            records = state[resource] = {}
+            rows = self.deltadb.get_snapshot_rows(ctx, model, model_key,
+                                                  delta_model, delta_key)
+            for row, verid in rows:
+                records[str(row[model_key])] = [verid, make_dict(row)]
+        return state
+
+    def _apply_deltas(self, state, deltas):
+        """
+        Bring a state forward with (resource, delta) pairs in version order.
+        """
+        for resource, record in deltas:
+            key = str(record[self.snapshot_keys[resource]])
+            records = state.setdefault(resource, {})
+            if record['operation'] == 'delete':
+                records.pop(key, None)
+                continue
+            payload = dict(record)
+            payload['id'] = key
+            if record['operation'] == 'create' or key not in records:
+                records[key] = [record['version_id'], payload]
+            else:
+                records[key][1] = payload
+        return state
+
+    def _get_snapshot_state(self, ctx, version):
+        """
+        Return the latest materialized snapshot brought forward to the
+        given version, with TABLE_RESOURCES read from their tables, or
+        None when there is no snapshot whose tail is still complete.
+        """
+        snapshot = self.deltadb.get_latest_snapshot(ctx)
+        if snapshot is None or snapshot['version_id'] > version or \
+                snapshot['version_id'] < self.deltadb.get_compacted_version(ctx):
+            return None
+        snapshot = self.deltadb.get_latest_snapshot(ctx, ['version_id', 'data'])
+        state = jsonutils.loads(zlib.decompress(snapshot['data']))
+        deltas = [(resource, record) for resource, record in
+                  self.deltadb.get_deltas_since(ctx, snapshot['version_id'],
+                                                version)
+                  if resource not in TABLE_RESOURCES]
+        state = self._apply_deltas(state, deltas)
+        state.update(self._load_state(ctx, TABLE_RESOURCES))
+        return state
+
+    def materialize_snapshot(self, ctx):
+        """
+        Persist the CNS state at the current runtime version, built from
+        the previous snapshot and the deltas after it.
+        """
+        try:
+            start = time.time()
+            version = self.deltadb.get_current_version(ctx)
+            previous = self.deltadb.get_latest_snapshot(ctx)
+            if previous is not None and previous['version_id'] == version:
+                return
+            self._save_snapshot(ctx, version, self._get_state(ctx, version))
+            LOG.info(_("Snapshot at version %s built in %.3f seconds"),
+                     str(version), time.time() - start)
+        except Exception:
+            LOG.exception(_("Snapshot materialization failed"))
+
+    def _save_snapshot(self, ctx, version, state):
+        """
+        Persist a snapshot of the given state and delete all but the
+        snapshot_keep most recent ones.
+        """
+        data = zlib.compress(jsonutils.dumps(state))
+        entries = sum(len(records) for records in state.itervalues())
+        self.deltadb.create_snapshot(ctx, version, entries, data)
+        LOG.info(_("Saved snapshot at version %s: %s entries, %s bytes"),
+                 str(version), str(entries), str(len(data)))
+        self.deltadb.delete_snapshots(ctx, cfg.CONF.CNSDELTA.snapshot_keep)
+
+    def get_snapshot_stats(self, ctx):
+        """
+        Version, entry count, compressed size and age in seconds of the
+        latest materialized snapshot.
+        """
+        snapshot = self.deltadb.get_latest_snapshot(ctx)
+        if snapshot is None:
+            return {}
+        age = datetime.datetime.now() - snapshot.pop('created_at')
+        snapshot['age'] = age.days * 86400 + age.seconds
+        return snapshot
+
+    def _get_task_context(self):
+        """
+        Admin context of a periodic task. Each task gets its own, and so
+        its own DB session, apart from the one the RPC handlers use.
+        """
+        return crd_context.Context('crd', 'crd', is_admin=True)
+
+    def start_periodic_tasks(self):
+        """
+        Run the delta compactor and the snapshot materializer periodically,
+        once per crdservice process.
+        """
+        interval = cfg.CONF.CNSDELTA.compaction_interval
+        if interval > 0 and CnsDelta._compactor is None:
+            CnsDelta._compactor = loopingcall.FixedIntervalLoopingCall(
+                self.compact_deltas, self._get_task_context())
+            CnsDelta._compactor.start(interval=interval,
+                                      initial_delay=interval)
+        interval = cfg.CONF.CNSDELTA.snapshot_interval
+        if interval > 0 and CnsDelta._snapshotter is None:
+            CnsDelta._snapshotter = loopingcall.FixedIntervalLoopingCall(
+                self.materialize_snapshot, self._get_task_context())
+            CnsDelta._snapshotter.start(interval=interval)
+
+    def start_publisher(self, proxy):
+        """
+        Drain the outbox periodically through the given RPC proxy, once
+        per crdservice process.
+        """
+        if not cfg.CONF.CNSDELTA.fanout_outbox or \
+                CnsDelta._publisher is not None:
+            return
+        CnsDelta._publisher = loopingcall.FixedIntervalLoopingCall(
+            self.publish_outbox, self._get_task_context(), proxy)
+        CnsDelta._publisher.start(interval=cfg.CONF.CNSDELTA.outbox_interval)
+
+    def publish_outbox(self, ctx, proxy):
+        """
+        Send the outbox deltas to the consumers in version ordered batches,
+        with a skip marker for each version the consumers do not apply.
+
+        A batch is claimed in a transaction of its own and cast once that
+        transaction is committed, so recording new deltas never waits on
+        the broker. It leaves the outbox once it is sent. A batch whose
+        cast failed is released and sent on the next run; the claim of a
+        publisher which died expires after outbox_claim_timeout seconds.
+        """
+        batch_size = cfg.CONF.CNSDELTA.outbox_batch_size
+        try:
+            while True:
+                expired = datetime.datetime.now() - datetime.timedelta(
+                    seconds=cfg.CONF.CNSDELTA.outbox_claim_timeout)
+                versions = self.deltadb.claim_outbox(ctx, batch_size, expired)
+                if not versions:
+                    return
+                try:
+                    proxy.cast_fanout(ctx, 'call_consumer',
+                                      self._build_batch(ctx, versions))
+                except Exception:
+                    self.deltadb.release_outbox(ctx, versions)
+                    raise
+                self.deltadb.delete_outbox(ctx, versions)
+                if len(versions) < batch_size:
+                    return
+        except Exception:
+            LOG.exception(_("Outbox publishing failed, retrying"))
+
+    def _build_batch(self, ctx, versions):
+        """
+        Messages of the deltas of the given versions, and a skip marker
+        for each version the consumers do not apply.
+        """
+        batch = {}
+        for resource, record in self.deltadb.get_deltas_at(ctx, versions):
+            key = (resource, record['operation'])
+            if key in FANOUT_SKIPPED or key not in DELTA_METHODS:
+                continue
+            message = {}
+            message.update({'method': DELTA_METHODS[key],
+                            'payload': record})
+            batch[record['version_id']] = message
+        for version in versions:
+            batch.setdefault(version, wire.skip_marker())
+        return batch
+
+    def compact_deltas(self, ctx):
+        """
+        Compact the delta tables below the watermark, which is the latest
+        version older than the retention period, capped by the lowest
+        version acknowledged by the consumers which still acknowledge and
+        by the current version, below which every delta is committed.
+        """
+        try:
+            start = time.time()
+            now = datetime.datetime.now()
+            expired = self.deltadb.delete_consumer_versions(
+                ctx, now - datetime.timedelta(
+                    seconds=cfg.CONF.CNSDELTA.consumer_ack_timeout))
+            if expired:
+                LOG.warning(_("Forgot %s consumers which stopped "
+                              "acknowledging versions"), str(expired))
+            retention = datetime.timedelta(
+                seconds=cfg.CONF.CNSDELTA.delta_retention)
+            watermark = self.deltadb.get_version_logged_before(
+                ctx, now - retention)
+            acked = self.deltadb.get_acked_version(ctx)
+            if acked is not None:
+                watermark = min(watermark, acked)
+            watermark = min(watermark,
+                            self.deltadb.get_current_version(ctx))
+            if watermark <= self.deltadb.get_compacted_version(ctx):
+                return
+            reclaimed = self.deltadb.compact_deltas(ctx, watermark, start)
+            duration = time.time() - start
+            LOG.info(_("Delta compaction to version %s reclaimed %s rows "
+                       "in %.3f seconds"), str(watermark), str(reclaimed),
+                     duration)
+            return {'watermark': watermark, 'reclaimed': reclaimed,
+                    'duration': duration}
+        except Exception:
+            LOG.exception(_("Delta compaction failed"))
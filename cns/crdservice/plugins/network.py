@@ -15,6 +15,7 @@
 
 from nscs.crdservice.openstack.common import log as logging
 
+from cns.common import wire
 from cns.crdservice.db import network as network_db
 from cns.crdservice.extensions.network import NetworkBase
 from cns.crdservice.dispatcher.ofcontroller.network import NetworkDispatcher
@@ -70,12 +71,12 @@ class NetworkPlugin(NetworkBase,
         delta={}
         delta.update({'network_delta':v})
         networkdelta = self.cnsdelta.create_network_delta(context,delta)
-        fanoutmsg = {}
-        fanoutmsg.update({'method':'update_virtual_network','payload':networkdelta})
+        # The consumers do not apply network updates, they only get the
+        # version so that they do not wait for it.
         delta={}
         version = networkdelta['version_id']
-        delta[version] = fanoutmsg
-        #self.send_fanout(context,'call_consumer',delta)
+        delta[version] = wire.skip_marker()
+        self.send_fanout(context,'call_consumer',delta)
         
         return data
 
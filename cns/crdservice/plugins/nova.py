@@ -15,12 +15,15 @@
 
 from nscs.crdservice.openstack.common import log as logging
 
+from cns.common import wire
+from cns.crdservice.db import delta as delta_db
 from cns.crdservice.db import nova as nova_db
 from cns.crdservice.extensions.nova import NovaBase
 from nscs.crdservice.db import api as db_api
 from cns.crdservice.listener.nova import NovaListener
 from cns.crdservice.plugins import delta
 from cns.crdservice.plugins.common.openssl import CertificateAuthority
+from cns.crdservice.dispatcher.ofcontroller import fanout
 from cns.crdservice.dispatcher.ofcontroller.nova import NovaDispatcher
 from oslo.config import cfg
 
@@ -56,7 +59,10 @@ class NovaPlugin(NovaListener,
         self.cnsdelta = delta.CnsDelta()
         self.ca = CertificateAuthority()
         db_api.register_models()
+        delta_db.create_delta_indexes(db_api.get_engine())
         super(NovaPlugin, self).__init__()
+        self.cnsdelta.start_periodic_tasks()
+        self.cnsdelta.start_publisher(self)
     
     ################ Compute API Start ############################
     def create_compute(self, context, compute):
@@ -162,6 +168,91 @@ class NovaPlugin(NovaListener,
         payload = payload['payload']
         return self.create_ofcontroller(payload)
 
+    def cns_register_consumer(self, context, **kwargs):
+        """
+        First step of the consumer handshake: register the OF controller
+        of the consumer and reply whether it is ready to sync, with the
+        cluster and cell the controller is in, which may be the default
+        cluster rather than the one the consumer asked for.
+        """
+        payload = kwargs['consumer']['payload']
+        controller = self.register_ofcontroller(payload)
+        if controller is None:
+            return {'ready': False}
+        return {'ready': True, 'cluster_id': controller.get('cluster_id'),
+                'cell': controller.get('cell')}
+
+    def cns_sync_consumer(self, context, **kwargs):
+        """
+        Second step of the consumer handshake: the init delta of a
+        registered consumer.
+        """
+        payload = kwargs['consumer']['payload']
+        return self._init_delta(payload)
+
+    def cns_init_page(self, context, **kwargs):
+        """
+        This function is called by consumers which started a paged init
+        to fetch one page of the init delta.
+        """
+        page = self.cnsdelta.cns_init_page(self.context, kwargs['hostname'],
+                                           kwargs['init_id'], kwargs['page'])
+        codec = wire.negotiate(kwargs.get('wire_formats'))
+        if codec is not None:
+            page = wire.encode(page, codec, compress=True)
+        return page
+
+    def cns_get_deltas(self, context, **kwargs):
+        """
+        This function is called by consumers which detected a gap in the
+        fanout versions to fetch only the missed range. Deltas routed to
+        topics the consumer does not listen on are left out.
+        """
+        delta = self.cnsdelta.get_deltas(self.context,
+                                         kwargs['start_version'],
+                                         kwargs['end_version'])
+        if delta is None:
+            return {'compacted': True}
+        if cfg.CONF.CNSFANOUT.routing != 'broadcast':
+            topics = fanout.split(self.context, delta)
+            delta = {}
+            for topic in [fanout.CONSUMER_TOPIC] + kwargs.get('topics', []):
+                delta.update(topics.get(topic, {}))
+        reply = {'delta': delta}
+        codec = wire.negotiate(kwargs.get('wire_formats'))
+        if codec is not None:
+            reply = wire.encode(reply, codec, compress=True)
+        return reply
+
+    def cns_current_version(self, context, **kwargs):
+        """
+        This function is called by consumers to check their freshness
+        without requesting a snapshot.
+        """
+        return {'version': self.cnsdelta.get_current_version(self.context)}
+
+    def cns_ack_version(self, context, **kwargs):
+        """
+        This function is called periodically by consumers with the version
+        they would resume from, below which deltas may be compacted.
+        """
+        self.cnsdelta.ack_version(self.context, kwargs['hostname'],
+                                  kwargs['version'])
+
+    def cns_snapshot_stats(self, context, **kwargs):
+        """
+        Size and age of the latest materialized snapshot.
+        """
+        return self.cnsdelta.get_snapshot_stats(self.context)
+
+    def cns_fanout_stats(self, context, **kwargs):
+        """
+        Batch size and flush latency histograms of coalesced fanouts.
+        """
+        if not fanout.coalescing():
+            return {}
+        return fanout.get_batcher(self).stats()
+
     def update_consumer(self, context, **kwargs):
         """
         This function is called when any consumer sends keep-alive message.
@@ -169,7 +260,37 @@ class NovaPlugin(NovaListener,
         LOG.debug(_("In Update Consumer.......KWArgs = %s"),str(kwargs))
         pass
 
+    def _init_delta(self, payload):
+        """
+        Init delta for a consumer, or the header of a paged init when the
+        consumer asked for pages. The init delta is sent in the compact
+        wire format when the consumer can decode it.
+        """
+        page_size = payload.get('page_size')
+        if page_size:
+            return self.cnsdelta.cns_init_paged(self.context,
+                                                payload['version'],
+                                                payload['hostname'],
+                                                page_size)
+        delta = self.cnsdelta.cns_init(self.context, payload['version'],
+                                       payload['hostname'])
+        codec = wire.negotiate(payload.get('wire_formats'))
+        if codec is not None:
+            delta = wire.encode(delta, codec, compress=True)
+        return delta
+
     def create_ofcontroller(self, payload):
+        if self.register_ofcontroller(payload) is None:
+            return {}
+        return self._init_delta(payload)
+
+    def register_ofcontroller(self, payload):
+        """
+        Create the OF controller of a consumer in its cluster, or in the
+        default cluster when its own does not exist. Returns the
+        controller, the one already registered with the consumer address
+        when there is one, or None when there is no cluster to create it in.
+        """
         LOG.debug(_("create_ofcontroller = %s"),str(payload))
         body = {
             'ofcontroller':
@@ -188,24 +309,30 @@ class NovaPlugin(NovaListener,
             get_cluster = self.get_ofcluster(self.context,cluster_id)
         except exc.NoResultFound:
             LOG.error(_("No Cluster exist with = %s"),str(cluster_id))
-	clusterid = None
+        clusterid = None
         if get_cluster:
             clusterid = cluster_id
         else:
             cluster = cfg.CONF.OFCONTROLLER.cluster
             filters = {}
             filters['name']= [cluster]
-	    try:
-	            clusters = self.get_ofclusters(self.context, filters=filters)
-        	    clusterid = clusters[0]['id']
-	    except:
-		    LOG.error(_("No Cluster exist with Name = %s"),str(cluster))
-	if clusterid:
-		LOG.error(_("Creating Controller with cluster = %s"),str(clusterid))
-	        controller = self.create_ofcluster_ofcontroller(self.context, body, clusterid)
-        	return self.cnsdelta.cns_init(self.context, payload['version'],payload['hostname'])
-	else:
-		return {}
+            try:
+                clusters = self.get_ofclusters(self.context, filters=filters)
+                clusterid = clusters[0]['id']
+            except:
+                LOG.error(_("No Cluster exist with Name = %s"),str(cluster))
+        if not clusterid:
+            return None
+        LOG.error(_("Creating Controller with cluster = %s"),str(clusterid))
+        controller = self.create_ofcluster_ofcontroller(self.context, body, clusterid)
+        if controller:
+            return controller
+        for controller in self.get_ofcluster_ofcontrollers(self.context,
+                                                           clusterid):
+            if controller['ip_address'] == payload['ip_address']:
+                return controller
+        return None
+
     #########################################################################
     ##                                                                     ##
     ##             Openflow Cluster Management (Start)                     ##
@@ -586,75 +713,89 @@ class NovaPlugin(NovaListener,
         #local_data_ip = netifaces.ifaddresses(local_data_ip_interface)[2][0]['addr']
         local_data_ip = cfg.CONF.NETWORKNODE.data_ip
         
-        if compute_nodes:
-            for node in compute_nodes:
-                lst = [random.choice(string.ascii_letters + string.digits) for n in xrange(15)]
-                nwname = "".join(lst)
-                            
-                # Processing for VXLAN network type
-                if network_type == 'vxlan':
-                    lnwportdata = {'nwport':
-                                {
-                                    'name': nwname,
-                                    'network_type': network_type,
-                                    'ip_address': node['ip_address'],
-                                    'data_ip': local_data_ip,
-                                    'bridge': br_int,
-                                    'vxlan_vni': 0,
-                                    'vxlan_udpport': vxlan_udp_port,
-                                    'vlan_id': '',
-                                    'flow_type': flow_type,
-                                    'ovs_port': node['ovs_port'],
-                                    'local_data_ip': node['data_ip'],
-                                    'host': node['hostname'],
-                                }
-                            }
-                    computenode = self.create_nwport(context, lnwportdata)
-                    
+        # The nwport rows and their deltas are committed together
+        deltas = []
+        with context.session.begin(subtransactions=True):
+            if compute_nodes:
+                for node in compute_nodes:
                     lst = [random.choice(string.ascii_letters + string.digits) for n in xrange(15)]
                     nwname = "".join(lst)
-                    uniportdata = {'nwport':
-                                {
-                                    'name': nwname,
-                                    'network_type': network_type,
-                                    'ip_address': node['ip_address'],
-                                    'data_ip': '0',
-                                    'bridge': br_int,
-                                    'vxlan_vni': 0,
-                                    'vxlan_udpport': vxlan_udp_port,
-                                    'vlan_id': '',
-                                    'flow_type': flow_type,
-                                    'ovs_port': node['ovs_port'],
-                                    'local_data_ip': node['data_ip'],
-                                    'host': node['hostname'],
+                            
+                    # Processing for VXLAN network type
+                    if network_type == 'vxlan':
+                        lnwportdata = {'nwport':
+                                    {
+                                        'name': nwname,
+                                        'network_type': network_type,
+                                        'ip_address': node['ip_address'],
+                                        'data_ip': local_data_ip,
+                                        'bridge': br_int,
+                                        'vxlan_vni': 0,
+                                        'vxlan_udpport': vxlan_udp_port,
+                                        'vlan_id': '',
+                                        'flow_type': flow_type,
+                                        'ovs_port': node['ovs_port'],
+                                        'local_data_ip': node['data_ip'],
+                                        'host': node['hostname'],
+                                    }
                                 }
-                            }
-                    computenode = self.create_nwport(context, uniportdata)
+                        computenode = self.create_nwport(context, lnwportdata,
+                                                         deltas)
                     
-                    for data in compute_nodes:
                         lst = [random.choice(string.ascii_letters + string.digits) for n in xrange(15)]
                         nwname = "".join(lst)
-                        nwportdata = {'nwport':
-                                {
-                                    'name': nwname,
-                                    'network_type': network_type,
-                                    'ip_address': node['ip_address'],
-                                    'data_ip': data['data_ip'],
-                                    'bridge': br_int,
-                                    'vxlan_vni': 0,
-                                    'vxlan_udpport': vxlan_udp_port,
-                                    'vlan_id': '',
-                                    'flow_type': flow_type,
-                                    'ovs_port': node['ovs_port'],
-                                    'local_data_ip': node['data_ip'],
-                                    'host': node['hostname'],
+                        uniportdata = {'nwport':
+                                    {
+                                        'name': nwname,
+                                        'network_type': network_type,
+                                        'ip_address': node['ip_address'],
+                                        'data_ip': '0',
+                                        'bridge': br_int,
+                                        'vxlan_vni': 0,
+                                        'vxlan_udpport': vxlan_udp_port,
+                                        'vlan_id': '',
+                                        'flow_type': flow_type,
+                                        'ovs_port': node['ovs_port'],
+                                        'local_data_ip': node['data_ip'],
+                                        'host': node['hostname'],
+                                    }
+                                }
+                        computenode = self.create_nwport(context, uniportdata,
+                                                         deltas)
+                    
+                        for data in compute_nodes:
+                            lst = [random.choice(string.ascii_letters + string.digits) for n in xrange(15)]
+                            nwname = "".join(lst)
+                            nwportdata = {'nwport':
+                                    {
+                                        'name': nwname,
+                                        'network_type': network_type,
+                                        'ip_address': node['ip_address'],
+                                        'data_ip': data['data_ip'],
+                                        'bridge': br_int,
+                                        'vxlan_vni': 0,
+                                        'vxlan_udpport': vxlan_udp_port,
+                                        'vlan_id': '',
+                                        'flow_type': flow_type,
+                                        'ovs_port': node['ovs_port'],
+                                        'local_data_ip': node['data_ip'],
+                                        'host': node['hostname'],
+                                    }
                                 }
-                            }
                         
-                        if data['data_ip'] != node['data_ip']:
-                            computenode = self.create_nwport(context,nwportdata)
+                            if data['data_ip'] != node['data_ip']:
+                                computenode = self.create_nwport(context,nwportdata,
+                                                                 deltas)
+            records = self.cnsdelta.create_deltas_bulk(context, deltas)
+        self.send_nwport_deltas(context, records)
 
-    def create_nwport(self, context, nwport):
+    def create_nwport(self, context, nwport, deltas=None):
+        """
+        Create a network side port. When a deltas list is passed, the
+        delta is appended to it, for the caller to record in the
+        transaction of the port, instead of being recorded and sent right
+        away.
+        """
         utils = CertificateAuthority()
         
         network_type = nwport['nwport']['network_type']
@@ -684,6 +825,9 @@ class NovaPlugin(NovaListener,
             data = v
             
             v.update({'operation' : 'create'})
+            if deltas is not None:
+                deltas.append(('nwport', v))
+                return data
             delta={}
             delta.update({'nwport_delta':v})
             portdelta = self.cnsdelta.create_nwport_delta(context,delta)
@@ -696,6 +840,21 @@ class NovaPlugin(NovaListener,
             
             return data
 
+    def send_nwport_deltas(self, context, records):
+        """
+        Send the deltas of network side ports recorded together with
+        create_deltas_bulk in one fanout.
+        """
+        if not records:
+            return
+        delta = {}
+        for portdelta in records:
+            fanoutmsg = {}
+            fanoutmsg.update({'method': 'create_nwport',
+                              'payload': portdelta})
+            delta[portdelta['version_id']] = fanoutmsg
+        self.send_fanout(context,'call_consumer',delta)
+
     def update_nwport(self, context, nwport_id, nwport):
         v = self.novadb.update_nwport(context, nwport_id, nwport)
         return v
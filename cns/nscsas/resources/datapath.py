@@ -97,6 +97,7 @@ class DatapathController(BaseController):
         'datapathname': ['name', {'type': 'string', 'mandatory': True}],
     }
     dmpath = 'datapath'
+    _custom_actions = {'bulk': ['POST']}
 
     def __init__(self):
         self.conn = cns_db.CNSDBMixin()
@@ -128,8 +129,70 @@ class DatapathController(BaseController):
             response.translatable_error = error
             raise wsme.exc.ClientSideError(unicode(error))
 
+        if not self.conn.get_existing_ids(cns_db.Switches, [change['switch']]):
+            raise EntityNotFound(_('Switch'), change['switch'])
+        if not self.conn.get_existing_ids(cns_db.Domains, [change['domain']]):
+            raise EntityNotFound(_('Domain'), change['domain'])
+
         datapath_out = self.conn.create_datapath(datapath_in)
+        self._add_ucm_record(datapath_out)
+
+        datapath_out.domainname = wsme.Unset
+        datapath_out.switchname = wsme.Unset
+        return DatapathResp(**({'datapath': Datapath.from_db_model(datapath_out)}))
 
+    @wsme_pecan.wsexpose(DatapathsResp, body=DatapathsResp)
+    def bulk(self, datapaths):
+        """
+        This function implements create records functionality of the RESTful request, for a list of
+        datapaths. All the records are validated first, then added to DB in one transaction and to UCM.
+        The records UCM fails to add are deleted from DB and left out of the response.
+
+        :return: Dictionary of the added records.
+        """
+        changes = [datapath.as_dict(api_models.Datapath) for datapath in datapaths.datapaths]
+
+        ids = [change['id'] for change in changes]
+        if len(set(ids)) < len(ids) or self.conn.get_existing_ids(cns_db.Datapaths, ids):
+            error = _("Datapath with the given name exists")
+            response.translatable_error = error
+            raise wsme.exc.ClientSideError(unicode(error))
+
+        switches = set(change['switch'] for change in changes)
+        domains = set(change['domain'] for change in changes)
+        if self.conn.get_existing_ids(cns_db.Switches, list(switches)) != switches or \
+                self.conn.get_existing_ids(cns_db.Domains, list(domains)) != domains:
+            error = _("Switch or domain of the datapath does not exist")
+            response.translatable_error = error
+            raise wsme.exc.ClientSideError(unicode(error), status_code=404)
+
+        datapaths_in = []
+        for change in changes:
+            try:
+                datapaths_in.append(api_models.Datapath(**change))
+            except Exception:
+                LOG.exception("Error while posting Datapath: %s" % change)
+                error = _("Datapath incorrect")
+                response.translatable_error = error
+                raise wsme.exc.ClientSideError(unicode(error))
+
+        datapaths_out = self.conn.create_datapaths(datapaths_in)
+        failed = []
+        for datapath_out in datapaths_out:
+            try:
+                self._add_ucm_record(datapath_out)
+            except Exception:
+                LOG.exception("Error while adding Datapath to UCM: %s" % datapath_out.id)
+                failed.append(datapath_out.id)
+            datapath_out.domainname = wsme.Unset
+            datapath_out.switchname = wsme.Unset
+        self.conn.delete_records(cns_db.Datapaths, failed)
+
+        return DatapathsResp(**({'datapaths': [Datapath.from_db_model(datapath_out)
+                                               for datapath_out in datapaths_out
+                                               if datapath_out.id not in failed]}))
+
+    def _add_ucm_record(self, datapath_out):
         # UCM Configuration Start
         if cfg.CONF.api.ucm_support:
             body = datapath_out.as_dict()
@@ -148,10 +211,6 @@ class DatapathController(BaseController):
                     raise wsme.exc.ClientSideError(unicode(error))
         # UCM Configuration End
 
-        datapath_out.domainname = wsme.Unset
-        datapath_out.switchname = wsme.Unset
-        return DatapathResp(**({'datapath': Datapath.from_db_model(datapath_out)}))
-
     @wsme_pecan.wsexpose(DatapathResp, wtypes.text, Datapath)
     def put(self, datapath_id, datapath):
         """
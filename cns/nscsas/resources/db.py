@@ -190,6 +190,36 @@ class NWPorts(Base):
 
 
 class CNSDBMixin(object):
+    @staticmethod
+    def get_existing_ids(model, ids):
+        """Return the ids of the given list which have a record
+
+        :param model: Model class of the records, such as Ports
+        :param ids: List of ids to look up in one query
+        """
+        if not ids:
+            return set()
+        session = get_session()
+        query = session.query(model.id).filter(model.id.in_(ids))
+        return set(row.id for row in query.all())
+
+    @staticmethod
+    def delete_records(model, ids):
+        """Delete the records of the given ids in one transaction
+
+        :param model: Model class of the records, such as Ports
+        :param ids: List of ids of the records to delete
+        """
+        if not ids:
+            return
+        session = get_session()
+        with session.begin():
+            if model is Ports:
+                session.query(SecurityGroups).filter(SecurityGroups.port_id.in_(ids)).\
+                    delete(synchronize_session=False)
+            session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+            session.flush()
+
     @staticmethod
     def _row_to_vnetwork(row):
         return api_model.VirtualNetwork(id=row.id,
@@ -230,11 +260,49 @@ class CNSDBMixin(object):
             session.flush()
         return self._row_to_vnetwork(nw_row)
 
-    def get_virtualnetworks(self, nw_id=None, name=None, pagination=None):
+    def create_virtualnetworks(self, networks):
+        """
+        Insert several Network records into database in one transaction
+
+        :param networks: List of networks, as given to create_virtualnetwork
+        :return:
+                List of Network data if the insertion is successful
+                revoke transaction and raise exception
+        """
+        session = get_session()
+        with session.begin():
+            nw_rows = []
+            for network in networks:
+                nw_row = VirtualNetworks(id=network.id)
+                nw_row.update(network.as_dict())
+                nw_rows.append(nw_row)
+            session.add_all(nw_rows)
+            session.flush()
+        return [self._row_to_vnetwork(nw_row) for nw_row in nw_rows]
+
+    def update_virtualnetworks(self, networks):
+        """
+        Update several Network records in one transaction
+
+        :param networks: List of networks, as given to update_virtualnetwork
+        :return: List of the updated Network data
+        """
+        session = get_session()
+        with session.begin():
+            nw_rows = []
+            for network in networks:
+                nw_row = session.merge(VirtualNetworks(id=network.id))
+                nw_row.update(network.as_dict())
+                nw_rows.append(nw_row)
+            session.flush()
+        return [self._row_to_vnetwork(nw_row) for nw_row in nw_rows]
+
+    def get_virtualnetworks(self, nw_id=None, name=None, pagination=None, nw_ids=None):
         """Yields a lists of alarms that match filters
         :param name: Optional name to return one virtual network.
         :param nw_id: Optional nw_id to return one virtual network.
         :param pagination: Optional pagination query.
+        :param nw_ids: Optional list of ids to return several virtual networks.
         """
 
         if pagination:
@@ -246,6 +314,8 @@ class CNSDBMixin(object):
             query = query.filter(VirtualNetworks.name == name)
         if nw_id is not None:
             query = query.filter(VirtualNetworks.id == nw_id)
+        if nw_ids is not None:
+            query = query.filter(VirtualNetworks.id.in_(nw_ids))
 
         return (self._row_to_vnetwork(x) for x in query.all())
 
@@ -469,11 +539,50 @@ class CNSDBMixin(object):
             session.flush()
         return self._row_to_vmachine(vm_row)
 
-    def get_virtualmachines(self, vm_id=None, name=None, pagination=None):
+    def create_virtualmachines(self, vms):
+        """
+        Insert several Virtual Machine records into database in one
+        transaction
+
+        :param vms: List of virtual machines, as given to create_virtualmachine
+        :return:
+                List of Virtual Machine data if the insertion is successful
+                revoke transaction and raise exception
+        """
+        session = get_session()
+        with session.begin():
+            vm_rows = []
+            for vm in vms:
+                vm_row = VirtualMachines(id=vm.id)
+                vm_row.update(vm.as_dict())
+                vm_rows.append(vm_row)
+            session.add_all(vm_rows)
+            session.flush()
+        return [self._row_to_vmachine(vm_row) for vm_row in vm_rows]
+
+    def update_virtualmachines(self, vms):
+        """
+        Update several Virtual Machine records in one transaction
+
+        :param vms: List of virtual machines, as given to update_virtualmachine
+        :return: List of the updated Virtual Machine data
+        """
+        session = get_session()
+        with session.begin():
+            vm_rows = []
+            for vm in vms:
+                vm_row = session.merge(VirtualMachines(id=vm.id))
+                vm_row.update(vm.as_dict())
+                vm_rows.append(vm_row)
+            session.flush()
+        return [self._row_to_vmachine(vm_row) for vm_row in vm_rows]
+
+    def get_virtualmachines(self, vm_id=None, name=None, pagination=None, vm_ids=None):
         """Yields a lists of virtual machines that match filters
         :param name: Optional name to return one virtual machine.
         :param vm_id: Optional vm_id to return one virtual machine.
         :param pagination: Optional pagination query.
+        :param vm_ids: Optional list of ids to return several virtual machines.
         """
 
         if pagination:
@@ -485,6 +594,8 @@ class CNSDBMixin(object):
             query = query.filter(VirtualMachines.name == name)
         if vm_id is not None:
             query = query.filter(VirtualMachines.id == vm_id)
+        if vm_ids is not None:
+            query = query.filter(VirtualMachines.id.in_(vm_ids))
 
         return (self._row_to_vmachine(x) for x in query.all())
 
@@ -571,6 +682,36 @@ class CNSDBMixin(object):
         port_out.security_groups = [sg.id for sg in sg_rows]
         return port_out
 
+    def create_ports(self, ports):
+        """
+        Insert several port records into database in one transaction
+
+        :param ports: List of ports, as given to create_port
+        :return:
+                List of Port data if the insertion is successful
+                revoke transaction and raise exception
+        """
+        session = get_session()
+        with session.begin():
+            port_rows = []
+            sg_rows = []
+            for port in ports:
+                port_row = Ports(id=port.id)
+                port_row.update(port.as_dict())
+                port_rows.append(port_row)
+                for sg in port.security_groups:
+                    sg_rows.append(SecurityGroups(id=sg, port_id=port.id))
+            session.add_all(port_rows)
+            session.flush()
+            session.add_all(sg_rows)
+            session.flush()
+        ports_out = []
+        for port, port_row in zip(ports, port_rows):
+            port_out = self._row_to_port(port_row)
+            port_out.security_groups = list(port.security_groups)
+            ports_out.append(port_out)
+        return ports_out
+
     def update_port(self, port):
         """Update an Port.
 
@@ -594,11 +735,41 @@ class CNSDBMixin(object):
 
         return port_out
 
-    def get_ports(self, port_id=None, name=None, pagination=None):
+    def update_ports(self, ports):
+        """
+        Update several Port records and their security groups in one
+        transaction
+
+        :param ports: List of ports, as given to update_port
+        :return: List of the updated Port data
+        """
+        session = get_session()
+        with session.begin():
+            port_rows = []
+            for port in ports:
+                port_row = session.merge(Ports(id=port.id))
+                port_row.update(port.as_dict())
+                port_rows.append(port_row)
+            session.flush()
+            session.query(SecurityGroups).\
+                filter(SecurityGroups.port_id.in_([port.id for port in ports])).\
+                delete(synchronize_session=False)
+            session.add_all([SecurityGroups(id=sg, port_id=port.id)
+                             for port in ports for sg in port.security_groups])
+            session.flush()
+        ports_out = []
+        for port, port_row in zip(ports, port_rows):
+            port_out = self._row_to_port(port_row)
+            port_out.security_groups = list(port.security_groups)
+            ports_out.append(port_out)
+        return ports_out
+
+    def get_ports(self, port_id=None, name=None, pagination=None, port_ids=None):
         """Yields a lists of ports that match filters
         :param name: Optional name to return one virtual machine.
         :param port_id: Optional port_id to return one port details.
         :param pagination: Optional pagination query.
+        :param port_ids: Optional list of ids to return several ports.
         """
 
         if pagination:
@@ -610,6 +781,8 @@ class CNSDBMixin(object):
             query = query.filter(Ports.name == name)
         if port_id is not None:
             query = query.filter(Ports.id == port_id)
+        if port_ids is not None:
+            query = query.filter(Ports.id.in_(port_ids))
 
         ports = [self._row_to_port(x) for x in query.all()]
         for port in ports:
@@ -818,6 +991,37 @@ class CNSDBMixin(object):
         dp.domainname = session.query(Domains.name).filter(Domains.id == dp.domain).all()[0][0]
         return dp
 
+    def create_datapaths(self, datapaths):
+        """
+        Insert several datapath records into database in one transaction
+
+        :param datapaths: List of datapaths, as given to create_datapath
+        :return:
+                List of Datapath data if the insertion is successful
+                revoke transaction and raise exception
+        """
+        session = get_session()
+        with session.begin():
+            dp_rows = []
+            for datapath in datapaths:
+                dp_row = Datapaths(id=datapath.id)
+                dp_row.update(datapath.as_dict())
+                dp_rows.append(dp_row)
+            session.add_all(dp_rows)
+            session.flush()
+
+        dps = [self._row_to_datapath(dp_row) for dp_row in dp_rows]
+        switch_ids = set(dp.switch for dp in dps)
+        domain_ids = set(dp.domain for dp in dps)
+        switches = dict(session.query(Switches.id, Switches.name).
+                        filter(Switches.id.in_(switch_ids)).all())
+        domains = dict(session.query(Domains.id, Domains.name).
+                       filter(Domains.id.in_(domain_ids)).all())
+        for dp in dps:
+            dp.switchname = switches[dp.switch]
+            dp.domainname = domains[dp.domain]
+        return dps
+
     def update_datapath(self, datapath):
         """Update an Datapath.
 
@@ -924,6 +1128,27 @@ class CNSDBMixin(object):
         nwport_out = self._row_to_nwport(nwport_row)
         return nwport_out
 
+    def create_nwports(self, nwports):
+        """
+        Insert several nwport records into database in one transaction
+
+        :param nwports: List of nwports, as given to create_nwport
+        :return:
+                List of Port data if the insertion is successful
+                revoke transaction and raise exception
+        """
+        session = get_session()
+        with session.begin():
+            nwport_rows = []
+            for nwport in nwports:
+                nwport_row = NWPorts(id=nwport.id)
+                nwport_row.update(nwport.as_dict())
+                nwport_rows.append(nwport_row)
+            session.add_all(nwport_rows)
+            session.flush()
+
+        return [self._row_to_nwport(nwport_row) for nwport_row in nwport_rows]
+
     def update_nwport(self, nwport):
         """Update an Port.
 
@@ -112,6 +112,7 @@ class PortController(BaseController):
     dmpath = 'crm.virtualnetwork{%s}.computenodes{%s}.vmsideports'
     attributes = AttributeController(dmpath)
     views = ViewController(dmpath)
+    _custom_actions = {'bulk': ['POST', 'PUT'], 'bulk_delete': ['POST']}
 
     def __init__(self):
         self.conn = cns_db.CNSDBMixin()
@@ -128,14 +129,8 @@ class PortController(BaseController):
         """
 
         change = port.as_dict(api_models.Port)
-        change['type'] = 'DHCP_PORT'
-        vm = list(self.conn.get_virtualmachines(vm_id=port.device_id))
-        if len(vm) > 0:
-            vm = vm[0]
-            if vm.type == 'VM_TYPE_NETWORK_SERVICE':
-                change['type'] = 'VMNS_PORT'
-            elif vm.type == 'VM_TYPE_NORMAL_APPLICATION':
-                change['type'] = 'VMSIDE_PORT'
+        vm = self._get_vm(port.device_id)
+        change['type'] = self._port_type(vm)
 
         ports = list(self.conn.get_ports(port_id=port.id))
 
@@ -153,10 +148,101 @@ class PortController(BaseController):
             raise wsme.exc.ClientSideError(unicode(error))
 
         port_out = self.conn.create_port(port_in)
+        self._add_ucm_record(port_out, vm)
+
+        return PortResp(**({'port': Port.from_db_model(port_out)}))
+
+    @wsme_pecan.wsexpose(PortsResp, body=PortsResp)
+    def bulk(self, ports):
+        """
+        This function implements create records functionality of the RESTful request, for a list of
+        ports. All the records are validated first, then added to DB in one transaction and to UCM.
+        Virtual machines, virtual networks and compute nodes shared by the ports are looked up once.
+        The virtual machine and virtual network of each virtual machine port must exist.
+        The records UCM fails to add are deleted from DB and left out of the response.
+
+        :return: Dictionary of the added records.
+        """
+
+        vms = {}
+        changes = []
+        for port in ports.ports:
+            change = port.as_dict(api_models.Port)
+            if port.device_id not in vms:
+                vms[port.device_id] = self._get_vm(port.device_id)
+            change['type'] = self._port_type(vms[port.device_id])
+            changes.append(change)
+
+        ids = [change['id'] for change in changes]
+        if len(set(ids)) < len(ids) or self.conn.get_existing_ids(cns_db.Ports, ids):
+            error = _("Port with the given id exists")
+            response.translatable_error = error
+            raise wsme.exc.ClientSideError(unicode(error))
+
+        vm_ports = [change for change in changes if len(change.get('device_id') or '') == 36]
+        nw_ids = set(change['nw_id'] for change in vm_ports)
+        if not all(vms[change['device_id']] for change in vm_ports) or \
+                self.conn.get_existing_ids(cns_db.VirtualNetworks, list(nw_ids)) != nw_ids:
+            error = _("Virtual machine or virtual network of the port does not exist")
+            response.translatable_error = error
+            raise wsme.exc.ClientSideError(unicode(error))
+
+        ports_in = []
+        for change in changes:
+            try:
+                ports_in.append(api_models.Port(**change))
+            except Exception:
+                LOG.exception("Error while posting Port: %s" % change)
+                error = _("Port incorrect")
+                response.translatable_error = error
+                raise wsme.exc.ClientSideError(unicode(error))
+
+        ports_out = self.conn.create_ports(ports_in)
+        vns = {}
+        computenodes = set()
+        failed = []
+        for port_out in ports_out:
+            try:
+                self._add_ucm_record(port_out, vms[port_out.device_id], vns, computenodes)
+            except Exception:
+                LOG.exception("Error while adding Port to UCM: %s" % port_out.id)
+                failed.append(port_out.id)
+        self.conn.delete_records(cns_db.Ports, failed)
+
+        return PortsResp(**({'ports': [Port.from_db_model(port_out) for port_out in ports_out
+                                       if port_out.id not in failed]}))
+
+    def _get_vm(self, vm_id):
+        vm = list(self.conn.get_virtualmachines(vm_id=vm_id))
+        if len(vm) > 0:
+            return vm[0]
+        return vm
+
+    @staticmethod
+    def _port_type(vm):
+        if vm:
+            if vm.type == 'VM_TYPE_NETWORK_SERVICE':
+                return 'VMNS_PORT'
+            elif vm.type == 'VM_TYPE_NORMAL_APPLICATION':
+                return 'VMSIDE_PORT'
+        return 'DHCP_PORT'
+
+    def _add_ucm_record(self, port_out, vm, vns=None, computenodes=None):
+        """
+        Add a port record to UCM, and the compute node record of its virtual network when
+        missing. vns and computenodes cache the networks and the compute nodes known by UCM
+        across the ports of a bulk request.
+        """
+        if vns is None:
+            vns = {}
+        if computenodes is None:
+            computenodes = set()
 
         # UCM Configuration Start
         if len(port_out.device_id) == 36:
-            vn = list(self.conn.get_virtualnetworks(nw_id=port.nw_id))[0]
+            if port_out.nw_id not in vns:
+                vns[port_out.nw_id] = list(self.conn.get_virtualnetworks(nw_id=port_out.nw_id))[0]
+            vn = vns[port_out.nw_id]
 
             if cfg.CONF.api.ucm_support:
                 body = port_out.as_dict()
@@ -168,20 +254,22 @@ class PortController(BaseController):
                                'bridgename': {'type': constants.DATA_TYPES['string'], 'value': str(port_out.bridge)},
                                'dmpath': str(constants.PATH_PREFIX + '.' +
                                              'crm.virtualnetwork{' + vn.name + '}.computenodes')}
-                        try:
-                            comp_req = copy.deepcopy(req)
-                            rec = _ucm.get_exact_record(comp_req)
-                            if not rec:
-                                ret_val = _ucm.add_record(req)
-                                if ret_val != 0:
-                                    error = _("Unable to add compute nodes record to UCM")
-                                    response.translatable_error = error
-                                    raise wsme.exc.ClientSideError(unicode(error))
-                        except UCMException, msg:
-                            LOG.info(_("UCM Exception raised. %s\n"), msg)
-                            error = _("Unable to add compute nodes record in UCM")
-                            response.translatable_error = error
-                            raise wsme.exc.ClientSideError(unicode(error))
+                        if (vn.name, vm.host) not in computenodes:
+                            try:
+                                comp_req = copy.deepcopy(req)
+                                rec = _ucm.get_exact_record(comp_req)
+                                if not rec:
+                                    ret_val = _ucm.add_record(req)
+                                    if ret_val != 0:
+                                        error = _("Unable to add compute nodes record to UCM")
+                                        response.translatable_error = error
+                                        raise wsme.exc.ClientSideError(unicode(error))
+                            except UCMException, msg:
+                                LOG.info(_("UCM Exception raised. %s\n"), msg)
+                                error = _("Unable to add compute nodes record in UCM")
+                                response.translatable_error = error
+                                raise wsme.exc.ClientSideError(unicode(error))
+                            computenodes.add((vn.name, vm.host))
 
                         ret_val = _ucm.add_record(ucm_record)
                         if ret_val != 0:
@@ -195,8 +283,6 @@ class PortController(BaseController):
                         raise wsme.exc.ClientSideError(unicode(error))
         # UCM Configuration End
 
-        return PortResp(**({'port': Port.from_db_model(port_out)}))
-
     @wsme_pecan.wsexpose(PortResp, wtypes.text, Port)
     def put(self, port_id, port):
         """
@@ -228,6 +314,35 @@ class PortController(BaseController):
         port_out = self.conn.update_port(port_in)
         return PortResp(**({'port': Port.from_db_model(port_out)}))
 
+    @wsme_pecan.wsexpose(PortsResp, body=PortsResp)
+    def put_bulk(self, ports):
+        """
+        This function implements update records functionality of the RESTful request, for a list of
+        ports. The records are looked up in one query and validated first, then updated in DB in one
+        transaction. The records which do not exist are left out of the response.
+
+        :return: Dictionary of the updated records.
+        """
+
+        changes = dict((port.id, port.as_dict(api_models.Port)) for port in ports.ports)
+        if not changes:
+            return PortsResp(**({'ports': []}))
+
+        ports_in = []
+        for port in self.conn.get_ports(port_ids=changes.keys()):
+            old_port = Port.from_db_model(port).as_dict(api_models.Port)
+            old_port.update(changes[port.id])
+            try:
+                ports_in.append(api_models.Port(**old_port))
+            except Exception:
+                LOG.exception("Error while putting Port: %s" % old_port)
+                error = _("Port incorrect")
+                response.translatable_error = error
+                raise wsme.exc.ClientSideError(unicode(error))
+
+        ports_out = self.conn.update_ports(ports_in)
+        return PortsResp(**({'ports': [Port.from_db_model(port_out) for port_out in ports_out]}))
+
     @wsme_pecan.wsexpose(PortsResp, [Port])
     def get_all(self):
         """Return all virtual machines, based on the query provided.
@@ -259,12 +374,56 @@ class PortController(BaseController):
         if len(ports) < 1:
             raise EntityNotFound(_('Port'), port_id)
 
+        self._delete_ucm_record(ports[0])
+        self.conn.delete_port(port_id)
+
+    @wsme_pecan.wsexpose([wtypes.text], body=[wtypes.text])
+    def bulk_delete(self, port_ids):
+        """
+        This function implements delete records functionality of the RESTful request, for a list of
+        port ids. The records are looked up in one query, deleted from UCM and then from DB in one
+        transaction. Virtual machines and virtual networks shared by the ports are looked up once.
+        The ids which do not exist or which UCM fails to delete are left out of the response.
+
+        :return: List of the deleted ids.
+        """
+
+        if not port_ids:
+            return []
+
+        vms = {}
+        vns = {}
+        deleted = []
+        for port in self.conn.get_ports(port_ids=port_ids):
+            try:
+                self._delete_ucm_record(port, vms, vns)
+            except Exception:
+                LOG.exception("Error while deleting Port from UCM: %s" % port.id)
+                continue
+            deleted.append(port.id)
+        self.conn.delete_records(cns_db.Ports, deleted)
+
+        return deleted
+
+    def _delete_ucm_record(self, port, vms=None, vns=None):
+        """
+        Delete the UCM record of a virtual machine port. vms and vns cache the virtual machines and
+        the virtual networks across the ports of a bulk request.
+        """
+        if vms is None:
+            vms = {}
+        if vns is None:
+            vns = {}
+
         #UCM Configuration Start
-        port = ports[0]
         if len(port.device_id) == 36:
-            vm = list(self.conn.get_virtualmachines(vm_id=port.device_id))[0]
+            if port.device_id not in vms:
+                vms[port.device_id] = list(self.conn.get_virtualmachines(vm_id=port.device_id))[0]
+            vm = vms[port.device_id]
 
-            vn = list(self.conn.get_virtualnetworks(nw_id=port.nw_id))[0]
+            if port.nw_id not in vns:
+                vns[port.nw_id] = list(self.conn.get_virtualnetworks(nw_id=port.nw_id))[0]
+            vn = vns[port.nw_id]
 
             if cfg.CONF.api.ucm_support:
                 body = port.as_dict()
@@ -284,8 +443,6 @@ class PortController(BaseController):
                         raise wsme.exc.ClientSideError(unicode(error))
         #UCM Configuration End
 
-        self.conn.delete_port(port_id)
-
 
 class NWPort(_Base):
     """
@@ -358,6 +515,7 @@ class NWPortController(BaseController):
     dmpath = 'crm.nwsideports'
     attributes = AttributeController(dmpath)
     views = ViewController(dmpath)
+    _custom_actions = {'bulk': ['POST']}
 
     def __init__(self):
         self.conn = cns_db.CNSDBMixin()
@@ -392,6 +550,46 @@ class NWPortController(BaseController):
             raise wsme.exc.ClientSideError(unicode(error))
 
         port_out = self.conn.create_nwport(port_in)
+        self._add_ucm_record(port_out)
+
+        return NWPortResp(**({'nwport': NWPort.from_db_model(port_out)}))
+
+    @wsme_pecan.wsexpose(NWPortsResp, body=NWPortsResp)
+    def bulk(self, nwports):
+        """
+        This function implements create records functionality of the RESTful request, for a list of
+        network side ports. All the records are validated first, then added to DB in one transaction
+        and to UCM. The records UCM fails to add are deleted from DB and left out of the response.
+
+        :return: Dictionary of the added records.
+        """
+
+        ports_in = []
+        for nwport in nwports.nwports:
+            change = nwport.as_dict(api_models.NWPort)
+            change['id'] = uuidutils.generate_uuid()
+            try:
+                ports_in.append(api_models.NWPort(**change))
+            except Exception:
+                LOG.exception("Error while posting NWPort: %s" % change)
+                error = _("NWPort incorrect")
+                response.translatable_error = error
+                raise wsme.exc.ClientSideError(unicode(error))
+
+        ports_out = self.conn.create_nwports(ports_in)
+        failed = []
+        for port_out in ports_out:
+            try:
+                self._add_ucm_record(port_out)
+            except Exception:
+                LOG.exception("Error while adding NWPort to UCM: %s" % port_out.id)
+                failed.append(port_out.id)
+        self.conn.delete_records(cns_db.NWPorts, failed)
+
+        return NWPortsResp(**({'nwports': [NWPort.from_db_model(port_out) for port_out in ports_out
+                                           if port_out.id not in failed]}))
+
+    def _add_ucm_record(self, port_out):
         # UCM Configuration Start
         if cfg.CONF.api.ucm_support:
             body = port_out.as_dict()
@@ -412,8 +610,6 @@ class NWPortController(BaseController):
                     raise wsme.exc.ClientSideError(unicode(error))
         # UCM Configuration End
 
-        return NWPortResp(**({'nwport': NWPort.from_db_model(port_out)}))
-
     @wsme_pecan.wsexpose(NWPortResp, wtypes.text, NWPort)
     def put(self, port_id, nwport):
         """
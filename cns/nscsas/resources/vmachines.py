@@ -98,6 +98,7 @@ class VMController(BaseController):
     dmpath = 'crm.virtualmachine'
     attributes = AttributeController(dmpath)
     views = ViewController(dmpath)
+    _custom_actions = {'bulk': ['POST', 'PUT'], 'bulk_delete': ['POST']}
 
     def __init__(self):
         self.conn = cns_db.CNSDBMixin()
@@ -131,7 +132,53 @@ class VMController(BaseController):
             raise wsme.exc.ClientSideError(unicode(error))
 
         vm_out = self.conn.create_virtualmachine(vm_in)
+        self._add_ucm_record(vm_out)
 
+        return VirtualMachineResp(**({'virtualmachine': VirtualMachine.from_db_model(vm_out)}))
+
+    @wsme_pecan.wsexpose(VirtualMachinesResp, body=VirtualMachinesResp)
+    def bulk(self, virtualmachines):
+        """
+        This function implements create records functionality of the RESTful request, for a list of
+        virtual machines. All the records are validated first, then added to DB in one transaction and
+        to UCM. The records UCM fails to add are deleted from DB and left out of the response.
+
+        :return: Dictionary of the added records.
+        """
+
+        changes = [vm.as_dict(api_models.VirtualMachine) for vm in virtualmachines.virtualmachines]
+
+        ids = [change['id'] for change in changes]
+        if len(set(ids)) < len(ids) or self.conn.get_existing_ids(cns_db.VirtualMachines, ids):
+            error = _("Virtual Machine with the given id exists")
+            response.translatable_error = error
+            raise wsme.exc.ClientSideError(unicode(error))
+
+        vms_in = []
+        for change in changes:
+            try:
+                vms_in.append(api_models.VirtualMachine(**change))
+            except Exception:
+                LOG.exception("Error while posting Virtual Machine: %s" % change)
+                error = _("Virtual Machine incorrect")
+                response.translatable_error = error
+                raise wsme.exc.ClientSideError(unicode(error))
+
+        vms_out = self.conn.create_virtualmachines(vms_in)
+        failed = []
+        for vm_out in vms_out:
+            try:
+                self._add_ucm_record(vm_out)
+            except Exception:
+                LOG.exception("Error while adding Virtual Machine to UCM: %s" % vm_out.id)
+                failed.append(vm_out.id)
+        self.conn.delete_records(cns_db.VirtualMachines, failed)
+
+        return VirtualMachinesResp(**({'virtualmachines': [VirtualMachine.from_db_model(vm_out)
+                                                           for vm_out in vms_out
+                                                           if vm_out.id not in failed]}))
+
+    def _add_ucm_record(self, vm_out):
         # UCM Configuration Start
         if cfg.CONF.api.ucm_support:
             body = vm_out.as_dict()
@@ -150,8 +197,6 @@ class VMController(BaseController):
                     raise wsme.exc.ClientSideError(unicode(error))
         # UCM Configuration End
 
-        return VirtualMachineResp(**({'virtualmachine': VirtualMachine.from_db_model(vm_out)}))
-
     @wsme_pecan.wsexpose(VirtualMachinesResp, [VirtualMachine])
     def get_all(self):
         """Return all virtual machines, based on the query provided.
@@ -202,7 +247,52 @@ class VMController(BaseController):
             raise wsme.exc.ClientSideError(unicode(error))
 
         vm_out = self.conn.update_virtualmachine(vm_in)
+        self._update_ucm_record(vm_out)
+
+        return VirtualMachineResp(**({'virtualmachine': VirtualMachine.from_db_model(vm_out)}))
 
+    @wsme_pecan.wsexpose(VirtualMachinesResp, body=VirtualMachinesResp)
+    def put_bulk(self, virtualmachines):
+        """
+        This function implements update records functionality of the RESTful request, for a list of
+        virtual machines. The records are looked up in one query and validated first, then updated in
+        UCM and in DB in one transaction. The records which do not exist or which UCM fails to update
+        are left as they are and out of the response.
+
+        :return: Dictionary of the updated records.
+        """
+
+        changes = dict((vm.id, vm.as_dict(api_models.VirtualMachine))
+                       for vm in virtualmachines.virtualmachines)
+        if not changes:
+            return VirtualMachinesResp(**({'virtualmachines': []}))
+
+        vms_in = []
+        for vm in self.conn.get_virtualmachines(vm_ids=changes.keys()):
+            old_vm = VirtualMachine.from_db_model(vm).as_dict(api_models.VirtualMachine)
+            old_vm.update(changes[vm.id])
+            try:
+                vms_in.append(api_models.VirtualMachine(**old_vm))
+            except Exception:
+                LOG.exception("Error while putting virtual machine: %s" % old_vm)
+                error = _("Virtual Machine incorrect")
+                response.translatable_error = error
+                raise wsme.exc.ClientSideError(unicode(error))
+
+        updated = []
+        for vm_in in vms_in:
+            try:
+                self._update_ucm_record(vm_in)
+            except Exception:
+                LOG.exception("Error while updating Virtual Machine in UCM: %s" % vm_in.id)
+                continue
+            updated.append(vm_in)
+
+        vms_out = self.conn.update_virtualmachines(updated)
+        return VirtualMachinesResp(**({'virtualmachines': [VirtualMachine.from_db_model(vm_out)
+                                                           for vm_out in vms_out]}))
+
+    def _update_ucm_record(self, vm_out):
         #UCM Support Start
         if cfg.CONF.api.ucm_support:
             body = vm_out.as_dict()
@@ -235,8 +325,6 @@ class VMController(BaseController):
                     raise wsme.exc.ClientSideError(unicode(error))
         #UCM Support End
 
-        return VirtualMachineResp(**({'virtualmachine': VirtualMachine.from_db_model(vm_out)}))
-
     @wsme_pecan.wsexpose(None, wtypes.text, status_code=204)
     def delete(self, vm_id):
         """Delete this Virtual Machine."""
@@ -248,8 +336,35 @@ class VMController(BaseController):
             raise EntityNotFound(_('Virtual Machine'), vm_id)
 
         self.conn.delete_virtualmachine(vm_id)
-        vm = virtualmachines[0]
+        self._delete_ucm_record(virtualmachines[0])
+
+    @wsme_pecan.wsexpose([wtypes.text], body=[wtypes.text])
+    def bulk_delete(self, vm_ids):
+        """
+        This function implements delete records functionality of the RESTful request, for a list of
+        virtual machine ids. The records are looked up in one query, deleted from UCM and then from DB
+        in one transaction. The ids which do not exist or which UCM fails to delete are left out of
+        the response.
+
+        :return: List of the deleted ids.
+        """
+
+        if not vm_ids:
+            return []
+
+        deleted = []
+        for vm in self.conn.get_virtualmachines(vm_ids=vm_ids):
+            try:
+                self._delete_ucm_record(vm)
+            except Exception:
+                LOG.exception("Error while deleting Virtual Machine from UCM: %s" % vm.id)
+                continue
+            deleted.append(vm.id)
+        self.conn.delete_records(cns_db.VirtualMachines, deleted)
+
+        return deleted
 
+    def _delete_ucm_record(self, vm):
         #UCM Configuration Start
         record = {'name': {'type': constants.DATA_TYPES['string'], 'value': str(vm.name)},
                   'dmpath': constants.PATH_PREFIX + '.' + self.dmpath}
@@ -423,6 +423,7 @@ class VNController(BaseController):
     attributes = AttributeController(dmpath)
     subnets = SubnetController()
     views = ViewController(dmpath)
+    _custom_actions = {'bulk': ['POST', 'PUT'], 'bulk_delete': ['POST']}
 
     def __init__(self):
         self.conn = cns_db.CNSDBMixin()
@@ -456,7 +457,53 @@ class VNController(BaseController):
             raise wsme.exc.ClientSideError(unicode(error))
 
         vn_out = self.conn.create_virtualnetwork(vn_in)
-        
+        self._add_ucm_record(vn_out)
+
+        return VirtualNetworkResp(**({'virtualnetwork': VirtualNetwork.from_db_model(vn_out)}))
+
+    @wsme_pecan.wsexpose(VirtualNetworksResp, body=VirtualNetworksResp)
+    def bulk(self, virtualnetworks):
+        """
+        This function implements create records functionality of the RESTful request, for a list of
+        virtual networks. All the records are validated first, then added to DB in one transaction and
+        to UCM. The records UCM fails to add are deleted from DB and left out of the response.
+
+        :return: Dictionary of the added records.
+        """
+
+        changes = [vn.as_dict(api_models.VirtualNetwork) for vn in virtualnetworks.virtualnetworks]
+
+        ids = [change['id'] for change in changes]
+        if len(set(ids)) < len(ids) or self.conn.get_existing_ids(cns_db.VirtualNetworks, ids):
+            error = _("Virtual Network with the given id exists")
+            response.translatable_error = error
+            raise wsme.exc.ClientSideError(unicode(error))
+
+        vns_in = []
+        for change in changes:
+            try:
+                vns_in.append(api_models.VirtualNetwork(**change))
+            except Exception:
+                LOG.exception("Error while posting Virtual Network: %s" % change)
+                error = _("Virtual Network incorrect")
+                response.translatable_error = error
+                raise wsme.exc.ClientSideError(unicode(error))
+
+        vns_out = self.conn.create_virtualnetworks(vns_in)
+        failed = []
+        for vn_out in vns_out:
+            try:
+                self._add_ucm_record(vn_out)
+            except Exception:
+                LOG.exception("Error while adding Virtual Network to UCM: %s" % vn_out.id)
+                failed.append(vn_out.id)
+        self.conn.delete_records(cns_db.VirtualNetworks, failed)
+
+        return VirtualNetworksResp(**({'virtualnetworks': [VirtualNetwork.from_db_model(vn_out)
+                                                           for vn_out in vns_out
+                                                           if vn_out.id not in failed]}))
+
+    def _add_ucm_record(self, vn_out):
         # UCM Configuration Start
         if cfg.CONF.api.ucm_support:
             body = vn_out.as_dict()
@@ -478,8 +525,6 @@ class VNController(BaseController):
                     response.translatable_error = error
                     raise wsme.exc.ClientSideError(unicode(error))
         # UCM Configuration End
-        
-        return VirtualNetworkResp(**({'virtualnetwork': VirtualNetwork.from_db_model(vn_out)}))
 
     @wsme_pecan.wsexpose(VirtualNetworksResp, [VirtualNetwork])
     def get_all(self):
@@ -531,7 +576,52 @@ class VNController(BaseController):
             raise wsme.exc.ClientSideError(unicode(error))
 
         vn_out = self.conn.update_virtualnetwork(vn_in)
-        
+        self._update_ucm_record(vn_out)
+
+        return VirtualNetworkResp(**({'virtualnetwork': VirtualNetwork.from_db_model(vn_out)}))
+
+    @wsme_pecan.wsexpose(VirtualNetworksResp, body=VirtualNetworksResp)
+    def put_bulk(self, virtualnetworks):
+        """
+        This function implements update records functionality of the RESTful request, for a list of
+        virtual networks. The records are looked up in one query and validated first, then updated in
+        UCM and in DB in one transaction. The records which do not exist or which UCM fails to update
+        are left as they are and out of the response.
+
+        :return: Dictionary of the updated records.
+        """
+
+        changes = dict((vn.id, vn.as_dict(api_models.VirtualNetwork))
+                       for vn in virtualnetworks.virtualnetworks)
+        if not changes:
+            return VirtualNetworksResp(**({'virtualnetworks': []}))
+
+        vns_in = []
+        for vn in self.conn.get_virtualnetworks(nw_ids=changes.keys()):
+            old_vn = VirtualNetwork.from_db_model(vn).as_dict(api_models.VirtualNetwork)
+            old_vn.update(changes[vn.id])
+            try:
+                vns_in.append(api_models.VirtualNetwork(**old_vn))
+            except Exception:
+                LOG.exception("Error while putting virtual network: %s" % old_vn)
+                error = _("Virtual Network incorrect")
+                response.translatable_error = error
+                raise wsme.exc.ClientSideError(unicode(error))
+
+        updated = []
+        for vn_in in vns_in:
+            try:
+                self._update_ucm_record(vn_in)
+            except Exception:
+                LOG.exception("Error while updating Virtual Network in UCM: %s" % vn_in.id)
+                continue
+            updated.append(vn_in)
+
+        vns_out = self.conn.update_virtualnetworks(updated)
+        return VirtualNetworksResp(**({'virtualnetworks': [VirtualNetwork.from_db_model(vn_out)
+                                                           for vn_out in vns_out]}))
+
+    def _update_ucm_record(self, vn_out):
         #UCM Configuration Start
         if cfg.CONF.api.ucm_support:
             body = vn_out.as_dict()
@@ -563,8 +653,6 @@ class VNController(BaseController):
                     response.translatable_error = error
                     raise wsme.exc.ClientSideError(unicode(error))
         #UCM Configuration End
-        
-        return VirtualNetworkResp(**({'virtualnetwork': VirtualNetwork.from_db_model(vn_out)}))
 
     @wsme_pecan.wsexpose(None, wtypes.text, status_code=204)
     def delete(self, nw_id):
@@ -576,8 +664,38 @@ class VNController(BaseController):
         if len(virtualnetworks) < 1:
             raise EntityNotFound(_('Virtual Network'), nw_id)
 
+        self._delete_ucm_record(virtualnetworks[0])
+        self.conn.delete_virtualnetwork(nw_id)
+
+    @wsme_pecan.wsexpose([wtypes.text], body=[wtypes.text])
+    def bulk_delete(self, nw_ids):
+        """
+        This function implements delete records functionality of the RESTful request, for a list of
+        virtual network ids. The records are looked up in one query, deleted from UCM and then from DB
+        in one transaction. The ids which do not exist or which UCM fails to delete are left out of
+        the response.
+
+        :return: List of the deleted ids.
+        """
+
+        if not nw_ids:
+            return []
+
+        deleted = []
+        for vn in self.conn.get_virtualnetworks(nw_ids=nw_ids):
+            try:
+                self._delete_ucm_record(vn)
+            except Exception:
+                LOG.exception("Error while deleting Virtual Network from UCM: %s" % vn.id)
+                continue
+            deleted.append(vn.id)
+        self.conn.delete_records(cns_db.VirtualNetworks, deleted)
+
+        return deleted
+
+    def _delete_ucm_record(self, vn):
         #UCM Configuration Start
-        record = {'name': {'type': constants.DATA_TYPES['string'], 'value': str(virtualnetworks[0].name)},
+        record = {'name': {'type': constants.DATA_TYPES['string'], 'value': str(vn.name)},
                   'dmpath': constants.PATH_PREFIX + '.' + self.dmpath}
         try:
             ret_val = _ucm.delete_record(record)
@@ -592,5 +710,3 @@ class VNController(BaseController):
             response.translatable_error = error
             raise wsme.exc.ClientSideError(unicode(error))
         #UCM Configuration End
-
-        self.conn.delete_virtualnetwork(nw_id)
@@ -0,0 +1,112 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Bytes on the wire and encode/decode time of 10k delta messages in each
+wire format, against the RPC layer format they are sent in without one.
+
+The deltas are port creates keyed by version, as a fanout cast or an init
+tail carries them. The bytes of a format are the length of the JSON the
+RPC layer sends. The time of a format covers the encoding and the RPC
+layer serialization on the sending side and the reverse on the receiving
+side. The msgpack formats are only measured when msgpack is installed.
+"""
+import datetime
+import json
+import time
+import unittest
+import uuid
+
+from cns.common import wire
+
+DELTA_COUNT = 10000
+
+# Most bytes an uncompressed cns1+json message may add to the RPC layer
+# format, for its wire envelope.
+MAX_ENVELOPE_BYTES = 100
+
+
+def _port_message(version):
+    return {'method': 'create_port',
+            'payload': {'id': str(uuid.uuid4()),
+                        'port_id': str(uuid.uuid4()),
+                        'network_id': str(uuid.uuid4()),
+                        'subnet_id': str(uuid.uuid4()),
+                        'device_id': str(uuid.uuid4()),
+                        'tenant_id': uuid.uuid4().hex,
+                        'user_id': uuid.uuid4().hex,
+                        'name': '', 'mac_address': 'fa:16:3e:12:34:56',
+                        'ip_address': '10.0.%s.%s' % (version / 256 % 256,
+                                                      version % 256),
+                        'device_owner': 'compute:nova',
+                        'security_groups': str(uuid.uuid4()),
+                        'admin_state_up': True, 'status': 'ACTIVE',
+                        'operation': 'create', 'version_id': version,
+                        'logged_at': datetime.datetime.now()}}
+
+
+def _rpc_dumps(message):
+    # The RPC layer sends datetime values as wire.TIME_FORMAT strings
+    return json.dumps(message, default=wire._json_default)
+
+
+class WireFormatLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.deltas = dict((version, _port_message(version))
+                           for version in range(1, DELTA_COUNT + 1))
+        # What the consumer gets from the RPC layer without a wire format
+        self.expected = json.loads(_rpc_dumps(self.deltas))
+
+    def _measure(self, codec=None, compress=False):
+        """
+        Send the deltas in a wire format, or in the RPC layer format when
+        codec is None, and return the bytes sent and the seconds spent
+        encoding and decoding them.
+        """
+        start = time.time()
+        if codec is None:
+            data = _rpc_dumps(self.deltas)
+        else:
+            data = _rpc_dumps(wire.encode(self.deltas, codec, compress))
+        deltas = wire.decode(json.loads(data))
+        elapsed = time.time() - start
+        self.assertEqual(json.loads(json.dumps(deltas)), self.expected)
+        return len(data), elapsed
+
+    def _report(self, results):
+        return ", ".join("%s: %s bytes in %.3fs" % (name, size, elapsed)
+                         for name, (size, elapsed) in results)
+
+    def test_json_formats(self):
+        current = self._measure()
+        plain = self._measure('json')
+        compressed = self._measure('json', compress=True)
+        report = self._report([('rpc json', current),
+                               ('cns1+json', plain),
+                               ('cns1+json zlib', compressed)])
+        self.assertLessEqual(plain[0], current[0] + MAX_ENVELOPE_BYTES,
+                             report)
+        self.assertLess(compressed[0], current[0] / 2, report)
+
+    @unittest.skipIf(wire.msgpack is None, "msgpack is not installed")
+    def test_msgpack_formats(self):
+        current = self._measure()
+        packed = self._measure('msgpack')
+        compressed = self._measure('msgpack', compress=True)
+        report = self._report([('rpc json', current),
+                               ('cns1+msgpack', packed),
+                               ('cns1+msgpack zlib', compressed)])
+        self.assertLess(packed[0], current[0], report)
+        self.assertLess(compressed[0], packed[0], report)
@@ -0,0 +1,108 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Order in which the apply lanes apply the deletes of parents and children
+added in version order.
+"""
+import threading
+import time
+import unittest
+
+from cns.crdconsumer import lanes
+
+# Seconds a port message takes to apply, so that its lane lags behind
+PORT_DELAY = 0.05
+# Seconds a test waits for the lanes to apply its messages
+WAIT_TIMEOUT = 10
+
+# Resource kind of the messages of each id field
+KINDS = {
+    'port_id': 'port',
+    'subnet_id': 'subnet',
+    'network_id': 'network',
+    'instance_id': 'instance',
+}
+
+
+def _resource_key(message):
+    field, resource_id = message['payload'].items()[0]
+    return KINDS[field], resource_id
+
+
+def _message(method, **payload):
+    return {'method': method, 'payload': payload}
+
+
+class ApplyLanesDeleteOrderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.applied = []
+        self.all_applied = threading.Event()
+        self.expected = 0
+
+    def _apply(self, message):
+        if message['method'].endswith('_port'):
+            time.sleep(PORT_DELAY)
+        with self.lock:
+            self.applied.append((message['method'],
+                                 _resource_key(message)[1]))
+            if len(self.applied) == self.expected:
+                self.all_applied.set()
+        return True
+
+    def _apply_all(self, specs, messages):
+        self.expected = len(messages)
+        apply_lanes = lanes.ApplyLanes(self._apply, _resource_key,
+                                       lanes.parse(specs))
+        for message in messages:
+            apply_lanes.add(message)
+        self.assertTrue(self.all_applied.wait(WAIT_TIMEOUT))
+        return apply_lanes
+
+    def _assert_before(self, first, then):
+        self.assertLess(self.applied.index(first), self.applied.index(then),
+                        self.applied)
+
+    def test_network_delete_waits_for_port_and_subnet_deletes(self):
+        self._apply_all(['port:4:0', 'subnet:1:0', 'network:1:0'], [
+            _message('delete_port', port_id='p1'),
+            _message('delete_port', port_id='p2'),
+            _message('delete_port', port_id='p3'),
+            _message('delete_subnet', subnet_id='s1'),
+            _message('delete_virtual_network', network_id='n1'),
+        ])
+        for port in ('p1', 'p2', 'p3'):
+            self._assert_before(('delete_port', port), ('delete_subnet', 's1'))
+        self._assert_before(('delete_subnet', 's1'),
+                            ('delete_virtual_network', 'n1'))
+
+    def test_instance_delete_waits_for_port_deletes_in_default_lane(self):
+        # Ports without a lane of their own are applied by the default one
+        self._apply_all(['default:2:0', 'instance:1:0'], [
+            _message('delete_port', port_id='p1'),
+            _message('delete_port', port_id='p2'),
+            _message('delete_instance', instance_id='i1'),
+        ])
+        self._assert_before(('delete_port', 'p1'), ('delete_instance', 'i1'))
+        self._assert_before(('delete_port', 'p2'), ('delete_instance', 'i1'))
+
+    def test_only_deletes_wait_for_children(self):
+        self._apply_all(['port:1:0', 'network:1:0'], [
+            _message('delete_port', port_id='p1'),
+            _message('update_virtual_network', network_id='n1'),
+        ])
+        self._assert_before(('update_virtual_network', 'n1'),
+                            ('delete_port', 'p1'))
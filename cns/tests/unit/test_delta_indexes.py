@@ -0,0 +1,143 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Query plans of the delta table reads, checked on an in-memory SQLite
+database with the delta indexes, and the size of the index keys.
+"""
+import datetime
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy import orm
+from sqlalchemy.engine import reflection
+
+from cns.crdservice.db import delta
+from cns.crdservice.db import network
+from cns.crdservice.db import nova
+from nscs.crdservice.db import model_base
+
+# InnoDB index key limit and bytes per character of MySQL utf8 columns
+MYSQL_MAX_KEY_BYTES = 767
+MYSQL_UTF8_BYTES = 3
+
+# (resource model, resource key, delta model, delta key) of the tables a
+# snapshot is built from
+SNAPSHOT_TABLES = [
+    (nova.cns_compute, 'compute_id', delta.cns_compute_delta, 'compute_id'),
+    (network.CrdNetwork, 'network_id', delta.cns_network_delta,
+     'network_id'),
+    (network.CrdSubnet, 'subnet_id', delta.cns_subnet_delta, 'subnet_id'),
+    (nova.cns_instance, 'instance_id', delta.cns_instance_delta,
+     'instance_id'),
+    (network.CrdPort, 'port_id', delta.cns_port_delta, 'port_id'),
+    (nova.cns_nwport, 'id', delta.cns_nwport_delta, 'nwport_id'),
+]
+
+
+class _Context(object):
+    """The part of a crdservice context the delta DB methods use."""
+    def __init__(self, session):
+        self.session = session
+        self.user_id = 'test'
+
+
+class DeltaIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        model_base.BASEV2.metadata.create_all(self.engine)
+        # Indexes already created with the tables are left as they are
+        delta.create_delta_indexes(self.engine)
+        self.context = _Context(orm.sessionmaker(bind=self.engine)())
+        self.deltadb = delta.CnsDeltaDb()
+        self.delta_tables = set(model.__tablename__ for resource, model, key,
+                                make_dict in self.deltadb._delta_tables())
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.statements.append((statement, parameters))
+
+    def _assert_indexed(self, *index_suffixes):
+        """
+        Every recorded SELECT reads its delta table through an index whose
+        name ends with one of index_suffixes, and none scans a delta table.
+        """
+        self.assertTrue(self.statements)
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        conn = self.engine.connect()
+        for statement, parameters in self.statements:
+            plan = [row['detail'] for row in conn.execute(
+                'EXPLAIN QUERY PLAN ' + statement, parameters)]
+            for detail in plan:
+                words = set(detail.replace('(', ' ').split())
+                if detail.startswith('SCAN') and words & self.delta_tables:
+                    self.assertIn('INDEX', detail, statement)
+            indexes = [detail.split(' (')[0] for detail in plan]
+            self.assertTrue([index for index in indexes
+                             if index.endswith(index_suffixes)],
+                            "%s: %s" % (statement, plan))
+        conn.close()
+
+    def test_index_keys_fit_mysql_utf8(self):
+        for index in delta.DELTA_INDEXES:
+            size = 0
+            for column in index.columns:
+                self.assertNotEqual(column.name, 'operation', index.name)
+                if isinstance(column.type, sa.String):
+                    size += column.type.length * MYSQL_UTF8_BYTES
+                else:
+                    size += 8
+            self.assertLessEqual(size, MYSQL_MAX_KEY_BYTES, index.name)
+
+    def test_create_delta_indexes_is_idempotent(self):
+        delta.create_delta_indexes(self.engine)
+        inspector = reflection.Inspector.from_engine(self.engine)
+        for index in delta.DELTA_INDEXES:
+            names = [i['name']
+                     for i in inspector.get_indexes(index.table.name)]
+            self.assertIn(index.name, names)
+
+    def test_tail_read_uses_version_index(self):
+        self.deltadb.get_deltas_since(self.context, 10, 20)
+        self.assertEqual(len(self.statements), 6)
+        self._assert_indexed('_version_id')
+
+    def test_retention_uses_logged_at_index(self):
+        self.deltadb.get_version_logged_before(self.context,
+                                               datetime.datetime.now())
+        # SQLite may also walk the version index down from the highest
+        # version, stopping at the first delta logged before the time.
+        self._assert_indexed('_logged_at', '_version_id')
+
+    def test_resource_lookup_uses_resource_index(self):
+        for resource, model, key, make_dict in self.deltadb._delta_tables():
+            getter = getattr(self.deltadb, 'get_%s_deltas' % resource)
+            getter(self.context, filters={key: ['1'],
+                                          'operation': ['create']})
+        self.assertEqual(len(self.statements), 6)
+        self._assert_indexed('_id_version_id')
+
+    def test_snapshot_rows_use_resource_index(self):
+        # The resource tables are read whole, their latest create versions
+        # are grouped from the delta tables in resource key order.
+        for model, model_key, delta_model, delta_key in SNAPSHOT_TABLES:
+            self.deltadb.get_snapshot_rows(self.context, model, model_key,
+                                           delta_model, delta_key)
+        self.assertEqual(len(self.statements), 6)
+        self._assert_indexed('_id_version_id')